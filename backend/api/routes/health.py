@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from core.config import config
+from core.services.schema_cache import schema_cache
+from .ingestion import document_processor_service
+from .query import query_engine_service
+
+router = APIRouter()
+
+_started_at = time.perf_counter()
+_warmup_lock = threading.Lock()
+_warmup = {"status": "not_started", "seconds": None, "error": None}
+
+def warmup_on_startup() -> bool:
+    """Whether the lifespan warms the services up; the STARTUP_WARMUP environment variable overrides config.yml."""
+    setting = os.getenv("STARTUP_WARMUP")
+    if setting is not None:
+        return setting.lower() not in ("0", "false", "no")
+    return config.get("startup", {}).get("warmup", True)
+
+def _warm_up():
+    """
+    Loads the heavy services and exercises them once, so the first real
+    query does not pay for model loading, the first encode, or schema
+    discovery.
+    """
+    start = time.perf_counter()
+    try:
+        query_engine_service.get()
+        doc_processor = document_processor_service.get()
+        if doc_processor.model is not None:
+            doc_processor.encode_queries(["warmup"])
+        connection_string = os.getenv("DATABASE_URL")
+        if connection_string:
+            schema_cache.get_schema(connection_string)
+        _warmup["status"] = "done"
+    except Exception as e:
+        print(f"Warning: Warmup failed: {e}")
+        _warmup.update(status="failed", error=str(e))
+    _warmup["seconds"] = round(time.perf_counter() - start, 3)
+
+def start_warmup():
+    """Starts the warmup in a background thread, unless it is already running or done."""
+    with _warmup_lock:
+        if _warmup["status"] in ("running", "done"):
+            return
+        _warmup.update(status="running", error=None)
+    threading.Thread(target=_warm_up, name="warmup", daemon=True).start()
+
+@router.get("/health", tags=["Health"])
+async def health():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@router.get("/ready", tags=["Health"])
+async def readiness():
+    """
+    Readiness: 200 once the document processor and query engine are
+    loaded, 503 until then. A probe that finds the services unloaded
+    starts loading them in the background, so readiness is reached even
+    when warmup on startup is disabled.
+    """
+    services = [document_processor_service, query_engine_service]
+    ready = all(service.is_ready for service in services)
+    if not ready:
+        start_warmup()
+
+    doc_processor = document_processor_service.peek()
+    body = {
+        "ready": ready,
+        "uptime_seconds": round(time.perf_counter() - _started_at, 3),
+        "services": {service.name: service.get_status() for service in services},
+        "embedding_model_loaded": bool(doc_processor and doc_processor.model),
+        "warmup": dict(_warmup),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
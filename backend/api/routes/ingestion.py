@@ -1,26 +1,40 @@
 import os
+import hashlib
+import tempfile
 from fastapi import APIRouter, Body, HTTPException, UploadFile, File, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
-from core.services.schema_discovery import SchemaDiscovery
+from typing import List, Optional
+from core.services.schema_cache import schema_cache
 from core.services.document_processor import DocumentProcessor
 from core.services.activity_logger import activity_logger
+from core.services.ingestion_jobs import IngestionPipeline
+from core.services.lazy_service import LazyService
 
 # --- Dependency Injection ---
-# Creates a single, shared instance of the DocumentProcessor for the application
-document_processor_service = DocumentProcessor()
+# A single, shared DocumentProcessor for the application. Loading the embedding
+# model is slow, so it happens on first use (or during warmup), not at import.
+document_processor_service = LazyService("document_processor", DocumentProcessor)
 def get_doc_processor():
     """Dependency injector to provide the shared DocumentProcessor instance."""
-    return document_processor_service
+    # A sync dependency, so FastAPI runs the first (slow) load in its thread pool
+    return document_processor_service.get()
+
+# Background ingestion jobs share the same DocumentProcessor
+ingestion_pipeline = LazyService("ingestion_pipeline", lambda: IngestionPipeline(document_processor_service.get()))
+def get_ingestion_pipeline():
+    """Dependency injector to provide the shared IngestionPipeline instance."""
+    return ingestion_pipeline.get()
 # --------------------------
 
 router = APIRouter()
-schema_discovery_service = SchemaDiscovery()
 
 class ConnectionPayload(BaseModel):
     # The frontend sends the connection string, but we will ignore it
     # in favor of the environment variable for Docker networking.
     connection_string: str
+    # Connecting re-inspects the database by default; set to False to reuse a cached schema.
+    force_refresh: bool = True
 
 @router.post("/connect-database", tags=["Ingestion"])
 async def connect_and_discover_schema(payload: ConnectionPayload = Body(...)):
@@ -40,8 +54,8 @@ async def connect_and_discover_schema(payload: ConnectionPayload = Body(...)):
             detail="DATABASE_URL environment variable is not set in the backend."
         )
 
-    # Call the service to analyze the database schema
-    schema_info = schema_discovery_service.analyze_database(connection_string)
+    # Discover the schema through the shared cache so the query engine can reuse it
+    schema_info = schema_cache.get_schema(connection_string, force_refresh=payload.force_refresh)
 
     if "error" in schema_info:
         raise HTTPException(status_code=500, detail=schema_info["error"])
@@ -54,26 +68,77 @@ async def connect_and_discover_schema(payload: ConnectionPayload = Body(...)):
     )
     return schema_info
 
-@router.post("/upload-documents", tags=["Ingestion"])
+def _stage_upload(file: UploadFile) -> tuple:
+    """
+    Streams an upload to a temp file in 1 MB blocks instead of reading it into
+    memory, hashing it on the way. Returns the temp path and the content hash.
+    """
+    suffix = os.path.splitext(file.filename or "")[1]
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as staged:
+        while block := file.file.read(1024 * 1024):
+            digest.update(block)
+            staged.write(block)
+        return staged.name, digest.hexdigest()
+
+@router.post("/upload-documents", tags=["Ingestion"], status_code=202)
 async def upload_documents(
     files: List[UploadFile] = File(...),
-    doc_processor: DocumentProcessor = Depends(get_doc_processor)
+    pipeline: IngestionPipeline = Depends(get_ingestion_pipeline)
 ):
-    """Handles the upload and processing of multiple document files."""
+    """
+    Accepts a batch of documents and processes them in the background.
+    Returns a job id whose progress can be polled at /upload-documents/{job_id}.
+    """
     if not files:
         raise HTTPException(status_code=400, detail="No files were uploaded.")
 
-    results = []
+    staged_files = []
     for file in files:
-        # Process each file and add its embedding to the in-memory index
-        result = doc_processor.process_and_index_document(file.file, file.filename)
-        results.append(result)
-    
-    # Log the successful upload batch
-    successful_uploads = len([r for r in results if "error" not in r])
+        path, file_hash = await run_in_threadpool(_stage_upload, file)
+        staged_files.append((path, file.filename, file_hash))
+
+    job = pipeline.submit(staged_files)
+    return {"message": f"{len(files)} files queued for processing.", **job}
+
+@router.get("/upload-documents/{job_id}", tags=["Ingestion"])
+async def get_upload_job(job_id: str, pipeline: IngestionPipeline = Depends(get_ingestion_pipeline)):
+    """Returns the progress and per-file results of an upload job."""
+    job = pipeline.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown upload job: {job_id}")
+    return job
+
+@router.delete("/documents/{filename}", tags=["Ingestion"])
+async def delete_document(filename: str, doc_processor: DocumentProcessor = Depends(get_doc_processor)):
+    """Removes a document and its chunks from the index."""
+    result = await run_in_threadpool(doc_processor.delete_document, filename)
+    if "error" in result:
+        status_code = 404 if result["error"].startswith("Unknown document") else 503
+        raise HTTPException(status_code=status_code, detail=result["error"])
+
+    activity_logger.log(type="upload", description=f"Deleted document {filename}.")
+    return result
+
+class IndexRebuildPayload(BaseModel):
+    # One of "flat", "ivfpq" or "hnsw"; defaults to vector_index.type in config.yml
+    index_type: Optional[str] = None
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+@router.post("/rebuild-index", tags=["Ingestion"])
+async def rebuild_document_index(
+    payload: IndexRebuildPayload = Body(...),
+    doc_processor: DocumentProcessor = Depends(get_doc_processor)
+):
+    """Rebuilds (and retrains) the document index from the stored embeddings."""
+    result = await run_in_threadpool(doc_processor.rebuild_index, payload.index_type)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    doc_processor.set_search_params(nprobe=payload.nprobe, ef_search=payload.ef_search)
+
     activity_logger.log(
         type="upload",
-        description=f"Processed {successful_uploads} / {len(files)} documents."
+        description=f"Rebuilt {result['index_type']} index with {result['vectors']} vectors."
     )
-    return {"message": f"{len(files)} files processed.", "results": results}
-
+    return result
@@ -1,53 +1,98 @@
 from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
 from core.services.query_engine import QueryEngine
 from core.services.document_processor import DocumentProcessor
 from core.services.activity_logger import activity_logger # Import the shared logger instance
+from core.services.metrics import metrics_registry
+from core.services.vector_index import index_type_of
 from .query import get_query_engine
-from .ingestion import get_doc_processor
+from .ingestion import document_processor_service
 
 router = APIRouter()
 
+def _trend(current: float, previous) -> dict:
+    """Compares the current window with the previous one; no change is reported without history."""
+    if not previous:
+        return {"trend": "neutral"}
+    change = (current - previous) / previous * 100
+    return {
+        "change": f"{change:+.0f}%",
+        "trend": "up" if change > 0.5 else "down" if change < -0.5 else "neutral"
+    }
+
+def _index_stats(doc_processor: DocumentProcessor) -> dict:
+    if doc_processor is None or doc_processor.index is None:
+        return {"type": None, "vectors": 0}
+    return {"type": index_type_of(doc_processor.index), "vectors": doc_processor.index.ntotal}
+
 @router.get("/metrics", tags=["Metrics"])
-async def get_system_metrics(
-    query_engine: QueryEngine = Depends(get_query_engine),
-    doc_processor: DocumentProcessor = Depends(get_doc_processor)
-):
+async def get_system_metrics(query_engine: QueryEngine = Depends(get_query_engine)):
     """
-    Provides a rich set of metrics for the frontend dashboard,
-    including summary cards and recent activity.
+    Provides a rich set of metrics for the frontend dashboard: summary cards
+    with trends against the previous window, per-stage latency percentiles,
+    throughput, cache and index statistics, and recent activity.
     """
-    # In a real production app, trend data would be calculated by
-    # comparing current values to historical data (e.g., from a time-series database).
-    # For this project, we'll use static placeholder values for trends.
+    # Metrics never load the embedding model; before it is loaded there are no documents to report
+    doc_processor = document_processor_service.peek()
+    snapshot = metrics_registry.get_snapshot()
+    query_total = snapshot["stages"]["query_total"]
+
     summary_metrics = [
         {
             "title": "Total Queries",
-            "value": str(query_engine.get_cache_size()), # Use method to get live cache size
-            "change": "+5%", # Placeholder trend data
-            "trend": "up"
+            "value": str(snapshot["queries_total"]),
+            **_trend(snapshot["qps"], snapshot["previous_qps"])
         },
         {
             "title": "Documents Processed",
-            "value": str(len(doc_processor.documents)),
-            "change": "+10%", # Placeholder trend data
-            "trend": "up"
+            "value": str(doc_processor.count_documents() if doc_processor else 0),
+            "trend": "neutral"
         },
         {
             "title": "Databases Connected",
-            "value": "1" if query_engine.schema else "0",
-            "change": "0%",
+            "value": "1" if query_engine.schema_cache.get_latest() else "0",
             "trend": "neutral"
         },
         {
-            "title": "Avg Query Time", # This would also require more detailed logging
-            "value": "0.8s",
-            "change": "-10%",
-            "trend": "down"
+            "title": "Avg Query Time",
+            "value": f"{query_total['avg']:.2f}s",
+            **_trend(query_total["avg"], query_total["previous_avg"])
         },
     ]
 
+    stages = {
+        stage: {key: round(summary[key], 4) for key in ("avg", "p50", "p95", "p99")} | {"count": summary["count"]}
+        for stage, summary in snapshot["stages"].items()
+    }
     return {
         "summary_metrics": summary_metrics,
-        "recent_activity": activity_logger.get_activities()
+        "recent_activity": activity_logger.get_activities(),
+        "performance": {
+            "window_seconds": snapshot["window_seconds"],
+            "qps": round(snapshot["qps"], 4),
+            "queries_by_status": snapshot["queries_by_status"],
+            "stages": stages,
+            "cache": query_engine.get_cache_stats(),
+            "index": _index_stats(doc_processor),
+        },
+        "llm": query_engine.get_llm_stats()
     }
 
+@router.get("/metrics/prometheus", tags=["Metrics"], response_class=PlainTextResponse)
+async def get_prometheus_metrics(query_engine: QueryEngine = Depends(get_query_engine)):
+    """Exposes the same metrics in the Prometheus text format for scraping."""
+    doc_processor = document_processor_service.peek()
+    cache_stats = query_engine.get_cache_stats()
+    llm_stats = query_engine.get_llm_stats()
+    gauges = {
+        "query_cache_hit_ratio": ("Hit ratio of the query result cache.", cache_stats["hit_ratio"]),
+        "query_cache_entries": ("Entries in the query result cache.", cache_stats["entries"]),
+        "sql_cache_hit_ratio": ("Hit ratio of the semantic SQL cache.", cache_stats["sql_cache"]["hit_ratio"]),
+        "index_vectors": ("Vectors in the document index.", _index_stats(doc_processor)["vectors"]),
+        "llm_queue_depth": ("LLM calls waiting for a slot.", llm_stats.get("queue_depth", 0)),
+        "llm_running_calls": ("LLM calls in progress.", llm_stats.get("running", 0)),
+    }
+    return PlainTextResponse(
+        metrics_registry.render_prometheus(gauges),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
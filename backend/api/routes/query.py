@@ -1,25 +1,62 @@
 import os
-from fastapi import APIRouter, Body, HTTPException, Depends
-from pydantic import BaseModel
+import json
+import time
+from typing import Annotated, Literal, Optional
+from fastapi import APIRouter, Body, HTTPException, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from core.services.query_engine import QueryEngine
 from core.services.document_processor import DocumentProcessor
 from core.services.activity_logger import activity_logger
+from core.services.lazy_service import LazyService
 from .ingestion import get_doc_processor
 
 # --- Dependency Injection ---
-# Creates a single, shared instance of the QueryEngine for the application.
-query_engine_service = QueryEngine()
+# A single, shared QueryEngine for the application, created on first use so
+# that importing the API does not set up the LLM client.
+query_engine_service = LazyService("query_engine", QueryEngine)
 
 def get_query_engine():
     """Dependency injector to provide the shared QueryEngine instance."""
-    return query_engine_service
+    return query_engine_service.get()
 # --------------------------
 
 router = APIRouter()
 
-# Update the Pydantic model to only require the 'query' field from the frontend.
+# Only the 'query' field is required from the frontend. A 'page_token' from an
+# earlier response fetches the next page of its SQL result instead, and the
+# "ndjson" format streams every row rather than returning the first page.
 class QueryPayload(BaseModel):
-    query: str
+    query: str = ""
+    page_size: Optional[int] = Field(default=None, ge=1)
+    page_token: Optional[str] = None
+    format: Literal["json", "ndjson"] = "json"
+
+class BatchQueryPayload(BaseModel):
+    queries: list[Annotated[str, Field(min_length=1)]] = Field(..., min_length=1)
+
+async def _ndjson_lines(events):
+    """Serializes streamed query events as newline-delimited JSON."""
+    async for event in events:
+        yield json.dumps(jsonable_encoder(event)) + "\n"
+
+async def _sse_messages(events):
+    """Serializes streamed query events as server-sent events named after their type."""
+    async for event in events:
+        name = event.pop("event")
+        yield f"event: {name}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+
+def _get_connection_string(user_query: str) -> str:
+    # Ignore any connection string from the payload and use the one set in the
+    # Docker environment. This allows the backend container to find the db container.
+    connection_string = os.getenv("DATABASE_URL")
+    if not user_query or not connection_string:
+        raise HTTPException(
+            status_code=400,
+            detail="Query is required and the DATABASE_URL must be set on the backend."
+        )
+    return connection_string
 
 @router.post("/query", tags=["Query"])
 async def process_user_query(
@@ -32,19 +69,23 @@ async def process_user_query(
     It uses the internal DATABASE_URL for a reliable connection within Docker.
     """
     user_query = payload.query
-    
-    # Ignore any connection string from the payload and use the one set in the
-    # Docker environment. This allows the backend container to find the db container.
-    connection_string = os.getenv("DATABASE_URL")
 
-    if not user_query or not connection_string:
-        raise HTTPException(
-            status_code=400,
-            detail="Query is required and the DATABASE_URL must be set on the backend."
-        )
+    if payload.page_token:
+        try:
+            return await query_engine.afetch_page(payload.page_token, payload.page_size)
+        except KeyError:
+            raise HTTPException(status_code=410, detail="The page token is unknown or has expired; run the query again.")
+
+    connection_string = _get_connection_string(user_query)
+
+    if payload.format == "ndjson":
+        activity_logger.log(type="query", description=f"Streamed query: '{user_query}'")
+        events = query_engine.astream_query(user_query, connection_string, doc_processor)
+        return StreamingResponse(_ndjson_lines(events), media_type="application/x-ndjson")
 
-    # Process the query using the correct internal connection string
-    result = query_engine.process_query(user_query, connection_string, doc_processor)
+    # Process the query using the correct internal connection string. The async
+    # pipeline awaits LLM and database calls instead of blocking the event loop.
+    result = await query_engine.aprocess_query(user_query, connection_string, doc_processor, payload.page_size)
 
     if "error" in result:
         # Log the failed query attempt
@@ -62,3 +103,65 @@ async def process_user_query(
     )
 
     return result
+
+@router.get("/query/stream", tags=["Query"])
+async def stream_user_query(
+    query: str = Query(...),
+    query_engine: QueryEngine = Depends(get_query_engine),
+    doc_processor: DocumentProcessor = Depends(get_doc_processor)
+):
+    """
+    Streams a query's progress as server-sent events (usable with the
+    browser's EventSource): the classification, the SQL as it is generated,
+    the rows, the retrieved snippets, the extracted answers as they are
+    generated, and finally the performance metrics.
+    """
+    connection_string = _get_connection_string(query)
+    activity_logger.log(type="query", description=f"Streamed query: '{query}'")
+    events = query_engine.astream_query(query, connection_string, doc_processor)
+    return StreamingResponse(
+        _sse_messages(events),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream or caching it
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/query/batch", tags=["Query"])
+async def process_query_batch(
+    payload: BatchQueryPayload = Body(...),
+    query_engine: QueryEngine = Depends(get_query_engine),
+    doc_processor: DocumentProcessor = Depends(get_doc_processor)
+):
+    """
+    Processes a list of natural language queries in one request, sharing
+    classification, embedding and document search across them. Results are
+    returned in the order of the queries; a failed query gets an "error"
+    entry instead of failing the batch.
+    """
+    if len(payload.queries) > query_engine.batch_max_queries:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may contain at most {query_engine.batch_max_queries} queries."
+        )
+    connection_string = os.getenv("DATABASE_URL")
+    if not connection_string:
+        raise HTTPException(status_code=400, detail="The DATABASE_URL must be set on the backend.")
+
+    start_time = time.time()
+    results = await query_engine.aprocess_batch(payload.queries, connection_string, doc_processor)
+    errors = sum(1 for result in results if "error" in result)
+
+    activity_logger.log(
+        type="query",
+        description=f"Executed a batch of {len(results)} queries ({errors} failed)",
+        status="error" if errors else "success"
+    )
+    return {
+        "results": results,
+        "performance_metrics": {
+            "response_time_seconds": round(time.time() - start_time, 2),
+            "queries": len(results),
+            "errors": errors,
+            "cache_hits": sum(1 for result in results if result.get("performance_metrics", {}).get("cache_status") == "hit"),
+        }
+    }
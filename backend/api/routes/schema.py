@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException
-from backend.services.schema_discovery import get_cached_schema
+from core.services.schema_cache import schema_cache
 
 router = APIRouter()
 
-@router.get("/")
+@router.get("/schema", tags=["Schema"])
 async def get_current_schema():
-    schema = get_cached_schema()
+    """Returns the most recently discovered schema without re-inspecting the database."""
+    schema = schema_cache.get_latest()
     if not schema:
         raise HTTPException(status_code=404, detail="No schema has been discovered yet.")
     return schema
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+Recall-vs-latency benchmark of the document index types against the exact
+flat baseline, on synthetic clustered embeddings.
+
+Run from the backend directory:
+    python -m benchmarks.ann_benchmark --vectors 200000 --queries 500
+"""
+import json
+import time
+import argparse
+import numpy as np
+from core.services.vector_index import build_trained_index, get_index_settings, normalize, set_search_params
+
+def make_corpus(count: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Gaussian clusters roughly mimic the topical structure of real sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, dim))
+    assignments = rng.integers(0, clusters, size=count)
+    return normalize(centroids[assignments] + 0.35 * rng.normal(size=(count, dim)))
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray) -> float:
+    k = expected.shape[1]
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, expected))
+    return hits / (len(expected) * k)
+
+def time_search(index, queries: np.ndarray, k: int) -> tuple:
+    """Searches one query at a time, as the API does, and returns (results, per-query latencies in ms)."""
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, indices = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(indices[0])
+    return np.array(results), np.array(latencies)
+
+def run(args) -> dict:
+    settings = get_index_settings()
+    corpus = make_corpus(args.vectors, args.dim, args.clusters)
+    queries = make_corpus(args.queries, args.dim, args.clusters, seed=1)
+
+    report = {"vectors": args.vectors, "queries": args.queries, "dim": args.dim, "k": args.k, "results": []}
+    ground_truth = None
+    for index_type in ["flat"] + [t for t in args.types if t != "flat"]:
+        build_start = time.perf_counter()
+        index = build_trained_index(args.dim, corpus, index_type=index_type, settings={**settings, "pq_m": args.pq_m})
+        build_seconds = time.perf_counter() - build_start
+
+        sweep = {"ivfpq": [("nprobe", v) for v in args.nprobe], "hnsw": [("ef_search", v) for v in args.ef_search]}
+        for param, value in sweep.get(index_type, [(None, None)]):
+            if param:
+                set_search_params(index, **{param: value})
+            found, latencies = time_search(index, queries, args.k)
+            if ground_truth is None:
+                ground_truth = found
+            report["results"].append({
+                "index_type": index_type,
+                "param": param,
+                "value": value,
+                "build_seconds": round(build_seconds, 3),
+                "recall_at_k": round(recall_at_k(found, ground_truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+                "qps": round(len(queries) / (latencies.sum() / 1000), 1),
+            })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--types", nargs="+", default=["flat", "ivfpq", "hnsw"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
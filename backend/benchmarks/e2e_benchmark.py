@@ -0,0 +1,397 @@
+"""
+End-to-end benchmark and load test of the schema discovery, ingestion and
+query paths, for catching performance regressions between commits.
+
+Everything runs offline: the database is a synthetic SQLite file with the
+shape of init.sql, the documents are synthetic resumes, the LLM is the
+stub provider and the embedding model is loaded from the local cache only.
+A workload of questions is replayed `--rounds` times with `--concurrency`
+queries in flight; the first round runs cold (empty caches), the later
+ones warm. The JSON report has latency percentiles per phase and per
+pipeline stage, throughput, index build and search time and peak RSS.
+
+Run from the backend directory:
+    python -m benchmarks.e2e_benchmark --employees 100000 --documents 200 --concurrency 8
+
+Replay your own questions (a JSON Lines file with a "query" field per line)
+and compare against the report of an earlier commit:
+    python -m benchmarks.e2e_benchmark --workload queries.jsonl --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+FIRST_NAMES = ["John", "Jane", "Peter", "Alice", "Michael", "Emily", "David", "Sarah", "Raj", "Mei", "Carlos", "Fatima", "Olga", "Kwame", "Yuki", "Priya"]
+LAST_NAMES = ["Smith", "Doe", "Jones", "Williams", "Brown", "Davis", "Miller", "Garcia", "Patel", "Chen", "Kim", "Okafor", "Novak", "Silva", "Tanaka", "Singh"]
+DEPARTMENTS = {
+    "Engineering": ["Senior Python Developer", "Software Engineer", "Data Scientist", "DevOps Engineer"],
+    "Sales": ["Sales Manager", "Sales Associate", "Account Executive"],
+    "Human Resources": ["HR Manager", "Recruiter"],
+    "Marketing": ["Marketing Lead", "Content Strategist", "SEO Specialist"],
+    "Finance": ["Financial Analyst", "Accountant"],
+    "Support": ["Support Engineer", "Customer Success Manager"],
+}
+OFFICES = ["New York", "San Francisco", "Chicago", "Austin", "London", "Berlin", "Bangalore", "Singapore"]
+SKILLS = ["Python", "SQL", "Java", "React", "Kubernetes", "AWS", "Machine Learning", "Excel", "Negotiation", "Go", "Docker", "Tableau"]
+
+# Questions in the style of the README examples: SQL, document and hybrid
+DEFAULT_WORKLOAD = [
+    "How many employees do we have?",
+    "Average salary by department",
+    "Number of employees per department",
+    "What is the highest annual salary?",
+    "List employees in the New York office",
+    "Top 5 highest paid engineers",
+    "Who has Python experience?",
+    "What is the GitHub ID of John Smith?",
+    "Which candidates know Kubernetes and AWS?",
+    "Summarize the experience of Priya Patel",
+    "Show Python developers in Engineering",
+    "Employees with machine learning skills and their salaries",
+]
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def make_database(path: Path, employees: int, departments: int, seed: int = 0):
+    """Creates a SQLite database with the tables of init.sql and `employees` random employees."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE departments (
+            dept_id INTEGER PRIMARY KEY,
+            dept_name VARCHAR(255) NOT NULL,
+            manager_id INTEGER
+        );
+        CREATE TABLE employees (
+            emp_id INTEGER PRIMARY KEY,
+            full_name VARCHAR(255) NOT NULL,
+            position VARCHAR(255),
+            annual_salary NUMERIC(10, 2),
+            join_date DATE,
+            office_location VARCHAR(255),
+            dept_id INTEGER,
+            CONSTRAINT fk_department FOREIGN KEY(dept_id) REFERENCES departments(dept_id)
+        );
+    """)
+    # Beyond the base department names, numbered divisions are added ("Sales 2")
+    base_names = list(DEPARTMENTS)
+    department_rows = []
+    for dept_id in range(1, departments + 1):
+        base = base_names[(dept_id - 1) % len(base_names)]
+        suffix = (dept_id - 1) // len(base_names)
+        department_rows.append((dept_id, f"{base} {suffix + 1}" if suffix else base, None))
+    conn.executemany("INSERT INTO departments VALUES (?, ?, ?)", department_rows)
+
+    batch = []
+    for emp_id in range(1, employees + 1):
+        dept_id = rng.randint(1, departments)
+        position = rng.choice(DEPARTMENTS[base_names[(dept_id - 1) % len(base_names)]])
+        joined = f"{rng.randint(2012, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        batch.append((emp_id, _name(rng), position, round(rng.uniform(45000, 220000), 2), joined, rng.choice(OFFICES), dept_id))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+
+    # As in init.sql, each department is managed by one of its employees
+    conn.execute("""
+        UPDATE departments SET manager_id = (
+            SELECT MIN(emp_id) FROM employees WHERE employees.dept_id = departments.dept_id
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+def make_documents(count: int, paragraphs: int, seed: int = 0) -> list:
+    """Returns `count` synthetic resumes as (filename, bytes) pairs."""
+    rng = random.Random(seed)
+    documents = []
+    for number in range(1, count + 1):
+        name = _name(rng)
+        handle = name.lower().replace(" ", "") + str(number)
+        skills = rng.sample(SKILLS, 4)
+        lines = [
+            name,
+            f"Email: {handle}@example.com | GitHub: github.com/{handle}",
+            f"Skills: {', '.join(skills)}",
+            "",
+            "Experience",
+        ]
+        for _ in range(paragraphs):
+            position = rng.choice(rng.choice(list(DEPARTMENTS.values())))
+            lines.append(
+                f"Worked as a {position} in {rng.choice(OFFICES)} for {rng.randint(1, 8)} years, using "
+                f"{rng.choice(skills)} and {rng.choice(SKILLS)} to deliver projects for {rng.randint(2, 40)} clients. "
+                f"Led a team of {rng.randint(2, 15)} and improved {rng.choice(['latency', 'revenue', 'retention', 'coverage'])} "
+                f"by {rng.randint(5, 60)} percent."
+            )
+        documents.append((f"resume_{number:05d}.txt", "\n".join(lines).encode()))
+    return documents
+
+def load_workload(path: str = None) -> list:
+    """Reads the questions to replay from a JSON Lines file (other fields are ignored), or returns the default workload."""
+    if not path:
+        return list(DEFAULT_WORKLOAD)
+    queries = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                queries.append(json.loads(line)["query"])
+    if not queries:
+        raise ValueError(f"No queries found in {path}.")
+    return queries
+
+def summarize(seconds: list) -> dict:
+    """Latency percentiles of a list of durations, in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ms = np.array(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where it cannot be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _git_commit():
+    completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True)
+    return completed.stdout.strip() or None
+
+def _has_error(result: dict) -> bool:
+    if "error" in result:
+        return True
+    return any(isinstance(item.get("data"), dict) and "error" in item["data"] for item in result.get("results", []))
+
+def bench_schema(connection_string: str, runs: int) -> dict:
+    from core.services.schema_discovery import SchemaDiscovery
+    discovery = SchemaDiscovery()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        schema = discovery.analyze_database(connection_string)
+        latencies.append(time.perf_counter() - start)
+    if "error" in schema:
+        raise RuntimeError(schema["error"])
+    return {"tables": len(schema["tables"]), "analyze_database": summarize(latencies)}
+
+def bench_ingestion(documents: list, queries: list, search_runs: int, k: int):
+    """Indexes the documents one upload at a time, then times an index rebuild and single-query searches."""
+    import io
+    from core.services.document_processor import DocumentProcessor
+
+    start = time.perf_counter()
+    doc_processor = DocumentProcessor()
+    model_load_seconds = time.perf_counter() - start
+    if doc_processor.model is None:
+        raise RuntimeError("The embedding model is not available; it must be in the local model cache.")
+
+    latencies, chunks = [], 0
+    ingestion_start = time.perf_counter()
+    for filename, data in documents:
+        start = time.perf_counter()
+        result = doc_processor.process_and_index_document(io.BytesIO(data), filename)
+        latencies.append(time.perf_counter() - start)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        chunks += result.get("chunks_added", 0)
+    ingestion_seconds = time.perf_counter() - ingestion_start
+
+    start = time.perf_counter()
+    rebuilt = doc_processor.rebuild_index()
+    build_seconds = time.perf_counter() - start
+
+    embeddings = doc_processor.encode_queries(queries)
+    search_latencies = []
+    for _ in range(search_runs):
+        for embedding in embeddings:
+            start = time.perf_counter()
+            doc_processor.search(embedding.reshape(1, -1), k=k)
+            search_latencies.append(time.perf_counter() - start)
+
+    report = {
+        "model_load_seconds": round(model_load_seconds, 3),
+        "documents": len(documents),
+        "chunks": chunks,
+        "process_and_index_document": summarize(latencies),
+        "documents_per_second": round(len(documents) / ingestion_seconds, 2) if ingestion_seconds else None,
+        "chunks_per_second": round(chunks / ingestion_seconds, 2) if ingestion_seconds else None,
+        "index": {
+            "type": rebuilt.get("index_type"),
+            "vectors": rebuilt.get("vectors"),
+            "build_seconds": round(build_seconds, 3),
+            "search": summarize(search_latencies),
+        },
+    }
+    return doc_processor, report
+
+async def _replay(query_engine, queries: list, connection_string: str, doc_processor, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, errors = [], {}, 0
+
+    async def run_one(user_query: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            result = await query_engine.aprocess_query(user_query, connection_string, doc_processor)
+            latencies.append(time.perf_counter() - start)
+        status = result.get("performance_metrics", {}).get("cache_status", "miss")
+        statuses[status] = statuses.get(status, 0) + 1
+        errors += _has_error(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_one(user_query) for user_query in queries))
+    wall_seconds = time.perf_counter() - start
+    return {
+        "queries": len(queries),
+        "errors": errors,
+        "cache_status": statuses,
+        "throughput_qps": round(len(queries) / wall_seconds, 2) if wall_seconds else None,
+        "latency": summarize(latencies),
+    }
+
+async def _replay_rounds(query_engine, queries: list, connection_string: str, doc_processor, args) -> list:
+    from core.services.engine_registry import engine_registry
+    try:
+        return [await _replay(query_engine, queries, connection_string, doc_processor, args.concurrency) for _ in range(args.rounds)]
+    finally:
+        # Async connections belong to this event loop, so they are closed before it ends
+        await engine_registry.adispose_all()
+
+def bench_queries(queries: list, connection_string: str, doc_processor, args) -> dict:
+    from core.services.metrics import metrics_registry
+    from core.services.query_engine import QueryEngine
+    from core.services.llm_providers import StubLLMProvider
+
+    query_engine = QueryEngine(llm=StubLLMProvider(args.llm_latency, args.llm_jitter, args.seed))
+    metrics_registry.reset()
+    rounds = asyncio.run(_replay_rounds(query_engine, queries, connection_string, doc_processor, args))
+
+    stages = {}
+    for stage, summary in metrics_registry.get_snapshot()["stages"].items():
+        if summary["count"]:
+            stages[stage] = {
+                "count": summary["count"],
+                **{f"p{q}_ms": round(summary[f"p{q}"] * 1000, 3) for q in (50, 95, 99)},
+            }
+    return {"cold": rounds[0], "warm": rounds[1:], "stages": stages}
+
+def _flatten(report, prefix: str = "") -> dict:
+    values = {}
+    if isinstance(report, dict):
+        for key, value in report.items():
+            values.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(report, list):
+        for position, value in enumerate(report):
+            values.update(_flatten(value, f"{prefix}{position}."))
+    elif isinstance(report, (int, float)) and not isinstance(report, bool):
+        values[prefix.rstrip(".")] = report
+    return values
+
+def compare(baseline: dict, report: dict) -> dict:
+    """The relative change of every metric present in both reports (settings excluded)."""
+    before = _flatten({key: value for key, value in baseline.items() if key != "settings"})
+    after = _flatten({key: value for key, value in report.items() if key != "settings"})
+    changes = {}
+    for metric in sorted(before.keys() & after.keys()):
+        change = (after[metric] - before[metric]) / before[metric] * 100 if before[metric] else None
+        changes[metric] = {"baseline": before[metric], "current": after[metric], "change_pct": round(change, 1) if change is not None else None}
+    return changes
+
+def run(args) -> dict:
+    # No network: the embedding model must come from the local cache
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    queries = load_workload(args.workload)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the benchmark's index, chunk store and caches out of the real data directory,
+        # and keep every stage sample of the run for the percentiles
+        from core.config import config
+        config["data_paths"] = {
+            "faiss_index": str(Path(workdir) / "vector.index"),
+            "metadata_db": str(Path(workdir) / "text_db.sqlite"),
+            "schema_cache": str(Path(workdir) / "schema.json"),
+            "query_cache": str(Path(workdir) / "query_cache.sqlite"),
+        }
+        config["metrics"] = {**config.get("metrics", {}), "window_seconds": 86400, "max_samples_per_stage": 1_000_000}
+
+        database = Path(workdir) / "employees.db"
+        start = time.perf_counter()
+        make_database(database, args.employees, args.departments, args.seed)
+        documents = make_documents(args.documents, args.paragraphs, args.seed)
+        setup_seconds = time.perf_counter() - start
+        connection_string = f"sqlite:///{database}"
+
+        report = {
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "setup_seconds": round(setup_seconds, 3),
+        }
+        report["schema"] = bench_schema(connection_string, args.schema_runs)
+        report["schema"]["peak_rss_mb"] = peak_rss_mb()
+        doc_processor, report["ingestion"] = bench_ingestion(documents, queries, args.search_runs, args.k)
+        report["ingestion"]["peak_rss_mb"] = peak_rss_mb()
+        report["queries"] = bench_queries(queries * args.repeat, connection_string, doc_processor, args)
+        report["queries"]["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=10000)
+    parser.add_argument("--departments", type=int, default=12)
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--paragraphs", type=int, default=8, help="Experience paragraphs per synthetic resume")
+    parser.add_argument("--workload", help="JSON Lines file of questions to replay, one {\"query\": ...} per line")
+    parser.add_argument("--repeat", type=int, default=5, help="Copies of the workload per round")
+    parser.add_argument("--rounds", type=int, default=2, help="Replays of the workload (at least 1); the first runs with cold caches")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub LLM latency per call, in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--schema-runs", type=int, default=10)
+    parser.add_argument("--search-runs", type=int, default=20)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="An earlier JSON report to compare against")
+    args = parser.parse_args()
+    if args.rounds < 1:
+        parser.error("--rounds must be at least 1")
+
+    result = run(args)
+    if args.compare:
+        with open(args.compare) as f:
+            result["comparison"] = compare(json.load(f), result)
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
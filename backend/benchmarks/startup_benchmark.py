@@ -0,0 +1,143 @@
+"""
+Startup benchmark: how long a fresh API process takes to import, to report
+readiness, and to answer its first query, with and without background
+warmup. Each mode runs in its own interpreter so nothing is already
+imported or loaded. The LLM is the offline stub and the database a small
+temporary SQLite file, so the numbers reflect the service's own startup
+cost rather than network latency.
+
+Run from the backend directory:
+    python -m benchmarks.startup_benchmark --runs 3
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+def _child(args):
+    """Measures one cold start inside a fresh interpreter and prints the timings as JSON."""
+    start = time.perf_counter()
+    # Keep the benchmark's index, chunk store and schema cache out of the real data directory
+    from core.config import config
+    config["data_paths"] = {
+        "faiss_index": str(Path(args.workdir) / "vector.index"),
+        "metadata_db": str(Path(args.workdir) / "text_db.sqlite"),
+        "schema_cache": str(Path(args.workdir) / "schema.json"),
+    }
+    import main
+    import_seconds = time.perf_counter() - start
+
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:
+        lifespan_seconds = time.perf_counter() - start
+
+        # Poll readiness the way an orchestrator would
+        ready_seconds = None
+        while time.perf_counter() - start < args.ready_timeout:
+            if client.get("/api/ready").status_code == 200:
+                ready_seconds = time.perf_counter() - start
+                break
+            time.sleep(0.05)
+
+        query_start = time.perf_counter()
+        response = client.post("/api/query", json={"query": "How many employees are there?"})
+        first_query_seconds = time.perf_counter() - query_start
+
+        print(json.dumps({
+            "import_seconds": round(import_seconds, 3),
+            "lifespan_seconds": round(lifespan_seconds, 3),
+            "ready_seconds": round(ready_seconds, 3) if ready_seconds is not None else None,
+            "first_query_seconds": round(first_query_seconds, 3),
+            "time_to_first_query_seconds": round(time.perf_counter() - start, 3),
+            "first_query_status": response.status_code,
+            "services": client.get("/api/ready").json()["services"],
+        }))
+
+def _make_database(path: Path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE employees (emp_id INTEGER PRIMARY KEY, full_name TEXT, annual_salary NUMERIC(10, 2))")
+    conn.executemany("INSERT INTO employees VALUES (?, ?, ?)", [(i, f"Employee {i}", 50000 + i) for i in range(1, 101)])
+    conn.commit()
+    conn.close()
+
+def _slowest_imports(count: int) -> list:
+    """Returns the packages with the largest cumulative import time when importing the app."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env={**os.environ, "LLM_PROVIDER": "stub"}
+    )
+    packages = {}
+    for line in completed.stderr.splitlines():
+        # Lines look like: "import time:  self [us] | cumulative | imported package"
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        # Report root packages (fastapi, sqlalchemy, faiss, ...) wherever they were first imported
+        module = parts[2].strip()
+        if "." not in module and module not in ("main", "site"):
+            packages[module] = max(packages.get(module, 0), int(parts[1]))
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+    return [{"package": module, "cumulative_ms": round(micros / 1000, 1)} for module, micros in slowest]
+
+def run(args) -> dict:
+    report = {"runs": args.runs, "modes": {}}
+    for warmup in (True, False):
+        samples = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as workdir:
+                database = Path(workdir) / "employees.db"
+                _make_database(database)
+                env = {
+                    **os.environ,
+                    "LLM_PROVIDER": "stub",
+                    "DATABASE_URL": f"sqlite:///{database}",
+                    "STARTUP_WARMUP": "1" if warmup else "0",
+                }
+                completed = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.startup_benchmark", "--child", "--workdir", workdir,
+                     "--ready-timeout", str(args.ready_timeout)],
+                    cwd=BACKEND_DIR, capture_output=True, text=True, env=env
+                )
+                if completed.returncode != 0:
+                    raise RuntimeError(f"Benchmark process failed:\n{completed.stderr}")
+                samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        summary = {}
+        for key in ("import_seconds", "lifespan_seconds", "ready_seconds", "first_query_seconds", "time_to_first_query_seconds"):
+            values = sorted(sample[key] for sample in samples if sample[key] is not None)
+            summary[key] = {"min": values[0], "median": values[len(values) // 2], "max": values[-1]} if values else None
+        report["modes"]["warmup" if warmup else "lazy"] = {"summary": summary, "samples": samples}
+
+    report["slowest_imports"] = _slowest_imports(args.top_imports)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--ready-timeout", type=float, default=120)
+    parser.add_argument("--top-imports", type=int, default=10)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
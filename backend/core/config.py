@@ -1,10 +1,26 @@
 import yaml
 from pathlib import Path
+from dotenv import load_dotenv
+
+# config.yml lives next to the backend package; the data paths inside it are
+# written relative to the project root (e.g. "./backend/data/...").
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+PROJECT_ROOT = BACKEND_DIR.parent
 
 def load_config():
-    # Adjust path to be relative to the project root where the script runs
-    config_path = Path("backend/config.yml")
+    # Resolve relative to this file so the config loads no matter where uvicorn is started from
+    config_path = BACKEND_DIR / "config.yml"
     with open(config_path, "r") as f:
         return yaml.safe_load(f)
 
-config = load_config()
\ No newline at end of file
+def resolve_path(path_str: str) -> Path:
+    """Resolves a path from config.yml against the project root."""
+    path = Path(path_str)
+    if path.is_absolute():
+        return path
+    return (PROJECT_ROOT / path).resolve()
+
+# Load environment variables (GOOGLE_API_KEY, DATABASE_URL, LLM_PROVIDER) from a .env file if it exists
+load_dotenv()
+
+config = load_config()
@@ -1,92 +1,324 @@
-import docx
-import pypdf
-import faiss
+import time
+import asyncio
+import hashlib
 import numpy as np
-from typing import List, IO
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO
+from ..config import config
+from .text_chunker import TextChunker
+from .text_extraction import extract_text
+from .vector_index import index_type_of, normalize, remove_ids, set_search_params
+from .vector_store import VectorStore
+from .metrics import metrics_registry
+from .rw_lock import ReadWriteLock
+
+# A bounded pool for CPU-bound embedding and search work, so that encoding
+# never runs on the event loop and concurrent requests cannot oversubscribe the CPU.
+embedding_executor = ThreadPoolExecutor(
+    max_workers=config.get("embedding", {}).get("max_workers", 2),
+    thread_name_prefix="embedding"
+)
+
+def content_hash(data) -> str:
+    """Returns the SHA-256 hex digest used to recognise unchanged documents and chunks."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
 
 class DocumentProcessor:
     """
     Processes uploaded documents by extracting text, generating embeddings,
-    and storing them in an in-memory FAISS index.
+    and storing them in a FAISS index backed by a durable chunk store.
+
+    Searches hold a read lock on the index and updates a write lock, so
+    concurrent searches never see a half-applied update and a search never
+    returns a chunk its update removed. Reloading the index after another
+    worker process changed the store builds the new index first and only
+    swaps it in under the write lock; searches in flight finish on the old one.
     """
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", vector_store: VectorStore = None):
         """
         Initializes the document processor, loads the embedding model,
         and sets up the FAISS index and document store.
         """
         try:
+            self.model_name = model_name
+            self.vector_store = vector_store if vector_store is not None else VectorStore()
+            # Imported here rather than at module level: torch takes seconds to import,
+            # and modules such as the query engine import this one only for its types
+            from sentence_transformers import SentenceTransformer
             self.model = SentenceTransformer(model_name)
             embedding_dim = self.model.get_sentence_embedding_dimension()
+            self.batch_size = config.get("embedding", {}).get("batch_size", 32)
+            # Token-aware chunking with the model's own tokenizer when it exposes one
+            self.chunker = TextChunker(tokenizer=getattr(self.model, "tokenizer", None))
             
-            # Initialize an in-memory FAISS index for vector search
-            self.index = faiss.IndexFlatL2(embedding_dim)
+            # Load the persisted FAISS index (memory-mapped) and replay anything after the last checkpoint
+            self.index = self.vector_store.load_index(embedding_dim)
             
-            # --- THIS IS THE FIX ---
-            # Initialize a list to store the text chunks and metadata
-            self.documents = []
-            # --------------------
+            # The chunk store doubles as the mapping of text chunks and their metadata,
+            # keyed by FAISS id
+            self.documents = self.vector_store
 
-            print("DocumentProcessor initialized successfully with FAISS index.")
+            self._index_lock = ReadWriteLock()
+            # How often searches check whether another worker process has changed the store
+            self.sync_interval_seconds = config.get("vector_store", {}).get("sync_interval_seconds", 1.0)
+            self._last_sync = time.monotonic()
+            # The store generation the in-memory index reflects
+            self._generation = self.vector_store.get_generation()
+            # Changes on every index change so dependent caches can invalidate themselves.
+            # It follows the store generation, so every worker agrees on it.
+            self.index_version = self._generation
+
+            print(f"DocumentProcessor initialized successfully with FAISS index ({self.index.ntotal} vectors).")
         except Exception as e:
             print(f"Error initializing DocumentProcessor: {e}")
+            self.model_name = model_name
             self.model = None
             self.index = None
+            self.vector_store = None
             self.documents = []
+            self._index_lock = ReadWriteLock()
+            self.index_version = 0
+            self.batch_size = config.get("embedding", {}).get("batch_size", 32)
+            self.chunker = TextChunker()
 
-    def _extract_text_from_pdf(self, file: IO) -> str:
-        pdf_reader = pypdf.PdfReader(file)
-        return "".join(page.extract_text() or "" for page in pdf_reader.pages)
+    def retrieve(self, user_query: str, k: int = 1, score_threshold: float = None, max_per_file: int = 1) -> list:
+        """
+        Embeds a query and returns up to k matching document chunks, best
+        first, each as a dictionary with the stored document and its cosine
+        similarity score.
 
-    def _extract_text_from_docx(self, file: IO) -> str:
-        doc = docx.Document(file)
-        return "\n".join(para.text for para in doc.paragraphs)
+        Args:
+            score_threshold: Chunks scoring below this are dropped.
+            max_per_file: At most this many chunks are returned per file, so one
+                long document cannot crowd out the others.
+        """
+        if not self.model or self.index is None or self.index.ntotal == 0:
+            return []
+        return self.search(self.encode_queries([user_query]), k, score_threshold, max_per_file)[0]
+
+    def _advance_generation(self, generation: int):
+        """
+        Records the store generation after one of our own changes. If other
+        workers changed the store in between, the index stays marked as
+        behind, so the next sync reloads it with their changes.
+        """
+        if generation == self._generation + 1:
+            self._generation = generation
+        self.index_version = generation
+
+    def sync_with_store(self, force: bool = False):
+        """
+        Reloads the index when another worker process has changed the chunk
+        store. Checks at most every `vector_store.sync_interval_seconds`
+        unless forced.
+        """
+        if self.vector_store is None or self.index is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval_seconds:
+            return
+        self._last_sync = now
+        # Read before reloading, so a change committed during the reload triggers another one
+        generation = self.vector_store.get_generation()
+        if generation == self._generation:
+            return
+        index = self.vector_store.refresh_index(self.index.d)
+        with self._index_lock.write():
+            self.index = index
+            self._generation = generation
+            self.index_version = max(self.index_version, generation)
 
-    def _extract_text_from_txt(self, file: IO) -> str:
-        return file.read().decode('utf-8')
+    def encode_queries(self, user_queries: list) -> np.ndarray:
+        """Embeds any number of queries in one batched model call and normalizes them for cosine search."""
+        with metrics_registry.timer("embedding"):
+            return normalize(self.model.encode(user_queries, batch_size=self.batch_size))
+
+    def search(self, query_embeddings: np.ndarray, k: int = 1, score_threshold: float = None, max_per_file: int = 1) -> list:
+        """
+        Searches the index for several normalized query embeddings in a
+        single FAISS call and returns one list of hits per query, filtered
+        as described in `retrieve`.
+        """
+        self.sync_with_store()
+        with self._index_lock.read():
+            return self._search(query_embeddings, k, score_threshold, max_per_file)
+
+    def _search(self, query_embeddings: np.ndarray, k: int, score_threshold: float, max_per_file: int) -> list:
+        if self.index is None or self.index.ntotal == 0 or len(query_embeddings) == 0:
+            return [[] for _ in range(len(query_embeddings))]
+
+        # Over-fetch so that there are still k hits left after de-duplication
+        with metrics_registry.timer("faiss_search"):
+            scores, indices = self.index.search(query_embeddings, k=min(k * 4, self.index.ntotal))
+
+        results = []
+        for query_scores, query_indices in zip(scores, indices):
+            hits = []
+            per_file = {}
+            for score, doc_index in zip(query_scores, query_indices):
+                if doc_index == -1 or (score_threshold is not None and score < score_threshold):
+                    continue
+                try:
+                    document = self.documents[doc_index]
+                except KeyError:
+                    # Deleted by another worker whose change this index does not reflect yet
+                    continue
+                if per_file.get(document["filename"], 0) >= max_per_file:
+                    continue
+                per_file[document["filename"]] = per_file.get(document["filename"], 0) + 1
+                hits.append({"document": document, "score": float(score)})
+                if len(hits) == k:
+                    break
+            results.append(hits)
+        return results
+
+    async def aretrieve(self, user_query: str, k: int = 1, score_threshold: float = None, max_per_file: int = 1) -> list:
+        """Runs `retrieve` on the bounded embedding executor instead of the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            embedding_executor, self.retrieve, user_query, k, score_threshold, max_per_file
+        )
+
+    def rebuild_index(self, index_type: str = None) -> dict:
+        """
+        Rebuilds the index from the stored embeddings, training it first for
+        quantized index types. Used to switch index types or to retrain an
+        IVF-PQ index after the corpus has grown.
+        """
+        if not self.model or self.index is None:
+            return {"error": "Embedding model or FAISS index is not available."}
+        generation = self.vector_store.get_generation()
+        try:
+            # Built aside and swapped in, so searches continue on the old index meanwhile
+            index = self.vector_store.rebuild_index(self.model.get_sentence_embedding_dimension(), index_type)
+        except ValueError as e:
+            return {"error": str(e)}
+        with self._index_lock.write():
+            self.index = index
+            self._generation = generation
+            self._advance_generation(self.vector_store.publish_change())
+        return {"index_type": index_type_of(index), "vectors": index.ntotal}
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """Tunes nprobe (IVF) or efSearch (HNSW) at runtime to trade recall for latency."""
+        if self.index is not None:
+            with self._index_lock.write():
+                set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
+    def checkpoint(self):
+        """Flushes the index to disk. Called from the FastAPI shutdown path."""
+        if self.index is not None:
+            # Writing the index only reads it, so searches may continue
+            with self._index_lock.read():
+                self.vector_store.checkpoint(self.index)
+
+    def chunk_document(self, extracted: dict) -> list:
+        """Splits extracted text into overlapping, token-bounded chunks that fit the model's input window."""
+        return self.chunker.chunk(extracted["text"], extracted.get("page_offsets"))
+
+    def is_unchanged(self, filename: str, file_hash: str) -> bool:
+        """Returns True if the stored version of a document has exactly this content hash."""
+        return self.vector_store is not None and self.vector_store.get_document_hash(filename) == file_hash
+
+    def encode_chunks(self, chunks: list) -> np.ndarray:
+        """
+        Returns normalized embeddings for chunks, encoding in batches of
+        `embedding.batch_size`. Chunks whose content was embedded before by
+        the same model are served from the embedding cache instead.
+        Sets `chunk_hash` on every chunk as a side effect.
+        """
+        for chunk in chunks:
+            chunk["chunk_hash"] = content_hash(chunk["content"])
+        cached = self.vector_store.get_cached_embeddings([chunk["chunk_hash"] for chunk in chunks], self.model_name)
+
+        to_encode = [chunk for chunk in chunks if chunk["chunk_hash"] not in cached]
+        if to_encode:
+            encoded = self.model.encode([chunk["content"] for chunk in to_encode], batch_size=self.batch_size)
+            # Normalized vectors make inner-product search equivalent to cosine similarity
+            for chunk, embedding in zip(to_encode, normalize(encoded)):
+                cached[chunk["chunk_hash"]] = embedding
+
+        dim = self.model.get_sentence_embedding_dimension()
+        return np.array([cached[chunk["chunk_hash"]] for chunk in chunks], dtype=np.float32).reshape(len(chunks), dim)
+
+    def add_document_chunks(self, filename: str, chunks: list, embeddings: np.ndarray, file_hash: str = None) -> dict:
+        """
+        Stores a new version of a document and updates the index with the
+        difference: only chunks that did not exist before are added, and
+        chunks that disappeared are removed. All index mutations go through
+        here, so callers that process files concurrently must funnel their
+        writes through a single writer.
+        """
+        for chunk in chunks:
+            chunk.setdefault("chunk_hash", content_hash(chunk["content"]))
+        file_hash = file_hash or content_hash("".join(chunk["chunk_hash"] for chunk in chunks))
+
+        # Searches wait while the chunk store and the index are out of step
+        with self._index_lock.write():
+            # Commit the new version to the chunk store first, so a crash before the
+            # next index checkpoint is reconciled on startup
+            change = self.vector_store.replace_document(filename, file_hash, chunks, embeddings, self.model_name)
+
+            if not remove_ids(self.index, change["removed_ids"]):
+                # HNSW cannot delete vectors; rebuild it from the (already updated) chunk store
+                self.index = self.vector_store.rebuild_index(self.index.d, index_type_of(self.index))
+            elif len(change["added_ids"]):
+                self.index.add_with_ids(normalize(change["added_vectors"]), change["added_ids"])
+            self.vector_store.maybe_checkpoint(self.index)
+            self._advance_generation(change["generation"])
+
+        return {
+            "filename": filename,
+            "status": "updated" if change["removed_ids"] or change["kept"] else "processed and indexed",
+            "chunks_added": len(change["added_ids"]),
+            "chunks_removed": len(change["removed_ids"]),
+            "chunks_unchanged": change["kept"],
+        }
+
+    def count_documents(self) -> int:
+        """Returns the number of indexed files; `documents` holds one entry per chunk."""
+        if self.vector_store is None:
+            return 0
+        return self.vector_store.count_documents()
+
+    def delete_document(self, filename: str) -> dict:
+        """Removes a document's chunks from the chunk store and the index."""
+        if not self.model or self.index is None:
+            return {"error": "Embedding model or FAISS index is not available."}
+        with self._index_lock.write():
+            deleted = self.vector_store.delete_document(filename)
+            if deleted is None:
+                return {"error": f"Unknown document: {filename}"}
+            removed_ids, generation = deleted
+
+            if not remove_ids(self.index, removed_ids):
+                self.index = self.vector_store.rebuild_index(self.index.d, index_type_of(self.index))
+            self.vector_store.maybe_checkpoint(self.index)
+            self._advance_generation(generation)
+        return {"filename": filename, "status": "deleted", "chunks_removed": len(removed_ids)}
 
     def process_and_index_document(self, file: IO, filename: str) -> dict:
         """
         Processes a single document, generates embeddings, and adds them to the index.
+        Re-uploading a document with identical content is a no-op.
         """
-        if not self.model or not self.index is not None:
+        if not self.model or self.index is None:
             return {"error": "Embedding model or FAISS index is not available."}
         
-        text = ""
         try:
-            if filename.endswith(".pdf"):
-                text = self._extract_text_from_pdf(file)
-            elif filename.endswith(".docx"):
-                text = self._extract_text_from_docx(file)
-            elif filename.endswith(".txt"):
-                text = self._extract_text_from_txt(file)
-            else:
-                return {"error": f"Unsupported file type: {filename}"}
-
-            if not text.strip():
-                return {"error": f"No text could be extracted from {filename}."}
-            
-            # TODO: Implement dynamic chunking here. For now, we treat the whole doc as one chunk.
-            chunks = [text]
-            
-            # Generate embeddings for the chunks
-            embeddings = self.model.encode(chunks)
-            
-            # Add the new embeddings to the FAISS index
-            self.index.add(np.array(embeddings, dtype=np.float32))
+            file_hash = content_hash(file.read())
+            file.seek(0)
+            if self.is_unchanged(filename, file_hash):
+                return {"filename": filename, "status": "unchanged", "chunks_added": 0}
+
+            extracted = extract_text(file, filename)
+            if "error" in extracted:
+                return extracted
             
-            # Store the corresponding text chunks and their metadata
-            for chunk in chunks:
-                self.documents.append({
-                    "filename": filename,
-                    "content": chunk
-                })
-
-            return {
-                "filename": filename,
-                "status": "processed and indexed",
-                "chunks_added": len(chunks)
-            }
+            chunks = self.chunk_document(extracted)
+            embeddings = self.encode_chunks(chunks)
+            return self.add_document_chunks(filename, chunks, embeddings, file_hash)
         except Exception as e:
             return {"error": f"Failed to process document {filename}: {str(e)}"}
-
@@ -0,0 +1,123 @@
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import NoSuchModuleError
+from sqlalchemy.ext.asyncio import create_async_engine
+from ..config import config
+
+# Async drivers used for the non-blocking query path, keyed by backend name.
+# psycopg (v3) and aiosqlite both ship in requirements.txt.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+class EngineRegistry:
+    """
+    A process-wide registry of SQLAlchemy engines, one per connection string.
+    Engines (and their connection pools) are created once and shared by
+    SchemaDiscovery and QueryEngine instead of being rebuilt on every request.
+    """
+    def __init__(self, pool_settings: dict = None):
+        """Reads the pool settings from the `database` section of config.yml."""
+        database_config = config.get("database", {})
+        settings = pool_settings if pool_settings is not None else database_config
+        self.pool_size = settings.get("pool_size", 5)
+        self.max_overflow = settings.get("max_overflow", 10)
+        self.pool_timeout = settings.get("pool_timeout_seconds", 30)
+        self.pool_recycle = settings.get("pool_recycle_seconds", 1800)
+        self.pool_pre_ping = settings.get("pool_pre_ping", True)
+
+        self._engines = {}
+        self._async_engines = {}
+        self._lock = threading.Lock()
+
+    def _engine_options(self, connection_string: str) -> dict:
+        options = {
+            "pool_pre_ping": self.pool_pre_ping,
+            "pool_recycle": self.pool_recycle,
+        }
+        # SQLite uses file-level locking and in-memory databases use a
+        # single-connection pool, so the sizing options only apply to servers.
+        if make_url(connection_string).get_backend_name() != "sqlite":
+            options.update({
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "pool_timeout": self.pool_timeout,
+            })
+        return options
+
+    def get_engine(self, connection_string: str) -> Engine:
+        """Returns the shared engine for a connection string, creating it on first use."""
+        engine = self._engines.get(connection_string)
+        if engine is not None:
+            return engine
+
+        with self._lock:
+            # Another thread may have created the engine while we waited for the lock
+            engine = self._engines.get(connection_string)
+            if engine is None:
+                engine = create_engine(connection_string, **self._engine_options(connection_string))
+                self._engines[connection_string] = engine
+            return engine
+
+    def get_async_engine(self, connection_string: str):
+        """
+        Returns a shared AsyncEngine for a connection string, or None when the
+        database has no supported async driver (callers then fall back to
+        running the sync engine in a worker thread).
+        """
+        if connection_string in self._async_engines:
+            return self._async_engines[connection_string]
+
+        with self._lock:
+            if connection_string in self._async_engines:
+                return self._async_engines[connection_string]
+
+            url = make_url(connection_string)
+            async_driver = ASYNC_DRIVERS.get(url.get_backend_name())
+            engine = None
+            if async_driver:
+                try:
+                    engine = create_async_engine(
+                        url.set(drivername=async_driver),
+                        **self._engine_options(connection_string)
+                    )
+                except (ImportError, NoSuchModuleError) as e:
+                    print(f"Warning: Async driver {async_driver} is unavailable, using the sync engine instead: {e}")
+            self._async_engines[connection_string] = engine
+            return engine
+
+    def get_pool_status(self) -> list:
+        """Returns a short, credential-free description of each pool for diagnostics."""
+        return [
+            {"database": engine.url.render_as_string(hide_password=True), "pool": engine.pool.status()}
+            for engine in list(self._engines.values())
+        ]
+
+    def dispose_all(self):
+        """Closes every pooled sync connection."""
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+    async def adispose_all(self):
+        """Closes every pooled sync and async connection. Called from the FastAPI shutdown path."""
+        with self._lock:
+            async_engines = [engine for engine in self._async_engines.values() if engine is not None]
+            self._async_engines.clear()
+        for engine in async_engines:
+            await engine.dispose()
+        self.dispose_all()
+
+# Create a single, shared registry for the whole process.
+engine_registry = EngineRegistry()
+
+def get_engine(connection_string: str) -> Engine:
+    """Convenience wrapper around the shared registry."""
+    return engine_registry.get_engine(connection_string)
+
+def get_async_engine(connection_string: str):
+    """Convenience wrapper around the shared registry."""
+    return engine_registry.get_async_engine(connection_string)
@@ -0,0 +1,228 @@
+import os
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from ..config import config
+from .activity_logger import activity_logger
+from .document_processor import embedding_executor
+from .text_extraction import extract_text_from_path
+
+def _remove_staged(path: str):
+    """Deletes a staged upload, if it is still there."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class IngestionPipeline:
+    """
+    Runs document uploads as background jobs. Text extraction is spread
+    across a process pool, chunks from several files are embedded together
+    in cross-file batches, and every index update goes through a single
+    writer thread. Files whose content hash matches the stored version are
+    skipped before extraction. Each job's progress can be polled by its id.
+    """
+    def __init__(self, doc_processor, extraction_workers: int = None, embed_batch_chunks: int = None, max_tracked_jobs: int = None):
+        ingestion_config = config.get("ingestion", {})
+        self.doc_processor = doc_processor
+        self.extraction_workers = extraction_workers or ingestion_config.get("extraction_workers", 2)
+        self.embed_batch_chunks = embed_batch_chunks or ingestion_config.get("embed_batch_chunks", 256)
+        self.max_tracked_jobs = max_tracked_jobs or ingestion_config.get("max_tracked_jobs", 100)
+
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._executor = None
+        self._write_queue = queue.Queue()
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Starts the process pool and the writer thread on the first job."""
+        with self._start_lock:
+            if self._executor is None:
+                # Spawn (not fork) so workers never inherit torch/faiss thread state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.extraction_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="index-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """The single writer: applies index updates one at a time, in arrival order."""
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                return
+            filename, file_hash, chunks, embeddings, future = item
+            try:
+                future.set_result(self.doc_processor.add_document_chunks(filename, chunks, embeddings, file_hash))
+            except Exception as e:
+                future.set_result({"error": f"Failed to index document {filename}: {str(e)}"})
+
+    def _update_job(self, job_id: str, **changes):
+        with self._jobs_lock:
+            self._jobs[job_id].update(changes)
+
+    def _record_result(self, job_id: str, result: dict):
+        with self._jobs_lock:
+            job = self._jobs[job_id]
+            job["results"].append(result)
+            job["processed_files"] += 1
+            if "error" in result:
+                job["failed_files"] += 1
+            else:
+                job["chunks_added"] += result.get("chunks_added", 0)
+
+    def submit(self, staged_files: list) -> dict:
+        """
+        Queues a job for files that have already been written to disk.
+
+        Args:
+            staged_files: A list of (path, filename, content_hash) tuples. The files
+                are deleted once extracted.
+
+        Returns:
+            A snapshot of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "total_files": len(staged_files),
+            "processed_files": 0,
+            "failed_files": 0,
+            "chunks_added": 0,
+            "results": [],
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        with self._jobs_lock:
+            self._jobs[job_id] = job
+            self._evict_finished_jobs()
+
+        self._ensure_started()
+        threading.Thread(target=self._run_job, args=(job_id, staged_files), name=f"ingest-{job_id[:8]}", daemon=True).start()
+        return self.get_job(job_id)
+
+    def _evict_finished_jobs(self):
+        """Forgets the oldest finished jobs once more than `max_tracked_jobs` are tracked."""
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        while len(self._jobs) > self.max_tracked_jobs and finished:
+            del self._jobs[finished.pop(0)]
+
+    def _run_job(self, job_id: str, staged_files: list):
+        self._update_job(job_id, status="running")
+        try:
+            if not self.doc_processor.model or self.doc_processor.index is None:
+                for _ in staged_files:
+                    self._record_result(job_id, {"error": "Embedding model or FAISS index is not available."})
+                return
+
+            futures = {}
+            for path, filename, file_hash in staged_files:
+                try:
+                    unchanged = self.doc_processor.is_unchanged(filename, file_hash)
+                except Exception as e:
+                    _remove_staged(path)
+                    self._record_result(job_id, {"error": f"Failed to process document {filename}: {str(e)}"})
+                    continue
+                if unchanged:
+                    _remove_staged(path)
+                    self._record_result(job_id, {"filename": filename, "status": "unchanged", "chunks_added": 0})
+                    continue
+                futures[self._executor.submit(extract_text_from_path, path, filename)] = (path, filename, file_hash)
+            batch = []
+            batch_chunks = 0
+            for future in as_completed(futures):
+                path, filename, file_hash = futures[future]
+                try:
+                    extracted = future.result()
+                    if "error" not in extracted:
+                        chunks = self.doc_processor.chunk_document(extracted)
+                except Exception as e:
+                    extracted = {"error": f"Failed to process document {filename}: {str(e)}"}
+                finally:
+                    _remove_staged(path)
+
+                if "error" in extracted:
+                    self._record_result(job_id, extracted)
+                    continue
+
+                batch.append((filename, file_hash, chunks))
+                batch_chunks += len(chunks)
+                if batch_chunks >= self.embed_batch_chunks:
+                    self._embed_and_write(job_id, batch)
+                    batch, batch_chunks = [], 0
+
+            if batch:
+                self._embed_and_write(job_id, batch)
+        except Exception as e:
+            print(f"Error running ingestion job {job_id}: {e}")
+        finally:
+            # Staged files are deleted once extracted; remove any the job never got to
+            for path, _, _ in staged_files:
+                _remove_staged(path)
+            self._finish_job(job_id)
+
+    def _embed_and_write(self, job_id: str, batch: list):
+        """
+        Encodes the chunks of several files in one call, then hands each file
+        to the writer. Encoding runs on the bounded embedding executor shared
+        with queries, so ingestion cannot oversubscribe the CPU.
+        """
+        all_chunks = [chunk for _, _, chunks in batch for chunk in chunks]
+        try:
+            embeddings = embedding_executor.submit(self.doc_processor.encode_chunks, all_chunks).result()
+        except Exception as e:
+            for filename, _, _ in batch:
+                self._record_result(job_id, {"error": f"Failed to embed document {filename}: {str(e)}"})
+            return
+
+        offset = 0
+        writes = []
+        for filename, file_hash, chunks in batch:
+            future = Future()
+            self._write_queue.put((filename, file_hash, chunks, embeddings[offset:offset + len(chunks)], future))
+            writes.append(future)
+            offset += len(chunks)
+        for (filename, _, _), future in zip(batch, writes):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": f"Failed to index document {filename}: {str(e)}"}
+            self._record_result(job_id, result)
+
+    def _finish_job(self, job_id: str):
+        with self._jobs_lock:
+            job = self._jobs[job_id]
+            # Counted per file: files the job never got to (after an unexpected error) are not successful
+            successful = job["processed_files"] - job["failed_files"]
+            job["status"] = "completed" if successful else "failed"
+            job["finished_at"] = time.time()
+        activity_logger.log(
+            type="upload",
+            description=f"Processed {successful} / {job['total_files']} documents.",
+            status="success" if successful else "error"
+        )
+
+    def get_job(self, job_id: str):
+        """Returns a snapshot of a job's progress, or None if the id is unknown."""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {**job, "results": list(job["results"])}
+
+    def shutdown(self):
+        """Stops the writer thread and the extraction processes."""
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join(timeout=5)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
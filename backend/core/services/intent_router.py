@@ -0,0 +1,183 @@
+import re
+import threading
+import numpy as np
+from ..config import config
+from .schema_linker import name_tokens
+from .vector_index import normalize
+
+QUERY_TYPES = ("SQL", "DOCUMENT", "HYBRID")
+
+DEFAULT_SQL_KEYWORDS = (
+    "salary", "employee", "department", "hired", "count", "average", "list",
+    "how many", "number of", "total", "sum", "highest", "lowest", "maximum", "minimum",
+    "headcount", "payroll", "manager", "position", "office", "joined",
+)
+DEFAULT_DOCUMENT_KEYWORDS = (
+    "skills", "experience", "resume", "review", "contract", "performance", "contact",
+    "email", "link", "github", "linkedin", "cv", "certification", "portfolio", "education",
+)
+# Labeled examples for the embedding-centroid classifier; config.yml can replace them
+DEFAULT_INTENT_EXAMPLES = {
+    "SQL": [
+        "How many employees are there?",
+        "What is the average salary by department?",
+        "List employees hired after 2020",
+        "Who earns the highest salary?",
+        "Show the headcount of each office",
+    ],
+    "DOCUMENT": [
+        "What is John's email address?",
+        "Which candidates know Python according to their resumes?",
+        "Summarize the performance review",
+        "What does the contract say about notice periods?",
+        "Find the GitHub link in the CV",
+    ],
+    "HYBRID": [
+        "Which engineers with machine learning experience earn over 100000?",
+        "Show salaries of employees whose reviews mention leadership",
+        "List employees in Sales and their certifications",
+    ],
+}
+# Identifier words too generic to count as evidence that a question is about the database
+_GENERIC_SCHEMA_TOKENS = {"id", "name", "type", "date", "code", "status", "created", "updated", "at"}
+# Softmax temperature for turning centroid similarities into a confidence
+_CENTROID_TEMPERATURE = 0.05
+
+def _keyword_pattern(keywords) -> str:
+    """One alternation for a keyword list, longest first, with plural forms and flexible spacing."""
+    alternatives = []
+    for keyword in sorted({keyword.lower() for keyword in keywords}, key=len, reverse=True):
+        words = keyword.split()
+        last = words[-1]
+        if last.endswith("y") and len(last) > 2:
+            plural = f"{re.escape(last[:-1])}(?:y|ies)"
+        else:
+            plural = f"{re.escape(last)}(?:s|es)?"
+        alternatives.append(r"\s+".join([re.escape(word) for word in words[:-1]] + [plural]))
+    return r"\b(?:" + "|".join(alternatives) + r")\b"
+
+class IntentRouter:
+    """
+    Routes a question to the SQL branch, the document branch, or both.
+
+    A single precompiled regex scans the question once for SQL and document
+    keywords (whole words only, so "list" no longer matches "specialist");
+    words from the discovered schema's table and column names count as
+    weaker SQL evidence. When that lexical evidence is weak and an
+    embedding model is available, the question is compared against the
+    centroids of labeled example questions instead. Every decision carries
+    a confidence in [0, 1] and the method that produced it.
+    """
+    def __init__(self, sql_keywords=None, document_keywords=None, examples: dict = None,
+                 use_embeddings: bool = None, min_confidence: float = None):
+        router_config = config.get("intent_router", {})
+        sql_keywords = sql_keywords or router_config.get("sql_keywords") or DEFAULT_SQL_KEYWORDS
+        document_keywords = document_keywords or router_config.get("document_keywords") or DEFAULT_DOCUMENT_KEYWORDS
+        self.examples = examples or router_config.get("examples") or DEFAULT_INTENT_EXAMPLES
+        self.use_embeddings = use_embeddings if use_embeddings is not None else router_config.get("use_embeddings", True)
+        # Below this lexical confidence the centroid classifier is consulted
+        self.min_confidence = min_confidence if min_confidence is not None else router_config.get("min_confidence", 0.6)
+
+        self._pattern = re.compile(
+            f"(?P<sql>{_keyword_pattern(sql_keywords)})|(?P<document>{_keyword_pattern(document_keywords)})"
+        )
+        self._schema_tokens = {}
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def _schema_vocabulary(self, schema: dict, schema_version) -> frozenset:
+        """The stemmed words of every table and column name, computed once per schema version."""
+        cached = self._schema_tokens.get(schema_version) if schema_version is not None else None
+        if cached is not None:
+            return cached
+        tokens = set()
+        for table in (schema or {}).get("tables", []):
+            tokens |= name_tokens(table["name"])
+            for column in table.get("columns", []):
+                tokens |= name_tokens(column["name"])
+        vocabulary = frozenset(tokens - _GENERIC_SCHEMA_TOKENS)
+        if schema_version is not None:
+            with self._lock:
+                self._schema_tokens = {schema_version: vocabulary}
+        return vocabulary
+
+    def _lexical(self, user_query: str, schema: dict = None, schema_version=None) -> dict:
+        sql_hits, document_hits = 0.0, 0.0
+        matched = set()
+        for match in self._pattern.finditer(user_query.lower()):
+            if match.group("sql"):
+                sql_hits += 1
+            else:
+                document_hits += 1
+            matched |= name_tokens(match.group(0))
+
+        # Schema words the keyword lists do not already cover
+        sql_hits += 0.5 * len((name_tokens(user_query) - matched) & self._schema_vocabulary(schema, schema_version))
+
+        if sql_hits and not document_hits:
+            query_type, confidence = "SQL", 1 - 0.5 ** (sql_hits + 1)
+        elif document_hits and not sql_hits:
+            query_type, confidence = "DOCUMENT", 1 - 0.5 ** (document_hits + 1)
+        elif sql_hits and document_hits:
+            # Both kinds of evidence: the more balanced, the more clearly HYBRID
+            query_type, confidence = "HYBRID", min(sql_hits, document_hits) / max(sql_hits, document_hits)
+        else:
+            query_type, confidence = "HYBRID", 0.0
+        return {
+            "query_type": query_type,
+            "confidence": round(confidence, 3),
+            "method": "lexical" if confidence else "default",
+            "scores": {"sql": sql_hits, "document": document_hits},
+        }
+
+    def _intent_centroids(self, encode) -> dict:
+        """Encodes the labeled examples once and averages them into one unit vector per intent."""
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    centroids = {}
+                    for query_type, questions in self.examples.items():
+                        if query_type in QUERY_TYPES and questions:
+                            centroids[query_type] = normalize(normalize(encode(list(questions))).mean(axis=0, keepdims=True))[0]
+                    self._centroids = centroids
+        return self._centroids
+
+    def needs_embedding(self, routing: dict) -> bool:
+        """Whether a lexical decision is weak enough that the centroid classifier should be consulted."""
+        return self.use_embeddings and routing["method"] in ("lexical", "default") and routing["confidence"] < self.min_confidence
+
+    def route(self, user_query: str, schema: dict = None, schema_version=None, encode=None, query_embedding=None) -> dict:
+        """
+        Returns the routing decision for a question: its `query_type`, a
+        `confidence` in [0, 1], the `method` that decided ("lexical",
+        "embedding", or "default" when there was no evidence at all) and
+        the lexical `scores`. `encode` (or a precomputed normalized
+        `query_embedding`) enables the centroid classifier.
+        """
+        routing = self._lexical(user_query, schema, schema_version)
+        if not self.needs_embedding(routing) or (encode is None and query_embedding is None):
+            return routing
+
+        try:
+            centroids = self._intent_centroids(encode) if encode is not None else self._centroids
+            if not centroids:
+                return routing
+            if query_embedding is None:
+                query_embedding = normalize(encode([user_query]))[0]
+        except Exception as e:
+            print(f"Warning: Embedding-based intent routing failed: {e}")
+            return routing
+
+        labels = list(centroids)
+        similarities = np.array([float(np.dot(centroids[label], query_embedding)) for label in labels])
+        weights = np.exp((similarities - similarities.max()) / _CENTROID_TEMPERATURE)
+        probabilities = weights / weights.sum()
+        best = int(np.argmax(probabilities))
+        if probabilities[best] <= routing["confidence"]:
+            return routing
+        return {
+            **routing,
+            "query_type": labels[best],
+            "confidence": round(float(probabilities[best]), 3),
+            "method": "embedding",
+        }
@@ -0,0 +1,52 @@
+import time
+import threading
+
+class LazyService:
+    """
+    Holds a heavy, shared service (the embedding model, the LLM client)
+    that is created on first use rather than at import time, so the API
+    can start accepting connections immediately. Creation happens once,
+    under a lock, however many threads ask for the service concurrently.
+    """
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.status = "not_loaded"
+        self.load_seconds = None
+        self.error = None
+
+    def get(self):
+        """Returns the service, creating it on the first call."""
+        instance = self._instance
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            # Another thread may have created the service while we waited for the lock
+            if self._instance is None:
+                self.status = "loading"
+                start = time.perf_counter()
+                try:
+                    self._instance = self._factory()
+                except Exception as e:
+                    # Reported by the readiness endpoint; the next call tries again
+                    self.status = "failed"
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.status = "ready"
+                self.error = None
+            return self._instance
+
+    def peek(self):
+        """Returns the service if it has been created, without creating it."""
+        return self._instance
+
+    @property
+    def is_ready(self) -> bool:
+        return self._instance is not None
+
+    def get_status(self) -> dict:
+        return {"status": self.status, "load_seconds": self.load_seconds, "error": self.error}
@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from ..config import config
+from .schema_linker import name_tokens
+
+class RateLimitError(Exception):
+    """Raised by providers when the LLM API rejects a call with HTTP 429 / quota exhaustion."""
+
+class LLMProvider:
+    """
+    The interface QueryEngine uses to talk to a language model: one prompt
+    in, the model's text reply out. Implementations raise on failure, and
+    raise RateLimitError when the call was throttled and may be retried.
+    """
+    name = "base"
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def agenerate(self, prompt: str) -> str:
+        """Async counterpart of `generate`; defaults to running it in a worker thread."""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    async def astream(self, prompt: str):
+        """
+        Yields the reply in pieces as the model produces them. Providers
+        without token streaming yield the whole reply at once.
+        """
+        yield await self.agenerate(prompt)
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through `google.generativeai`, imported and configured only when selected."""
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash"):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def _is_rate_limited(e: Exception) -> bool:
+        # google.api_core raises ResourceExhausted (HTTP 429) for quota and rate limits
+        return getattr(e, "code", None) == 429 or type(e).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+    def generate(self, prompt: str) -> str:
+        try:
+            return self._model.generate_content(prompt).text
+        except Exception as e:
+            if self._is_rate_limited(e):
+                raise RateLimitError(str(e)) from e
+            raise
+
+    async def agenerate(self, prompt: str) -> str:
+        try:
+            response = await self._model.generate_content_async(prompt)
+        except Exception as e:
+            if self._is_rate_limited(e):
+                raise RateLimitError(str(e)) from e
+            raise
+        return response.text
+
+    async def astream(self, prompt: str):
+        try:
+            response = await self._model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                yield chunk.text
+        except Exception as e:
+            if self._is_rate_limited(e):
+                raise RateLimitError(str(e)) from e
+            raise
+
+# Patterns for reading the prompts built by QueryEngine
+_DDL_LINE_PATTERN = re.compile(r"^\s*(\w+)\((.*)\)\s*$", re.MULTILINE)
+_QUESTION_PATTERN = re.compile(r'\*\*User\'s Question:\*\*\s*"(.*?)"\s*\n', re.DOTALL)
+_SNIPPET_PATTERN = re.compile(r"\[(\d+)\] \(from [^)\n]*\)\n(.*?)\n---", re.DOTALL)
+_NOT_FOUND_PATTERN = re.compile(r'ONLY the phrase: "(.*?)"')
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+|\n")
+_STREAM_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+_NUMERIC_TYPES = ("INT", "NUMERIC", "DECIMAL", "REAL", "FLOAT", "DOUBLE", "MONEY")
+_STOPWORDS = {
+    "the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was", "what",
+    "which", "who", "how", "many", "much", "me", "show", "list", "all", "with", "by", "their", "his", "her",
+}
+
+def _words(text: str) -> set:
+    return name_tokens(text) - _STOPWORDS
+
+class StubLLMProvider(LLMProvider):
+    """
+    A deterministic, offline stand-in for load testing and CI. It answers
+    the SQL prompt with template SQL over the tables in the prompt's schema
+    (COUNT, AVG/SUM/MAX/MIN of a mentioned numeric column, or a sample of
+    rows), and the extraction prompt with the snippet sentence that shares
+    the most words with the question. Latency is injected per call, with
+    optional jitter from a seeded generator so runs are reproducible.
+    """
+    name = "stub"
+
+    def __init__(self, latency_seconds: float = 0.0, jitter_seconds: float = 0.0, seed: int = 0):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _next_latency(self) -> float:
+        with self._lock:
+            self.calls += 1
+            jitter = self._random.uniform(-self.jitter_seconds, self.jitter_seconds) if self.jitter_seconds else 0.0
+        return max(0.0, self.latency_seconds + jitter)
+
+    def generate(self, prompt: str) -> str:
+        time.sleep(self._next_latency())
+        return self._respond(prompt)
+
+    async def agenerate(self, prompt: str) -> str:
+        await asyncio.sleep(self._next_latency())
+        return self._respond(prompt)
+
+    async def astream(self, prompt: str):
+        """Streams the reply word by word: half the latency before the first word, the rest spread over the others."""
+        latency = self._next_latency()
+        tokens = _STREAM_TOKEN_PATTERN.findall(self._respond(prompt))
+        await asyncio.sleep(latency / 2)
+        for position, token in enumerate(tokens):
+            if position:
+                await asyncio.sleep(latency / 2 / max(1, len(tokens) - 1))
+            yield token
+
+    def _respond(self, prompt: str) -> str:
+        question_match = _QUESTION_PATTERN.search(prompt)
+        question = question_match.group(1) if question_match else ""
+        if "**Document Snippets:**" in prompt:
+            return self._extract(prompt, question)
+        return self._sql(prompt, question)
+
+    @staticmethod
+    def _sql(prompt: str, question: str) -> str:
+        schema_section = prompt.split("**Database Schema:**", 1)[-1].split("**User's Question:**", 1)[0]
+        tables = []
+        for table_name, column_list in _DDL_LINE_PATTERN.findall(schema_section):
+            columns = [definition.split()[:2] for definition in column_list.split(", ") if definition.strip()]
+            tables.append((table_name, [(parts[0], parts[1] if len(parts) > 1 else "") for parts in columns]))
+        if not tables:
+            return "SELECT 'Sorry, I cannot answer this question with the available data.'"
+
+        question_words = _words(question)
+        # The table whose name, or failing that whose columns, the question mentions the most
+        table_name, columns = max(
+            tables,
+            key=lambda table: (len(_words(table[0]) & question_words),
+                               sum(bool(_words(name) & question_words) for name, _ in table[1]))
+        )
+        numeric_columns = [name for name, column_type in columns if column_type.upper().startswith(_NUMERIC_TYPES)]
+        mentioned = [name for name in numeric_columns if _words(name) & question_words]
+
+        lowered = question.lower()
+        aggregates = (("average", "AVG"), ("avg", "AVG"), ("mean", "AVG"), ("total", "SUM"), ("sum", "SUM"),
+                      ("highest", "MAX"), ("maximum", "MAX"), ("lowest", "MIN"), ("minimum", "MIN"))
+        for keyword, function in aggregates:
+            if keyword in lowered and mentioned:
+                return f"SELECT {function}({mentioned[0]}) AS {function.lower()}_{mentioned[0]} FROM {table_name};"
+        if any(keyword in lowered for keyword in ("how many", "count", "number of", "headcount")):
+            return f"SELECT COUNT(*) AS count FROM {table_name};"
+        return f"SELECT * FROM {table_name} LIMIT 10;"
+
+    @staticmethod
+    def _extract(prompt: str, question: str) -> str:
+        not_found_match = _NOT_FOUND_PATTERN.search(prompt)
+        not_found = not_found_match.group(1) if not_found_match else ""
+        question_words = _words(question)
+
+        answers = []
+        for number, snippet in _SNIPPET_PATTERN.findall(prompt):
+            best, best_overlap = not_found, 0
+            for sentence in _SENTENCE_BOUNDARY_PATTERN.split(snippet):
+                overlap = len(_words(sentence) & question_words)
+                if overlap > best_overlap:
+                    best, best_overlap = sentence.strip(), overlap
+            answers.append({"snippet": int(number), "answer": best})
+        return json.dumps(answers)
+
+def get_llm_settings() -> dict:
+    """Returns the `llm` section of config.yml with defaults filled in; LLM_PROVIDER overrides the provider."""
+    settings = {
+        "provider": "gemini",
+        "model_name": "gemini-2.5-flash",
+        "stub_latency_ms": 0,
+        "stub_jitter_ms": 0,
+        "stub_seed": 0,
+    }
+    settings.update(config.get("llm", {}) or {})
+    settings["provider"] = os.getenv("LLM_PROVIDER", settings["provider"])
+    return settings
+
+def create_llm_provider(settings: dict = None):
+    """
+    Creates the configured provider: "gemini" (needs GOOGLE_API_KEY),
+    "stub" (offline and deterministic), or "none". Returns None when no
+    LLM is available, which disables SQL generation and answer extraction.
+    """
+    settings = settings or get_llm_settings()
+    provider = settings["provider"]
+
+    if provider == "stub":
+        return StubLLMProvider(
+            latency_seconds=settings["stub_latency_ms"] / 1000,
+            jitter_seconds=settings["stub_jitter_ms"] / 1000,
+            seed=settings["stub_seed"]
+        )
+    if provider == "gemini":
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            print("Warning: GOOGLE_API_KEY is not set. LLM features will be disabled.")
+            return None
+        try:
+            return GeminiProvider(api_key, settings["model_name"])
+        except Exception as e:
+            print(f"Warning: Could not configure Gemini API. LLM features will be disabled. Error: {e}")
+            return None
+    if provider != "none":
+        print(f"Warning: Unknown LLM provider '{provider}'. LLM features will be disabled.")
+    return None
@@ -0,0 +1,324 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from ..config import config
+from .llm_providers import LLMProvider, RateLimitError
+
+class LLMQueueFullError(Exception):
+    """Raised when more LLM calls are waiting for a slot than the queue allows."""
+
+class _Slots:
+    """
+    A concurrency limit shared by threads and by any number of event loops,
+    unlike threading and asyncio semaphores, which serve only one side (the
+    latter only one loop). Freed slots go to waiters in arrival order: a
+    thread is woken directly, a coroutine through its own loop.
+    """
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._used = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, waiter):
+        """Takes a free slot (returning None), or queues the waiter and returns it."""
+        with self._lock:
+            if self._used < self._limit and not self._waiters:
+                self._used += 1
+                return None
+            self._waiters.append(waiter)
+            return waiter
+
+    def acquire(self):
+        event = self._try_acquire(threading.Event())
+        if event is None:
+            return
+        try:
+            event.wait()
+        except BaseException:
+            self._withdraw(event)
+            raise
+
+    async def aacquire(self):
+        waiter = self._try_acquire(asyncio.get_running_loop().create_future())
+        if waiter is None:
+            return
+        try:
+            await waiter
+        except BaseException:
+            # A cancelled waiter that was already handed a slot is released by _grant
+            if not self._withdraw(waiter) and not waiter.cancelled():
+                self.release()
+            raise
+
+    def _withdraw(self, waiter) -> bool:
+        """Removes a waiter that gave up; False if a slot was already handed to it."""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return True
+        if isinstance(waiter, threading.Event):
+            self.release()
+        return False
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                try:
+                    waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+                    return
+                except RuntimeError:
+                    # Its event loop has closed; nobody is waiting there any more
+                    continue
+            self._used -= 1
+
+    def _grant(self, waiter: asyncio.Future):
+        # Runs on the waiter's loop
+        if waiter.cancelled():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+class LLMScheduler(LLMProvider):
+    """
+    Sits in front of an LLM provider and shapes the traffic sent to it:
+
+    - Identical prompts that are already in flight are coalesced into one
+      call whose reply is shared by every caller.
+    - At most `max_concurrency` calls run at once; further calls wait in a
+      queue of at most `max_queue`, beyond which they are rejected rather
+      than piling up.
+    - Calls rejected with a rate limit (HTTP 429) are retried with
+      exponential backoff and full jitter.
+
+    Queue depth, wait time and retry counters are exposed by `get_stats`.
+    The cap and the coalescing hold across sync callers and every event
+    loop: batches run `asyncio.run` (a new loop each time) while
+    single queries call from worker threads, and all of them share the
+    same `max_concurrency` slots and in-flight calls.
+    """
+    def __init__(self, provider: LLMProvider, max_concurrency: int = None, max_queue: int = None,
+                 max_retries: int = None, retry_base_seconds: float = None, retry_max_seconds: float = None):
+        llm_config = config.get("llm", {})
+        self.provider = provider
+        self.name = provider.name
+        self.max_concurrency = max_concurrency or llm_config.get("max_concurrency", 4)
+        self.max_queue = max_queue if max_queue is not None else llm_config.get("max_queue", 64)
+        self.max_retries = max_retries if max_retries is not None else llm_config.get("max_retries", 3)
+        self.retry_base_seconds = retry_base_seconds if retry_base_seconds is not None else llm_config.get("retry_base_seconds", 0.5)
+        self.retry_max_seconds = retry_max_seconds if retry_max_seconds is not None else llm_config.get("retry_max_seconds", 8)
+
+        self._lock = threading.Lock()
+        self._slots = _Slots(self.max_concurrency)
+        # Prompt -> concurrent Future of the call in flight, awaitable from any thread or loop
+        self._in_flight = {}
+
+        self._queued = 0
+        self._running = 0
+        self._max_queue_depth = 0
+        self._wait_seconds = deque(maxlen=1000)
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.failures = 0
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        """Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped."""
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+
+    def _enqueue(self):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise LLMQueueFullError(f"Too many LLM calls are waiting ({self._queued}); try again later.")
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+
+    def _start(self, queued_at: float):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_seconds.append(time.monotonic() - queued_at)
+
+    def _abandon(self):
+        with self._lock:
+            self._queued -= 1
+
+    def _finish(self, attempts: int, succeeded: bool):
+        with self._lock:
+            self._running -= 1
+            self.calls += 1
+            self.retries += attempts - 1
+            if not succeeded:
+                self.failures += 1
+
+    def _count_rate_limit(self):
+        with self._lock:
+            self.rate_limited += 1
+
+    # --- Sync path ---
+
+    def _join(self, prompt: str) -> tuple:
+        """Returns the shared Future for a prompt, and whether the caller must make the call."""
+        with self._lock:
+            shared = self._in_flight.get(prompt)
+            if shared is not None:
+                self.coalesced += 1
+                return shared, False
+            shared = self._in_flight[prompt] = Future()
+            return shared, True
+
+    def _forget(self, prompt: str):
+        with self._lock:
+            del self._in_flight[prompt]
+
+    def generate(self, prompt: str) -> str:
+        shared, is_owner = self._join(prompt)
+        if is_owner:
+            try:
+                shared.set_result(self._call(prompt))
+            except Exception as e:
+                shared.set_exception(e)
+            finally:
+                self._forget(prompt)
+        return shared.result()
+
+    def _call(self, prompt: str) -> str:
+        self._enqueue()
+        queued_at = time.monotonic()
+        try:
+            self._slots.acquire()
+        except BaseException:
+            self._abandon()
+            raise
+        self._start(queued_at)
+
+        attempt, succeeded = 0, False
+        try:
+            while True:
+                attempt += 1
+                try:
+                    reply = self.provider.generate(prompt)
+                    succeeded = True
+                    return reply
+                except RateLimitError:
+                    self._count_rate_limit()
+                    if attempt > self.max_retries:
+                        raise
+                    time.sleep(self._backoff_seconds(attempt - 1))
+        finally:
+            self._finish(attempt, succeeded)
+            self._slots.release()
+
+    # --- Async path ---
+
+    async def agenerate(self, prompt: str) -> str:
+        shared, is_owner = self._join(prompt)
+        if is_owner:
+            task = asyncio.get_running_loop().create_task(self._acall(prompt))
+            task.add_done_callback(lambda done: self._settle(prompt, shared, done))
+        # Shielded, so one caller timing out does not cancel the call for the others
+        return await asyncio.shield(asyncio.wrap_future(shared))
+
+    def _settle(self, prompt: str, shared: Future, task: asyncio.Task):
+        """Hands the outcome of an async call to every caller waiting on it, on any loop or thread."""
+        self._forget(prompt)
+        if task.cancelled():
+            # e.g. its loop was shut down by asyncio.run
+            shared.cancel()
+        elif task.exception() is not None:
+            shared.set_exception(task.exception())
+        else:
+            shared.set_result(task.result())
+
+    async def _acall(self, prompt: str) -> str:
+        self._enqueue()
+        queued_at = time.monotonic()
+        try:
+            await self._slots.aacquire()
+        except BaseException:
+            self._abandon()
+            raise
+        self._start(queued_at)
+
+        attempt, succeeded = 0, False
+        try:
+            while True:
+                attempt += 1
+                try:
+                    reply = await self.provider.agenerate(prompt)
+                    succeeded = True
+                    return reply
+                except RateLimitError:
+                    self._count_rate_limit()
+                    if attempt > self.max_retries:
+                        raise
+                    await asyncio.sleep(self._backoff_seconds(attempt - 1))
+        finally:
+            self._finish(attempt, succeeded)
+            self._slots.release()
+
+    async def astream(self, prompt: str):
+        """
+        Streams a reply under the same concurrency cap and queue as
+        `agenerate`. Streams are not coalesced, and a rate-limited call is
+        only retried if it failed before its first piece was yielded.
+        """
+        self._enqueue()
+        queued_at = time.monotonic()
+        try:
+            await self._slots.aacquire()
+        except BaseException:
+            self._abandon()
+            raise
+        self._start(queued_at)
+
+        attempt, succeeded = 0, False
+        try:
+            while True:
+                attempt += 1
+                started = False
+                try:
+                    async for piece in self.provider.astream(prompt):
+                        started = True
+                        yield piece
+                    succeeded = True
+                    return
+                except RateLimitError:
+                    self._count_rate_limit()
+                    if started or attempt > self.max_retries:
+                        raise
+                    await asyncio.sleep(self._backoff_seconds(attempt - 1))
+        finally:
+            self._finish(attempt, succeeded)
+            self._slots.release()
+
+    def get_stats(self) -> dict:
+        """Returns the queue depth, wait times and call counters."""
+        with self._lock:
+            waits = sorted(self._wait_seconds)
+            return {
+                "provider": self.name,
+                "max_concurrency": self.max_concurrency,
+                "running": self._running,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queue_depth,
+                "wait_seconds_avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "wait_seconds_p95": round(waits[int(0.95 * (len(waits) - 1))], 4) if waits else 0.0,
+                "wait_seconds_max": round(waits[-1], 4) if waits else 0.0,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "rejected": self.rejected,
+                "failures": self.failures,
+            }
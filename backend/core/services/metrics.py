@@ -0,0 +1,181 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from ..config import config
+
+# Stages timed on the query path, in pipeline order
+QUERY_STAGES = (
+    "classification", "schema_load", "sql_generation", "sql_execution",
+    "embedding", "faiss_search", "extraction", "query_total",
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+def _quantile(sorted_values: list, q: float) -> float:
+    """Nearest-rank quantile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+class RollingHistogram:
+    """
+    Keeps the samples observed during the last `window_seconds` (at most
+    `max_samples` of them) for percentiles, plus the previous window's
+    average for trends, and lifetime count and sum for Prometheus.
+    """
+    def __init__(self, window_seconds: float, max_samples: int):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float, now: float):
+        self._samples.append((now, value))
+        self.count += 1
+        self.total += value
+
+    def _prune(self, now: float):
+        # Samples older than two windows are no longer needed, even for the trend
+        while self._samples and self._samples[0][0] < now - 2 * self.window_seconds:
+            self._samples.popleft()
+
+    def snapshot(self, now: float) -> dict:
+        self._prune(now)
+        current, previous = [], []
+        for timestamp, value in self._samples:
+            if timestamp >= now - self.window_seconds:
+                current.append(value)
+            else:
+                previous.append(value)
+        current.sort()
+
+        summary = {
+            "count": len(current),
+            "avg": sum(current) / len(current) if current else 0.0,
+            "previous_avg": sum(previous) / len(previous) if previous else None,
+            "previous_count": len(previous),
+            "lifetime_count": self.count,
+            "lifetime_sum": self.total,
+        }
+        for q in QUANTILES:
+            summary[f"p{int(q * 100)}"] = _quantile(current, q)
+        return summary
+
+class MetricsRegistry:
+    """
+    In-process instrumentation for the query pipeline. Stage timings go into
+    rolling histograms (p50/p95/p99 over the last `window_seconds`), and
+    completed queries into counters from which QPS is derived. Snapshots
+    feed /api/metrics and the Prometheus text endpoint.
+    """
+    def __init__(self, window_seconds: float = None, max_samples: int = None):
+        metrics_config = config.get("metrics", {})
+        self.window_seconds = window_seconds or metrics_config.get("window_seconds", 300)
+        self.max_samples = max_samples or metrics_config.get("max_samples_per_stage", 5000)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drops every sample and counter, e.g. between the phases of a benchmark."""
+        with self._lock:
+            # Every query stage is reported from the start, even before its first sample
+            self._histograms = {stage: RollingHistogram(self.window_seconds, self.max_samples) for stage in QUERY_STAGES}
+            self._query_counts = {}
+            # Completed queries per wall-clock second, for QPS independent of the histogram sample cap
+            self._query_seconds = deque()
+            self._started_at = time.time()
+
+    def observe(self, stage: str, seconds: float):
+        """Records one duration for a stage."""
+        now = time.time()
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = RollingHistogram(self.window_seconds, self.max_samples)
+            histogram.observe(seconds, now)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Times the enclosed block (including any awaits inside it) as one sample of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def record_query(self, query_type: str, status: str):
+        """Counts a completed query by type and status ("ok", "cache_hit", "partial" or "error")."""
+        second = int(time.time())
+        with self._lock:
+            key = (query_type or "unknown", status)
+            self._query_counts[key] = self._query_counts.get(key, 0) + 1
+            if self._query_seconds and self._query_seconds[-1][0] == second:
+                self._query_seconds[-1][1] += 1
+            else:
+                self._query_seconds.append([second, 1])
+            while self._query_seconds[0][0] < second - 2 * self.window_seconds:
+                self._query_seconds.popleft()
+
+    def _qps(self, now: float) -> tuple:
+        """Returns the (current, previous) window's queries per second."""
+        current = sum(count for second, count in self._query_seconds if second >= now - self.window_seconds)
+        previous = sum(count for second, count in self._query_seconds if second < now - self.window_seconds)
+        # Right after startup the current window is only partly elapsed
+        elapsed = min(self.window_seconds, max(1.0, now - self._started_at))
+        return current / elapsed, previous / self.window_seconds
+
+    def get_snapshot(self) -> dict:
+        """Returns per-stage percentiles (in seconds), query counters and the current QPS."""
+        now = time.time()
+        with self._lock:
+            stages = {stage: histogram.snapshot(now) for stage, histogram in self._histograms.items()}
+            query_counts = dict(self._query_counts)
+            qps, previous_qps = self._qps(now)
+
+        return {
+            "window_seconds": self.window_seconds,
+            "stages": stages,
+            "queries_total": sum(query_counts.values()),
+            "queries_by_status": [
+                {"query_type": query_type, "status": status, "count": count}
+                for (query_type, status), count in sorted(query_counts.items())
+            ],
+            "qps": qps,
+            "previous_qps": previous_qps,
+        }
+
+    def render_prometheus(self, gauges: dict = None) -> str:
+        """
+        Renders the metrics in the Prometheus text exposition format. Stage
+        timings are summaries over the rolling window; `gauges` adds extra
+        point-in-time values such as the index size.
+        """
+        snapshot = self.get_snapshot()
+        lines = [
+            "# HELP nlpqe_stage_duration_seconds Duration of each query pipeline stage.",
+            "# TYPE nlpqe_stage_duration_seconds summary",
+        ]
+        for stage, summary in sorted(snapshot["stages"].items()):
+            for q in QUANTILES:
+                lines.append(f'nlpqe_stage_duration_seconds{{stage="{stage}",quantile="{q}"}} {summary[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'nlpqe_stage_duration_seconds_sum{{stage="{stage}"}} {summary["lifetime_sum"]:.6f}')
+            lines.append(f'nlpqe_stage_duration_seconds_count{{stage="{stage}"}} {summary["lifetime_count"]}')
+
+        lines += [
+            "# HELP nlpqe_queries_total Completed queries by type and status.",
+            "# TYPE nlpqe_queries_total counter",
+        ]
+        for entry in snapshot["queries_by_status"]:
+            lines.append(f'nlpqe_queries_total{{query_type="{entry["query_type"]}",status="{entry["status"]}"}} {entry["count"]}')
+
+        lines += [
+            "# HELP nlpqe_queries_per_second Queries per second over the rolling window.",
+            "# TYPE nlpqe_queries_per_second gauge",
+            f"nlpqe_queries_per_second {snapshot['qps']:.6f}",
+        ]
+        for name, (help_text, value) in sorted((gauges or {}).items()):
+            lines += [f"# HELP nlpqe_{name} {help_text}", f"# TYPE nlpqe_{name} gauge", f"nlpqe_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+# Create a single, shared registry that every service records into.
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,392 @@
+import re
+import copy
+import json
+import time
+import pickle
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from cachetools import TTLCache
+from ..config import config, resolve_path
+
+def normalize_query(user_query: str) -> str:
+    """
+    Normalizes a query for use as a cache key, so that differences in case,
+    whitespace and trailing punctuation ("How many employees?" vs "how many
+    employees") map to the same entry. Everything else is kept: operators
+    and numeric punctuation ("salary > 100000", "-1.5") change the answer.
+    """
+    query = " ".join(user_query.lower().split())
+    return query.rstrip("?!.;, ")
+
+def cache_key(user_query: str, scope: str = None) -> str:
+    """
+    The cache key of a query: its normalized text, prefixed with a scope
+    (the hashed connection string) so that databases with identical schemas
+    never serve each other's results.
+    """
+    key = normalize_query(user_query)
+    return f"{scope}:{key}" if scope else key
+
+# Literal values that must match before generated SQL is reused for a similar
+# question: numbers, quoted strings and capitalized words after the first one.
+_LITERAL_PATTERN = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"|(?<=\s)[A-Z][\w-]*")
+
+def query_literals(user_query: str) -> frozenset:
+    """Returns the literal values of a query ("employees hired after 2020 in Sales" -> {"2020", "sales"})."""
+    return frozenset(literal.strip("'\"").lower() for literal in _LITERAL_PATTERN.findall(user_query))
+
+class _CountingTTLCache(TTLCache):
+    """A TTLCache that counts LRU evictions and TTL expirations."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        # Called by cachetools when the cache is over its size budget
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.expirations += len(expired or [])
+        return expired
+
+class QueryResultCache:
+    """
+    A bounded cache for query results. Entries are evicted by LRU once the
+    total size budget is exceeded and expire after the configured TTL.
+    Versions are tracked per scope (database): when the schema or the
+    document index changes, only the results of the scopes that see the
+    new versions are dropped. Changes to the rows of a database do not change its schema version, so
+    a cached SQL result can be stale for up to `cache_ttl_seconds` after
+    the data changes. Results are copied on the way in and out so callers
+    can never mutate a cached entry.
+    """
+    def __init__(self, ttl_seconds: int = None, max_entries: int = None, max_bytes: int = None):
+        query_engine_config = config.get("query_engine", {})
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else query_engine_config.get("cache_ttl_seconds", 300)
+        self.max_entries = max_entries if max_entries is not None else query_engine_config.get("cache_max_entries", 1000)
+        self.max_bytes = max_bytes if max_bytes is not None else query_engine_config.get("cache_max_bytes", 50 * 1024 * 1024)
+
+        # The cache's maxsize is expressed in bytes; entry count is enforced separately
+        self._cache = _CountingTTLCache(maxsize=self.max_bytes, ttl=self.ttl_seconds, getsizeof=self._sizeof)
+        # scope -> the (schema, document index) versions its entries were computed under
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _sizeof(entry: dict) -> int:
+        return entry["size"]
+
+    @staticmethod
+    def _estimate_size(result: dict) -> int:
+        """Approximates the memory footprint of a result by its serialized length."""
+        return len(json.dumps(result, default=str))
+
+    def _sync_versions(self, versions: tuple, scope: str):
+        """Drops the entries of a scope if its schema or document index version has changed."""
+        if scope in self._versions and self._versions[scope] != versions:
+            stale = [key for key, entry in self._cache.items() if entry["scope"] == scope]
+            for key in stale:
+                del self._cache[key]
+            if stale:
+                self.invalidations += 1
+        self._versions[scope] = versions
+
+    def get(self, user_query: str, versions: tuple = (), scope: str = None):
+        """Returns a copy of the cached result for a query, or None on a miss."""
+        key = cache_key(user_query, scope)
+        with self._lock:
+            self._sync_versions(versions, scope)
+            entry = self._cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return copy.deepcopy(entry["result"])
+
+    def set(self, user_query: str, result: dict, versions: tuple = (), scope: str = None):
+        """Stores a copy of a result. Results larger than the whole budget are not cached."""
+        key = cache_key(user_query, scope)
+        size = self._estimate_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._sync_versions(versions, scope)
+            self._cache[key] = {"result": copy.deepcopy(result), "size": size, "scope": scope}
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem()
+
+    def invalidate(self):
+        """Drops every cached result."""
+        with self._lock:
+            self._cache.clear()
+            self.invalidations += 1
+
+    def __len__(self):
+        with self._lock:
+            self._cache.expire()
+            return len(self._cache)
+
+    def get_stats(self) -> dict:
+        """Returns hit/miss/eviction counters and the current memory usage."""
+        with self._lock:
+            self._cache.expire()
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._cache),
+                "bytes": self._cache.currsize,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._cache.evictions,
+                "expirations": self._cache.expirations,
+                "invalidations": self.invalidations,
+            }
+
+class SharedQueryResultCache:
+    """
+    The query result cache kept in a SQLite file instead of process memory,
+    so that every worker process of a multi-worker deployment shares one
+    set of results: a result computed by one worker is a hit in all the
+    others. Same TTL, LRU and size budgets as QueryResultCache; entries of
+    the same scope under other schema or index versions are dropped when a
+    result is stored.
+    Results are pickled, which also copies them on the way in and out.
+    Hit/miss counters are per process.
+    """
+    def __init__(self, path: str = None, ttl_seconds: int = None, max_entries: int = None, max_bytes: int = None):
+        query_engine_config = config.get("query_engine", {})
+        data_paths = config.get("data_paths", {})
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else query_engine_config.get("cache_ttl_seconds", 300)
+        self.max_entries = max_entries if max_entries is not None else query_engine_config.get("cache_max_entries", 1000)
+        self.max_bytes = max_bytes if max_bytes is not None else query_engine_config.get("cache_max_bytes", 50 * 1024 * 1024)
+        self.path = resolve_path(path or data_paths.get("query_cache", "./backend/data/query_cache.sqlite"))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per process, shared by its threads under the lock; SQLite arbitrates between processes
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_results (
+                    key TEXT PRIMARY KEY,
+                    versions TEXT NOT NULL,
+                    result BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(query_results)")}
+            if "scope" not in existing:
+                self._conn.execute("ALTER TABLE query_results ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_results_accessed_at ON query_results(accessed_at)")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _versions_key(versions: tuple) -> str:
+        return json.dumps(list(versions), default=str)
+
+    def _expire(self, now: float):
+        deleted = self._conn.execute("DELETE FROM query_results WHERE created_at <= ?", (now - self.ttl_seconds,)).rowcount
+        self.expirations += max(deleted, 0)
+
+    def _evict(self):
+        """Drops least recently used entries until both the entry and the byte budgets are met."""
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_results").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM query_results ORDER BY accessed_at"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM query_results WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def get(self, user_query: str, versions: tuple = (), scope: str = None):
+        """Returns a copy of the cached result for a query, or None on a miss."""
+        key = cache_key(user_query, scope)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT result FROM query_results WHERE key = ? AND versions = ? AND created_at > ?",
+                (key, self._versions_key(versions), now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE query_results SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, user_query: str, result: dict, versions: tuple = (), scope: str = None):
+        """Stores a copy of a result. Results larger than the whole budget are not cached."""
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        versions_key = self._versions_key(versions)
+        now = time.time()
+        with self._lock, self._conn:
+            # Results of this scope under an older schema or index are never served again
+            stale = self._conn.execute(
+                "DELETE FROM query_results WHERE scope = ? AND versions != ?", (scope or "", versions_key)
+            ).rowcount
+            if stale > 0:
+                self.invalidations += 1
+            self._expire(now)
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO query_results (key, scope, versions, result, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (cache_key(user_query, scope), scope or "", versions_key, payload, len(payload), now, now)
+            )
+            self._evict()
+
+    def invalidate(self):
+        """Drops every cached result, in every worker."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM query_results")
+            self.invalidations += 1
+
+    def __len__(self):
+        with self._lock, self._conn:
+            self._expire(time.time())
+            return self._conn.execute("SELECT COUNT(*) FROM query_results").fetchone()[0]
+
+    def get_stats(self) -> dict:
+        """Returns hit/miss/eviction counters and the current size of the shared cache."""
+        with self._lock, self._conn:
+            self._expire(time.time())
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_results").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "backend": "sqlite",
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+def create_result_cache():
+    """
+    Returns the query result cache selected by `query_engine.cache_backend`:
+    "memory" (per process, the default) or "sqlite" (shared by all workers).
+    """
+    backend = config.get("query_engine", {}).get("cache_backend", "memory")
+    if backend == "sqlite":
+        return SharedQueryResultCache()
+    if backend != "memory":
+        raise ValueError(f"Unknown query cache backend '{backend}'. Expected 'memory' or 'sqlite'.")
+    return QueryResultCache()
+
+class SemanticSQLCache:
+    """
+    A cache of generated SQL keyed by query embedding, so that paraphrases
+    ("headcount", "how many employees", "number of staff") reuse the SQL of
+    an earlier question instead of paying for another LLM round trip. Only
+    generation is skipped: the cached SQL is still executed for fresh rows.
+
+    A lookup matches the most similar cached question whose cosine similarity
+    is above the threshold and whose literal values (numbers, quoted strings,
+    capitalized names) are identical, so "salary in Sales" never reuses the
+    SQL of "salary in Marketing". Entries are keyed by schema version, so
+    queries against several databases keep each other's entries, and SQL is
+    never reused across schemas; entries of schemas no longer queried age
+    out by LRU. Without embeddings, only normalized exact matches hit.
+    """
+    def __init__(self, similarity_threshold: float = None, max_entries: int = None):
+        query_engine_config = config.get("query_engine", {})
+        self.similarity_threshold = similarity_threshold if similarity_threshold is not None else query_engine_config.get("sql_cache_similarity_threshold", 0.92)
+        self.max_entries = max_entries if max_entries is not None else query_engine_config.get("sql_cache_max_entries", 500)
+
+        # (schema version, normalized query) -> {"sql", "embedding", "literals"}, in LRU order
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_query: str, query_embedding: np.ndarray = None, schema_version: str = None):
+        """
+        Returns {"sql", "matched_query", "similarity"} for the closest cached
+        question, or None on a miss.
+        """
+        key = (schema_version, normalize_query(user_query))
+        literals = query_literals(user_query)
+        with self._lock:
+            match, similarity = self._entries.get(key), 1.0
+            if match is None and query_embedding is not None:
+                candidates = [
+                    (cached_key, entry) for cached_key, entry in self._entries.items()
+                    if cached_key[0] == schema_version and entry["embedding"] is not None and entry["literals"] == literals
+                ]
+                if candidates:
+                    similarities = np.stack([entry["embedding"] for _, entry in candidates]) @ query_embedding
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        key, match = candidates[best]
+                        similarity = float(similarities[best])
+
+            if match is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return {"sql": match["sql"], "matched_query": key[1], "similarity": round(similarity, 4)}
+
+    def set(self, user_query: str, sql_query: str, query_embedding: np.ndarray = None, schema_version: str = None):
+        """Stores the SQL generated for a query. Callers should only store SQL that executed successfully."""
+        key = (schema_version, normalize_query(user_query))
+        with self._lock:
+            self._entries[key] = {
+                "sql": sql_query,
+                "embedding": None if query_embedding is None else np.asarray(query_embedding, dtype=np.float32),
+                "literals": query_literals(user_query),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, cached_query: str, schema_version: str = None):
+        """Removes an entry, e.g. when its SQL failed against the database."""
+        with self._lock:
+            self._entries.pop((schema_version, normalize_query(cached_query)), None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_stats(self) -> dict:
+        """Returns hit/miss counters and the number of cached statements."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -1,70 +1,226 @@
-import os
 import time
 import json
-import pandas as pd
-from sqlalchemy import create_engine
+import asyncio
+import hashlib
 from sqlalchemy.exc import SQLAlchemyError
-import google.generativeai as genai
-from dotenv import load_dotenv
-import numpy as np
-from .document_processor import DocumentProcessor
+from ..config import config
+from .document_processor import DocumentProcessor, embedding_executor
+from .intent_router import IntentRouter
+from .llm_providers import LLMProvider, create_llm_provider
+from .llm_scheduler import LLMScheduler
+from .metrics import metrics_registry
+from .query_cache import SemanticSQLCache, create_result_cache
+from .result_pager import SQLResultPager
+from .schema_cache import SchemaCache, schema_cache as shared_schema_cache
+from .schema_linker import SchemaLinker, schema_to_ddl
+from .sql_templates import SQLTemplateEngine
+from .vector_index import normalize
 
-# Load environment variables from a .env file if it exists
-load_dotenv()
-
-# Configure the Gemini API client at startup
-try:
-    # This will only succeed if the GOOGLE_API_KEY is set in the environment
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-except Exception as e:
-    print(f"Warning: Could not configure Gemini API. LLM features will be disabled. Error: {e}")
+# The answer the extraction prompt asks for when a snippet does not contain one
+NOT_FOUND_ANSWER = "The information was not found in the provided document."
 
 class QueryEngine:
     """
     Processes natural language queries by classifying them, generating SQL,
     performing semantic search, and extracting specific answers from documents.
     """
-    def __init__(self, schema: dict = None):
+    def __init__(self, schema: dict = None, schema_cache: SchemaCache = None, schema_linker: SchemaLinker = None, llm: LLMProvider = None):
         """
-        Initializes the query engine and the Gemini model client.
+        Initializes the query engine and the LLM provider selected by the
+        `llm` section of config.yml (Gemini by default).
         """
+        # Only a fallback for prompts built without a linked schema; each query uses
+        # the schema of its own connection string, kept local to that query
         self.schema = schema
-        # Use a stable and available model name for the API
-        self.llm = genai.GenerativeModel('gemini-2.5-flash') if os.getenv("GOOGLE_API_KEY") else None
-        # Simple in-memory dictionary for query caching
-        self.cache = {}
+        # Discovered schemas are cached per connection string instead of re-inspecting the database
+        self.schema_cache = schema_cache or shared_schema_cache
+        # Prunes the schema sent to the LLM down to the tables relevant to each question
+        self.schema_linker = schema_linker or SchemaLinker()
+        # Decides between the SQL and document branches, and answers common aggregates without the LLM
+        self.router = IntentRouter()
+        self.templates = SQLTemplateEngine()
+        # None when no provider is available, which disables SQL generation and answer extraction.
+        # Calls go through a scheduler that coalesces duplicates, caps concurrency and retries 429s.
+        provider = llm or create_llm_provider()
+        self.llm = LLMScheduler(provider) if provider and not isinstance(provider, LLMScheduler) else provider
+        # Bounded TTL/LRU cache of query results, invalidated on schema or index changes;
+        # per process, or shared by all worker processes with the sqlite backend
+        self.cache = create_result_cache()
+        # Generated SQL keyed by query embedding, so paraphrased questions skip the LLM
+        self.sql_cache = SemanticSQLCache()
+        # SQL results are read through server-side cursors a page (or a streamed batch) at a time
+        self.pager = SQLResultPager()
+        query_engine_config = config.get("query_engine", {})
+        # Upper bound on a single LLM round trip in the async pipeline
+        self.llm_timeout_seconds = query_engine_config.get("llm_timeout_seconds", 30)
+        # Top-k retrieval settings and the token budget shared by all snippets in one extraction call
+        self.top_k_documents = query_engine_config.get("top_k_documents", 3)
+        self.document_score_threshold = query_engine_config.get("document_score_threshold", 0.2)
+        self.extraction_token_budget = query_engine_config.get("extraction_token_budget", 1500)
+        # Upper bounds on each branch of a query; a slow branch yields a partial result
+        self.branch_timeouts = {
+            "sql": query_engine_config.get("sql_branch_timeout_seconds", 45),
+            "documents": query_engine_config.get("document_branch_timeout_seconds", 45),
+        }
+        # Events buffered between the concurrent branches of a streamed query and the client
+        self.stream_buffer_events = query_engine_config.get("stream_buffer_events", 256)
+        # Largest accepted batch, and how many of its queries run their LLM and database work at once
+        self.batch_max_queries = query_engine_config.get("batch_max_queries", 100)
+        self.batch_concurrency = query_engine_config.get("batch_concurrency", 4)
 
     def get_cache_size(self):
         """Returns the number of items currently in the cache."""
         return len(self.cache)
 
-    def _classify_query(self, user_query: str) -> str:
-        """A simple keyword-based classifier to determine query type."""
-        query_lower = user_query.lower()
-        sql_keywords = ["salary", "employee", "department", "hired", "count", "average", "list"]
-        doc_keywords = ["skills", "experience", "resume", "review", "contract", "performance", "contact", "email", "link", "github"]
-        
-        is_sql = any(keyword in query_lower for keyword in sql_keywords)
-        is_doc = any(keyword in query_lower for keyword in doc_keywords)
+    def get_cache_stats(self) -> dict:
+        """Returns the hit/miss/eviction counters of the query cache and the SQL cache."""
+        return {**self.cache.get_stats(), "sql_cache": self.sql_cache.get_stats()}
 
-        if is_sql and not is_doc:
-            return "SQL"
-        elif is_doc and not is_sql:
-            return "DOCUMENT"
-        else: # If it's ambiguous or contains keywords from both, treat as Hybrid
-            return "HYBRID"
+    def get_llm_stats(self) -> dict:
+        """Returns the LLM scheduler's queue depth, wait times and retry counters."""
+        return self.llm.get_stats() if self.llm else {"provider": None}
 
-    def _generate_sql_from_nlp(self, user_query: str) -> str:
-        """Uses the Gemini LLM to convert a natural language query into an SQL query."""
-        if not self.llm: return "LLM_ERROR: LLM not configured."
-        if not self.schema: return "LLM_ERROR: Database schema is not available."
+    @staticmethod
+    def _cache_scope(connection_string: str) -> str:
+        """Scopes cached results to their database; hashed so credentials are never part of a key."""
+        return hashlib.sha256((connection_string or "").encode("utf-8")).hexdigest()[:16]
+
+    def _cache_versions(self, connection_string: str, doc_processor: DocumentProcessor) -> tuple:
+        """
+        The schema and document index versions that cached results depend on.
+        Neither covers table data: a cached SQL result lives until its TTL
+        even if the rows behind it change.
+
+        The index is first brought up to date with the shared chunk store (one
+        generation lookup; a reload only if another worker changed it), so a
+        worker never serves or stores results under a generation it is behind.
+        Blocking: async callers run it off the event loop.
+        """
+        if not doc_processor:
+            return (self.schema_cache.get_version(connection_string), None)
+        doc_processor.sync_with_store(force=True)
+        return (self.schema_cache.get_version(connection_string), doc_processor.index_version)
+
+    def _get_cached_result(self, user_query: str, connection_string: str, doc_processor: DocumentProcessor):
+        return self.cache.get(user_query, self._cache_versions(connection_string, doc_processor), self._cache_scope(connection_string))
+
+    def _cache_result(self, user_query: str, result: dict, connection_string: str, doc_processor: DocumentProcessor):
+        self.cache.set(user_query, result, self._cache_versions(connection_string, doc_processor), self._cache_scope(connection_string))
+
+    def _route_query(self, user_query: str, schema: dict, connection_string: str, doc_processor: DocumentProcessor, query_embedding=None) -> dict:
+        """
+        Determines the query type. Questions a SQL template answers are SQL
+        with full confidence; otherwise the intent router decides lexically,
+        consulting the embedding model only when that decision is weak.
+
+        Returns:
+            The routing decision (`query_type`, `confidence`, `method`, and
+            `template` or `scores`), plus the query `embedding` when one was
+            computed, so that SQL planning does not encode the query again.
+        """
+        template = self.templates.match(user_query, schema)
+        if template is not None:
+            return {"query_type": "SQL", "confidence": 1.0, "method": "template", "template": template["template"]}
+
+        schema_version = self.schema_cache.get_version(connection_string)
+        routing = self.router.route(user_query, schema, schema_version)
+        if not self.router.needs_embedding(routing) or not doc_processor or not doc_processor.model:
+            return routing
+        if query_embedding is None:
+            query_embedding = self._embed_query(user_query, doc_processor)
+        routing = self.router.route(
+            user_query, schema, schema_version, encode=doc_processor.model.encode, query_embedding=query_embedding
+        )
+        routing["embedding"] = query_embedding
+        return routing
+
+    async def _aroute_query(self, user_query: str, schema: dict, connection_string: str, doc_processor: DocumentProcessor) -> dict:
+        """Routes on the event loop, moving to the embedding executor only when the model has to be consulted."""
+        routing = self._route_query(user_query, schema, connection_string, None)
+        if routing["method"] == "template" or not self.router.needs_embedding(routing) or not doc_processor or not doc_processor.model:
+            return routing
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(embedding_executor, self._route_query, user_query, schema, connection_string, doc_processor)
+
+    @staticmethod
+    def _embed_query(user_query: str, doc_processor: DocumentProcessor):
+        """Returns the query's normalized embedding from the document model, or None if it is unavailable."""
+        if not doc_processor or not doc_processor.model:
+            return None
+        try:
+            with metrics_registry.timer("embedding"):
+                return normalize(doc_processor.model.encode([user_query]))[0]
+        except Exception as e:
+            print(f"Warning: Could not embed query: {e}")
+            return None
+
+    def _plan_sql(self, user_query: str, schema: dict, connection_string: str, doc_processor: DocumentProcessor, embedding=None) -> dict:
+        """
+        Prepares SQL generation for a query. Uses a SQL template when one
+        answers the question, then the SQL of a semantically equivalent
+        earlier question; otherwise selects the relevant tables and
+        serializes them as compact DDL for the prompt.
+
+        Returns:
+            A dictionary with the ready-made `sql` (or None when the LLM has
+            to write it), the `template` or `cached` SQL match it came from,
+            the `ddl` for the prompt, the query `embedding`, the
+            `schema_version` and the `metrics` to report. A precomputed query
+            `embedding` (from a batch or from routing) is used instead of
+            encoding the query again.
+        """
+        schema_version = self.schema_cache.get_version(connection_string)
+        plan = {"sql": None, "template": None, "cached": None, "ddl": None, "embedding": embedding, "schema_version": schema_version}
 
-        prompt = f"""
+        template = self.templates.match(user_query, schema)
+        if template is not None:
+            plan.update(sql=template["sql"], template=template["template"])
+            plan["metrics"] = {"sql_template": template["template"]}
+            return plan
+
+        if embedding is None:
+            embedding = plan["embedding"] = self._embed_query(user_query, doc_processor)
+        cached = self.sql_cache.get(user_query, embedding, schema_version)
+        if cached is not None:
+            plan["sql"] = cached["sql"]
+            plan["cached"] = cached
+            plan["metrics"] = {"sql_cache": {"status": "hit", "matched_query": cached["matched_query"], "similarity": cached["similarity"]}}
+            return plan
+
+        encode = doc_processor.model.encode if doc_processor and doc_processor.model else None
+        linked = self.schema_linker.link(user_query, schema, schema_version, encode=encode, query_embedding=embedding)
+        plan["ddl"] = schema_to_ddl(linked)
+        plan["metrics"] = {
+            "sql_cache": {"status": "miss"},
+            # Size of the SQL generation prompt after schema linking
+            "sql_prompt": {
+                "tables_included": len(linked.get("tables", [])),
+                "tables_total": len(schema.get("tables", [])),
+                # Tokens are approximated as four characters, as for the extraction budget
+                "prompt_tokens": len(self._build_sql_prompt(user_query, plan["ddl"])) // 4,
+            },
+        }
+        return plan
+
+    async def _aplan_sql(self, user_query: str, schema: dict, connection_string: str, doc_processor: DocumentProcessor, embedding=None) -> dict:
+        """Runs `_plan_sql` on the bounded embedding executor instead of the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            embedding_executor, self._plan_sql, user_query, schema, connection_string, doc_processor, embedding
+        )
+
+    def _build_sql_prompt(self, user_query: str, schema_ddl: str = None) -> str:
+        """Builds the SQL generation prompt from the linked schema (or the whole current schema)."""
+        if schema_ddl is None:
+            schema_ddl = schema_to_ddl(self.schema)
+        return f"""
         You are an expert SQL generator. Based on the database schema provided below, write a single, precise, and executable SQL query to answer the user's question.
 
         **Database Schema:**
-        ```json
-        {json.dumps(self.schema, indent=2)}
+        One table per line as table(column TYPE, ...). PK marks a primary key and -> a foreign key reference.
+        A "--" line under a table lists sample values or the range of its columns.
+        ```
+        {schema_ddl}
         ```
 
         **User's Question:**
@@ -78,107 +234,742 @@ class QueryEngine:
 
         **Generated SQL Query:**
         """
+
+    @staticmethod
+    def _clean_sql_response(response_text: str) -> str:
+        """Strips markdown fences from the generated SQL."""
+        return response_text.strip().replace("```sql", "").replace("```", "")
+
+    def _generate_sql_from_nlp(self, user_query: str, schema_ddl: str = None) -> str:
+        """Uses the Gemini LLM to convert a natural language query into an SQL query."""
+        if not self.llm: return "LLM_ERROR: LLM not configured."
+        if not (schema_ddl or self.schema): return "LLM_ERROR: Database schema is not available."
+
+        prompt = self._build_sql_prompt(user_query, schema_ddl)
         try:
-            response = self.llm.generate_content(prompt)
-            sql_query = response.text.strip().replace("```sql", "").replace("```", "")
-            return sql_query
+            with metrics_registry.timer("sql_generation"):
+                return self._clean_sql_response(self.llm.generate(prompt))
         except Exception as e:
             print(f"Error generating SQL from LLM: {e}")
             return f"LLM_ERROR: {str(e)}"
 
-    def _extract_answer_from_document(self, user_query: str, document_snippet: str) -> str:
+    async def _acall_llm(self, prompt: str) -> str:
+        """Calls the LLM without blocking the event loop, bounded by the configured timeout."""
+        try:
+            return await asyncio.wait_for(self.llm.agenerate(prompt), timeout=self.llm_timeout_seconds)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"LLM call timed out after {self.llm_timeout_seconds}s")
+
+    async def _agenerate_sql_from_nlp(self, user_query: str, schema_ddl: str = None) -> str:
+        """Async counterpart of `_generate_sql_from_nlp`."""
+        if not self.llm: return "LLM_ERROR: LLM not configured."
+        if not (schema_ddl or self.schema): return "LLM_ERROR: Database schema is not available."
+
+        prompt = self._build_sql_prompt(user_query, schema_ddl)
+        try:
+            with metrics_registry.timer("sql_generation"):
+                return self._clean_sql_response(await self._acall_llm(prompt))
+        except Exception as e:
+            print(f"Error generating SQL from LLM: {e}")
+            return f"LLM_ERROR: {str(e)}"
+
+    def _fit_snippets_to_budget(self, hits: list) -> list:
         """
-        Uses the LLM to perform extractive QA on a document snippet.
-        This is the second step of the RAG pipeline.
+        Shares the extraction token budget across the retrieved snippets,
+        best match first. Tokens are approximated as four characters.
         """
-        if not self.llm:
-            return "LLM not configured."
+        remaining_chars = self.extraction_token_budget * 4
+        snippets = []
+        for position, hit in enumerate(hits):
+            share = remaining_chars // (len(hits) - position)
+            snippet = hit["document"]["content"][:share]
+            remaining_chars -= len(snippet)
+            snippets.append(snippet)
+        return snippets
 
-        prompt = f"""
-        You are an expert at reading comprehension. Based ONLY on the following text snippet from a document, please provide a direct and concise answer to the user's question.
+    def _build_extraction_prompt(self, user_query: str, hits: list) -> str:
+        """Builds a single extractive QA prompt over all retrieved snippets."""
+        snippets = "\n".join(
+            f"[{number}] (from {hit['document']['filename']})\n{snippet}\n---"
+            for number, (hit, snippet) in enumerate(zip(hits, self._fit_snippets_to_budget(hits)), start=1)
+        )
+        return f"""
+        You are an expert at reading comprehension. Based ONLY on the following numbered text snippets from documents, please provide a direct and concise answer to the user's question for each snippet.
 
-        **Document Snippet:**
-        ---
-        {document_snippet}
+        **Document Snippets:**
         ---
+        {snippets}
 
         **User's Question:**
         "{user_query}"
 
         **Instructions:**
-        1. If the answer is explicitly present in the text, provide ONLY the specific answer (e.g., just the email address, just the link).
-        2. If the answer cannot be found in the text, respond with ONLY the phrase: "The information was not found in the provided document."
+        1. Respond with ONLY a JSON array containing one object per snippet, in the form {{"snippet": <number>, "answer": <string>}}.
+        2. If the answer is explicitly present in a snippet, the answer should be ONLY the specific answer (e.g., just the email address, just the link).
+        3. If the answer cannot be found in a snippet, its answer should be ONLY the phrase: "{NOT_FOUND_ANSWER}"
         """
+
+    @staticmethod
+    def _parse_extraction_response(response_text: str, snippet_count: int) -> list:
+        """Maps the LLM's JSON answers back to the snippets, tolerating markdown fences and free text."""
+        cleaned = response_text.strip().replace("```json", "").replace("```", "").strip()
+        answers = [NOT_FOUND_ANSWER] * snippet_count
         try:
-            response = self.llm.generate_content(prompt)
-            return response.text.strip()
+            for item in json.loads(cleaned):
+                position = int(item["snippet"]) - 1
+                if 0 <= position < snippet_count:
+                    answers[position] = str(item["answer"]).strip()
+        except (ValueError, TypeError, KeyError):
+            # Not JSON (or malformed part way through): treat the whole reply as the answer
+            # for the best snippet, dropping any answers taken from the items before the error
+            answers = [NOT_FOUND_ANSWER] * snippet_count
+            if answers:
+                answers[0] = cleaned
+        return answers
+
+    def _extract_answers_from_documents(self, user_query: str, hits: list) -> list:
+        """
+        Uses the LLM to perform extractive QA on all retrieved snippets in a
+        single call. This is the second step of the RAG pipeline.
+        """
+        if not self.llm:
+            return ["LLM not configured."] * len(hits)
+
+        prompt = self._build_extraction_prompt(user_query, hits)
+        try:
+            with metrics_registry.timer("extraction"):
+                return self._parse_extraction_response(self.llm.generate(prompt), len(hits))
+        except Exception as e:
+            print(f"Error extracting answer from document: {e}")
+            return [f"Error during answer extraction: {str(e)}"] * len(hits)
+
+    async def _aextract_answers_from_documents(self, user_query: str, hits: list) -> list:
+        """Async counterpart of `_extract_answers_from_documents`."""
+        if not self.llm:
+            return ["LLM not configured."] * len(hits)
+
+        prompt = self._build_extraction_prompt(user_query, hits)
+        try:
+            with metrics_registry.timer("extraction"):
+                return self._parse_extraction_response(await self._acall_llm(prompt), len(hits))
         except Exception as e:
             print(f"Error extracting answer from document: {e}")
-            return f"Error during answer extraction: {str(e)}"
+            return [f"Error during answer extraction: {str(e)}"] * len(hits)
+
+    def _execute_sql(self, sql_query: str, connection_string: str, offset: int = 0, page_size: int = None, user_query: str = None) -> dict:
+        """Runs a query on the pooled sync engine and returns one page of rows with its pagination info."""
+        with metrics_registry.timer("sql_execution"):
+            return self.pager.fetch_page(sql_query, connection_string, offset, page_size, user_query)
+
+    async def _aexecute_sql(self, sql_query: str, connection_string: str, offset: int = 0, page_size: int = None, user_query: str = None) -> dict:
+        """
+        Runs a query on the async driver when one is available, otherwise
+        runs the sync path in a worker thread so the event loop is never blocked.
+        """
+        with metrics_registry.timer("sql_execution"):
+            return await self.pager.afetch_page(sql_query, connection_string, offset, page_size, user_query)
+
+    @staticmethod
+    def _sql_result(sql_query: str, data, pagination: dict = None, execution: dict = None) -> dict:
+        result = {"source": "Database", "query": sql_query, "data": data}
+        if pagination is not None:
+            result["pagination"] = pagination
+        if execution is not None:
+            result["execution"] = execution
+        return result
+
+    @staticmethod
+    def _sql_error_message(e: SQLAlchemyError) -> str:
+        return f"Error executing SQL: {e.args[0] if e.args else 'Unknown SQL Error'}"
+
+    @classmethod
+    def _sql_error_result(cls, sql_query: str, e: SQLAlchemyError) -> dict:
+        return {"source": "Database", "query": sql_query, "data": {"error": cls._sql_error_message(e)}}
+
+    def _update_sql_cache(self, user_query: str, plan: dict, sql_query: str, succeeded: bool):
+        """Caches newly generated SQL that executed successfully, and drops cached SQL that failed."""
+        if plan["template"] is not None:
+            return
+        if plan["cached"] is None and succeeded:
+            self.sql_cache.set(user_query, sql_query, plan["embedding"], plan["schema_version"])
+        elif plan["cached"] is not None and not succeeded:
+            self.sql_cache.discard(plan["cached"]["matched_query"], plan["schema_version"])
+
+    def _run_sql_branch(self, user_query: str, schema: dict, connection_string: str, doc_processor: DocumentProcessor, sql_metrics: dict,
+                        page_size: int = None, embedding=None) -> dict:
+        """
+        Generates SQL for the query (or reuses cached SQL) and executes it
+        against the database, returning the first page of rows. Cache and
+        prompt statistics are written into `sql_metrics`.
+        """
+        plan = self._plan_sql(user_query, schema, connection_string, doc_processor, embedding)
+        sql_metrics.update(plan["metrics"])
+        sql_query = plan["sql"] or self._generate_sql_from_nlp(user_query, plan["ddl"])
+        if sql_query.startswith("LLM_ERROR:"):
+            error_message = sql_query.replace("LLM_ERROR: ", "")
+            return self._sql_result("Error generating SQL", {"error": error_message})
+        try:
+            page = self._execute_sql(sql_query, connection_string, page_size=page_size, user_query=user_query)
+        except SQLAlchemyError as e:
+            self._update_sql_cache(user_query, plan, sql_query, succeeded=False)
+            return self._sql_error_result(sql_query, e)
+        self._update_sql_cache(user_query, plan, sql_query, succeeded=True)
+        return self._sql_result(sql_query, page["rows"], page["pagination"], page["execution"])
+
+    async def _arun_sql_branch(self, user_query: str, schema: dict, connection_string: str, doc_processor: DocumentProcessor, sql_metrics: dict,
+                               page_size: int = None, embedding=None) -> dict:
+        """
+        Async counterpart of `_run_sql_branch`. Planning runs inside the
+        branch so that it overlaps with document retrieval.
+        """
+        plan = await self._aplan_sql(user_query, schema, connection_string, doc_processor, embedding)
+        sql_metrics.update(plan["metrics"])
+        sql_query = plan["sql"] or await self._agenerate_sql_from_nlp(user_query, plan["ddl"])
+        if sql_query.startswith("LLM_ERROR:"):
+            error_message = sql_query.replace("LLM_ERROR: ", "")
+            return self._sql_result("Error generating SQL", {"error": error_message})
+        try:
+            page = await self._aexecute_sql(sql_query, connection_string, page_size=page_size, user_query=user_query)
+        except SQLAlchemyError as e:
+            self._update_sql_cache(user_query, plan, sql_query, succeeded=False)
+            return self._sql_error_result(sql_query, e)
+        self._update_sql_cache(user_query, plan, sql_query, succeeded=True)
+        return self._sql_result(sql_query, page["rows"], page["pagination"], page["execution"])
+
+    @staticmethod
+    def _document_results(hits: list, extracted_answers: list) -> list:
+        """Pairs each hit with its answer, dropping "not found" answers when any snippet had one."""
+        doc_data = [
+            {
+                "filename": hit["document"]["filename"],
+                "page": hit["document"].get("page"),
+                "snippet": answer, # The final answer is now the concise extracted text
+                "relevance_score": hit["score"] # Cosine similarity of the query and the chunk
+            }
+            for hit, answer in zip(hits, extracted_answers)
+        ]
+        found = [item for item in doc_data if item["snippet"] != NOT_FOUND_ANSWER]
+        return found or doc_data[:1]
+
+    def _retrieval_options(self) -> dict:
+        return {"k": self.top_k_documents, "score_threshold": self.document_score_threshold}
+
+    def _run_document_branch(self, user_query: str, doc_processor: DocumentProcessor) -> dict:
+        """Retrieves the top-k matching chunks and extracts the answers from them."""
+        doc_data = []
+        if doc_processor:
+            # Step 1: Retrieval (Find the most relevant snippets, at most one per file)
+            hits = doc_processor.retrieve(user_query, **self._retrieval_options())
+            if hits:
+                # Step 2: Extraction (Send all snippets to the LLM in one call to find the specific answers)
+                extracted_answers = self._extract_answers_from_documents(user_query, hits)
+                doc_data = self._document_results(hits, extracted_answers)
+        return {"source": "Documents", "data": doc_data}
+
+    async def _arun_document_branch(self, user_query: str, doc_processor: DocumentProcessor, hits: list = None) -> dict:
+        """
+        Async counterpart of `_run_document_branch`; embedding runs on the
+        bounded executor. Hits already retrieved for a batch skip retrieval.
+        """
+        doc_data = []
+        if doc_processor:
+            if hits is None:
+                hits = await doc_processor.aretrieve(user_query, **self._retrieval_options())
+            if hits:
+                extracted_answers = await self._aextract_answers_from_documents(user_query, hits)
+                doc_data = self._document_results(hits, extracted_answers)
+        return {"source": "Documents", "data": doc_data}
+
+    async def _arun_timed_branch(self, name: str, source: str, branch) -> tuple:
+        """
+        Awaits one branch under its own timeout. A branch that times out or
+        fails yields an error entry instead of failing the whole query.
+
+        Returns:
+            A (result, timing) tuple, where timing records duration and status.
+        """
+        timeout = self.branch_timeouts[name]
+        branch_start = time.time()
+        try:
+            result = await asyncio.wait_for(branch, timeout=timeout)
+            status = "ok"
+        except asyncio.TimeoutError:
+            result = {"source": source, "data": {"error": f"{source} lookup timed out after {timeout}s"}}
+            status = "timeout"
+        except Exception as e:
+            print(f"Error in {name} branch: {e}")
+            result = {"source": source, "data": {"error": f"{source} lookup failed: {str(e)}"}}
+            status = "error"
+        return result, {"seconds": round(time.time() - branch_start, 3), "status": status}
+
+    @staticmethod
+    def _routing_metrics(routing: dict) -> dict:
+        """The part of a routing decision reported in `performance_metrics` and stream events."""
+        return {key: routing[key] for key in ("confidence", "method", "template") if key in routing}
+
+    def _build_final_result(self, user_query: str, routing: dict, response_results: list, start_time: float, branch_timings: dict = None, sql_metrics: dict = None) -> dict:
+        query_type = routing["query_type"]
+        performance_metrics = {
+            "response_time_seconds": round(time.time() - start_time, 2),
+            "cache_status": "miss",
+            "routing": self._routing_metrics(routing),
+            "branch_timings": branch_timings or {}
+        }
+        # SQL cache status and prompt size, when the SQL branch ran
+        performance_metrics.update(sql_metrics or {})
+        return {
+            "user_query": user_query, "query_type": query_type, "results": response_results,
+            "performance_metrics": performance_metrics
+        }
+
+    @staticmethod
+    def _record_query_metrics(result: dict, seconds: float):
+        """Records a finished query's total latency and outcome."""
+        performance_metrics = result.get("performance_metrics", {})
+        if "error" in result:
+            status = "error"
+        elif performance_metrics.get("cache_status") == "hit":
+            status = "cache_hit"
+        elif any(timing["status"] != "ok" for timing in performance_metrics.get("branch_timings", {}).values()):
+            status = "partial"
+        else:
+            status = "ok"
+        metrics_registry.observe("query_total", seconds)
+        metrics_registry.record_query(result.get("query_type"), status)
 
-    def process_query(self, user_query: str, connection_string: str, doc_processor: DocumentProcessor) -> dict:
-        """The main method to process a user's query from start to finish."""
+    def process_query(self, user_query: str, connection_string: str, doc_processor: DocumentProcessor, page_size: int = None) -> dict:
+        """
+        The main method to process a user's query from start to finish.
+        SQL results hold the first `page_size` rows (`result_pager.page_size`
+        by default) and a page token for the rest.
+        """
+        start = time.perf_counter()
+        result = self._process_query(user_query, connection_string, doc_processor, page_size)
+        self._record_query_metrics(result, time.perf_counter() - start)
+        return result
+
+    def _process_query(self, user_query: str, connection_string: str, doc_processor: DocumentProcessor, page_size: int = None) -> dict:
         start_time = time.time()
-        
-        if user_query in self.cache:
-            cached_result = self.cache[user_query]
+        # Only results with the default page size are cached, so a cached first page always has that size
+        cacheable = self.pager.resolve_page_size(page_size) == self.pager.page_size
+
+        cached_result = self._get_cached_result(user_query, connection_string, doc_processor) if cacheable else None
+        if cached_result is not None:
             cached_result["performance_metrics"]["cache_status"] = "hit"
             return cached_result
 
-        from .schema_discovery import SchemaDiscovery
-        self.schema = SchemaDiscovery().analyze_database(connection_string)
-        if "error" in self.schema:
-             return {"error": f"Schema discovery failed: {self.schema['error']}"}
+        # The schema stays local to the query: concurrent queries may target different databases
+        with metrics_registry.timer("schema_load"):
+            schema = self.schema_cache.get_schema(connection_string)
+        if "error" in schema:
+             return {"error": f"Schema discovery failed: {schema['error']}"}
 
-        query_type = self._classify_query(user_query)
+        with metrics_registry.timer("classification"):
+            routing = self._route_query(user_query, schema, connection_string, doc_processor)
+        embedding = routing.pop("embedding", None)
+        query_type = routing["query_type"]
         response_results = []
+        branch_timings = {}
+        sql_metrics = {}
         
         if query_type in ["SQL", "HYBRID"]:
-            sql_query = self._generate_sql_from_nlp(user_query)
-            if sql_query.startswith("LLM_ERROR:"):
-                error_message = sql_query.replace("LLM_ERROR: ", "")
-                response_results.append({"source": "Database", "query": "Error generating SQL", "data": {"error": error_message}})
-            else:
-                try:
-                    engine = create_engine(connection_string)
-                    df = pd.read_sql_query(sql_query, engine)
-                    sql_data = df.to_dict(orient='records')
-                    response_results.append({"source": "Database", "query": sql_query, "data": sql_data})
-                except SQLAlchemyError as e:
-                    error_message = f"Error executing SQL: {e.args[0] if e.args else 'Unknown SQL Error'}"
-                    response_results.append({"source": "Database", "query": sql_query, "data": {"error": error_message}})
+            branch_start = time.time()
+            response_results.append(self._run_sql_branch(user_query, schema, connection_string, doc_processor, sql_metrics, page_size, embedding))
+            branch_timings["sql"] = {"seconds": round(time.time() - branch_start, 3), "status": "ok"}
         
         if query_type in ["DOCUMENT", "HYBRID"]:
-            if doc_processor and doc_processor.index and doc_processor.index.ntotal > 0:
-                # Step 1: Retrieval (Find the most relevant document snippet)
-                query_embedding = doc_processor.model.encode([user_query])
-                distances, indices = doc_processor.index.search(np.array(query_embedding, dtype=np.float32), k=1) # Get only the single best match
-                
-                doc_data = []
-                if len(indices[0]) > 0:
-                    best_doc_index = indices[0][0]
-                    doc_content = doc_processor.documents[best_doc_index]
-                    
-                    # Step 2: Extraction (Send the best snippet to the LLM to find the specific answer)
-                    extracted_answer = self._extract_answer_from_document(user_query, doc_content["content"])
-
-                    similarity_score = 1 / (1 + distances[0][0])
-
-                    doc_data.append({
-                        "filename": doc_content["filename"],
-                        "snippet": extracted_answer, # The final answer is now the concise extracted text
-                        "relevance_score": float(similarity_score)
-                    })
-                response_results.append({"source": "Documents", "data": doc_data})
-            else:
-                response_results.append({"source": "Documents", "data": []})
-            
-        end_time = time.time()
+            branch_start = time.time()
+            response_results.append(self._run_document_branch(user_query, doc_processor))
+            branch_timings["documents"] = {"seconds": round(time.time() - branch_start, 3), "status": "ok"}
         
-        final_result = {
-            "user_query": user_query, "query_type": query_type, "results": response_results,
-            "performance_metrics": {"response_time_seconds": round(end_time - start_time, 2), "cache_status": "miss"}
-        }
-        self.cache[user_query] = final_result
+        final_result = self._build_final_result(user_query, routing, response_results, start_time, branch_timings, sql_metrics)
+        if cacheable:
+            self._cache_result(user_query, final_result, connection_string, doc_processor)
         return final_result
 
+    async def aprocess_query(self, user_query: str, connection_string: str, doc_processor: DocumentProcessor, page_size: int = None) -> dict:
+        """
+        Async counterpart of `process_query` used by the API. LLM calls and
+        database queries are awaited, while schema discovery and embedding
+        run off the event loop, so concurrent requests overlap. The SQL and
+        document branches run concurrently, each under its own timeout.
+        """
+        start = time.perf_counter()
+        result = await self._aprocess_query(user_query, connection_string, doc_processor, page_size)
+        self._record_query_metrics(result, time.perf_counter() - start)
+        return result
+
+    async def _aprocess_query(self, user_query: str, connection_string: str, doc_processor: DocumentProcessor, page_size: int = None) -> dict:
+        start_time = time.time()
+        cacheable = self.pager.resolve_page_size(page_size) == self.pager.page_size
+
+        # The cache lookup may read SQLite (shared backend, store generation), so keep it off the event loop
+        cached_result = await asyncio.to_thread(self._get_cached_result, user_query, connection_string, doc_processor) if cacheable else None
+        if cached_result is not None:
+            cached_result["performance_metrics"]["cache_status"] = "hit"
+            return cached_result
+
+        # Discovery uses the blocking inspector, so keep it off the event loop
+        with metrics_registry.timer("schema_load"):
+            schema = await asyncio.to_thread(self.schema_cache.get_schema, connection_string)
+        if "error" in schema:
+             return {"error": f"Schema discovery failed: {schema['error']}"}
+
+        with metrics_registry.timer("classification"):
+            routing = await self._aroute_query(user_query, schema, connection_string, doc_processor)
+        return await self._arun_branches(
+            user_query, routing, schema, connection_string, doc_processor, start_time, page_size, cacheable, routing.pop("embedding", None)
+        )
+
+    async def _arun_branches(self, user_query: str, routing: dict, schema: dict, connection_string: str, doc_processor: DocumentProcessor,
+                             start_time: float, page_size: int = None, cacheable: bool = True, embedding=None, hits: list = None) -> dict:
+        """Runs the branches of a routed query and caches the complete result."""
+        query_type = routing["query_type"]
+        branches = []
+        sql_metrics = {}
+
+        if query_type in ["SQL", "HYBRID"]:
+            branches.append(("sql", "Database", self._arun_sql_branch(user_query, schema, connection_string, doc_processor, sql_metrics, page_size, embedding)))
+
+        if query_type in ["DOCUMENT", "HYBRID"]:
+            branches.append(("documents", "Documents", self._arun_document_branch(user_query, doc_processor, hits)))
+
+        # HYBRID queries run both branches concurrently, so latency is the max rather than the sum
+        outcomes = await asyncio.gather(*(self._arun_timed_branch(name, source, branch) for name, source, branch in branches))
+        response_results = [result for result, _ in outcomes]
+        branch_timings = {name: timing for (name, _, _), (_, timing) in zip(branches, outcomes)}
+
+        final_result = self._build_final_result(user_query, routing, response_results, start_time, branch_timings, sql_metrics)
+        # Partial results are returned to the caller but never cached
+        if cacheable and all(timing["status"] == "ok" for timing in branch_timings.values()):
+            await asyncio.to_thread(self._cache_result, user_query, final_result, connection_string, doc_processor)
+        return final_result
+
+    @staticmethod
+    def _encode_batch(user_queries: list, doc_processor: DocumentProcessor):
+        """Embeds every query of a batch in one model call, or returns None if the model is unavailable."""
+        if not user_queries or not doc_processor or not doc_processor.model:
+            return None
+        try:
+            return doc_processor.encode_queries(user_queries)
+        except Exception as e:
+            print(f"Warning: Could not embed batch queries: {e}")
+            return None
+
+    def process_batch(self, user_queries: list, connection_string: str, doc_processor: DocumentProcessor) -> list:
+        """
+        Processes a batch of queries; see `aprocess_batch`. Runs its own
+        event loop, so it must not be called from async code.
+        """
+        return asyncio.run(self.aprocess_batch(user_queries, connection_string, doc_processor))
+
+    async def aprocess_batch(self, user_queries: list, connection_string: str, doc_processor: DocumentProcessor) -> list:
+        """
+        Processes a batch of queries with shared work done once: the cache is
+        checked for every query, the schema is loaded once, all queries are
+        embedded in one model call, routed together, and searched in one
+        multi-vector FAISS call. The remaining LLM and database work runs with
+        at most `batch_concurrency` queries in flight.
+
+        Returns:
+            One entry per query, in order: the query's result as returned by
+            `aprocess_query`, or {"user_query", "error"} for a query that failed.
+        """
+        batch_start = time.perf_counter()
+        start_time = time.time()
+        results = [None] * len(user_queries)
+
+        def fail(position: int, message: str):
+            results[position] = {"user_query": user_queries[position], "error": message}
+            self._record_query_metrics(results[position], time.perf_counter() - batch_start)
+
+        def lookup() -> list:
+            versions = self._cache_versions(connection_string, doc_processor)
+            scope = self._cache_scope(connection_string)
+            return [self.cache.get(user_query, versions, scope) for user_query in user_queries]
+
+        pending = []
+        for position, cached_result in enumerate(await asyncio.to_thread(lookup)):
+            if cached_result is None:
+                pending.append(position)
+                continue
+            cached_result["performance_metrics"]["cache_status"] = "hit"
+            results[position] = cached_result
+            self._record_query_metrics(cached_result, time.perf_counter() - batch_start)
+        if not pending:
+            return results
+
+        with metrics_registry.timer("schema_load"):
+            schema = await asyncio.to_thread(self.schema_cache.get_schema, connection_string)
+        if "error" in schema:
+            for position in pending:
+                fail(position, f"Schema discovery failed: {schema['error']}")
+            return results
+
+        # One encode call and one index search for the whole batch
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(
+            embedding_executor, self._encode_batch, [user_queries[position] for position in pending], doc_processor
+        )
+        embedding_by_position = dict(zip(pending, embeddings)) if embeddings is not None else {}
+
+        # Routing reuses the batch embeddings when a lexical decision is weak
+        with metrics_registry.timer("classification"):
+            routings = await loop.run_in_executor(embedding_executor, lambda: {
+                position: self._route_query(user_queries[position], schema, connection_string, doc_processor, embedding_by_position.get(position))
+                for position in pending
+            })
+        for routing in routings.values():
+            routing.pop("embedding", None)
+
+        hits_by_position = {}
+        document_rows = [row for row, position in enumerate(pending) if routings[position]["query_type"] in ["DOCUMENT", "HYBRID"]]
+        if embeddings is not None and document_rows:
+            hits = await loop.run_in_executor(
+                embedding_executor,
+                lambda: doc_processor.search(embeddings[document_rows], **self._retrieval_options())
+            )
+            hits_by_position = {pending[row]: row_hits for row, row_hits in zip(document_rows, hits)}
+
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def run(position: int) -> dict:
+            async with semaphore:
+                return await self._arun_branches(
+                    user_queries[position], routings[position], schema, connection_string, doc_processor, start_time,
+                    embedding=embedding_by_position.get(position), hits=hits_by_position.get(position)
+                )
+
+        outcomes = await asyncio.gather(*(run(position) for position in pending), return_exceptions=True)
+        for position, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error processing batch query '{user_queries[position]}': {outcome}")
+                fail(position, str(outcome))
+            else:
+                results[position] = outcome
+                self._record_query_metrics(outcome, time.perf_counter() - batch_start)
+        return results
+
+    def fetch_page(self, page_token: str, page_size: int = None) -> dict:
+        """
+        Returns the next page of an earlier query's SQL result. The SQL is
+        re-run on a server-side cursor and resumed after the rows already
+        returned; nothing is regenerated. Raises KeyError for unknown or
+        expired page tokens.
+        """
+        start_time = time.time()
+        state = self.pager.resume(page_token)
+        try:
+            page = self._execute_sql(state["sql"], state["connection_string"], state["offset"], page_size, state["user_query"])
+            sql_result = self._sql_result(state["sql"], page["rows"], page["pagination"], page["execution"])
+        except SQLAlchemyError as e:
+            sql_result = self._sql_error_result(state["sql"], e)
+        return self._build_final_result(state["user_query"], {"query_type": "SQL", "method": "page_token"}, [sql_result], start_time)
+
+    async def afetch_page(self, page_token: str, page_size: int = None) -> dict:
+        """Async counterpart of `fetch_page`."""
+        start_time = time.time()
+        state = self.pager.resume(page_token)
+        try:
+            page = await self._aexecute_sql(state["sql"], state["connection_string"], state["offset"], page_size, state["user_query"])
+            sql_result = self._sql_result(state["sql"], page["rows"], page["pagination"], page["execution"])
+        except SQLAlchemyError as e:
+            sql_result = self._sql_error_result(state["sql"], e)
+        return self._build_final_result(state["user_query"], {"query_type": "SQL", "method": "page_token"}, [sql_result], start_time)
+
+    async def _astream_llm(self, prompt: str):
+        """Streams an LLM reply piece by piece, bounded by the configured timeout for the whole reply."""
+        deadline = time.monotonic() + self.llm_timeout_seconds
+        pieces = self.llm.astream(prompt)
+        try:
+            while True:
+                try:
+                    piece = await asyncio.wait_for(anext(pieces), timeout=max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"LLM call timed out after {self.llm_timeout_seconds}s")
+                yield piece
+        finally:
+            await pieces.aclose()
+
+    async def _astream_sql_branch(self, user_query: str, schema: dict, connection_string: str, doc_processor: DocumentProcessor, sql_metrics: dict,
+                                  embedding=None):
+        """
+        Yields the SQL as the LLM writes it ("sql_delta"), the complete
+        query ("sql"), and then every result row, read from the cursor
+        batch by batch.
+        """
+        plan = await self._aplan_sql(user_query, schema, connection_string, doc_processor, embedding)
+        sql_metrics.update(plan["metrics"])
+        if plan["sql"]:
+            sql_query = plan["sql"]
+        elif not self.llm:
+            sql_query = "LLM_ERROR: LLM not configured."
+        elif not schema:
+            sql_query = "LLM_ERROR: Database schema is not available."
+        else:
+            reply = []
+            try:
+                with metrics_registry.timer("sql_generation"):
+                    async for piece in self._astream_llm(self._build_sql_prompt(user_query, plan["ddl"])):
+                        reply.append(piece)
+                        yield {"event": "sql_delta", "text": piece}
+                sql_query = self._clean_sql_response("".join(reply))
+            except Exception as e:
+                print(f"Error generating SQL from LLM: {e}")
+                sql_query = f"LLM_ERROR: {str(e)}"
+        if sql_query.startswith("LLM_ERROR:"):
+            yield {"event": "error", "source": "Database", "error": sql_query.replace("LLM_ERROR: ", "")}
+            return
+
+        yield {"event": "sql", "query": sql_query}
+        row_count = 0
+        execution = {}
+        execution_start = time.perf_counter()
+        try:
+            async for batch in self.pager.aiter_batches(sql_query, connection_string, execution):
+                if row_count == 0:
+                    # Later batches are paced by the client, so only the time to the first rows is recorded
+                    metrics_registry.observe("sql_execution", time.perf_counter() - execution_start)
+                row_count += len(batch)
+                for row in batch:
+                    yield {"event": "row", "data": row}
+        except SQLAlchemyError as e:
+            self._update_sql_cache(user_query, plan, sql_query, succeeded=False)
+            yield {"event": "error", "source": "Database", "query": sql_query, "error": self._sql_error_message(e)}
+            return
+        self._update_sql_cache(user_query, plan, sql_query, succeeded=True)
+        yield {"event": "sql_end", "row_count": row_count, "execution": execution}
+
+    async def _astream_document_branch(self, user_query: str, doc_processor: DocumentProcessor):
+        """
+        Yields the retrieved snippets ("snippets") as soon as retrieval is
+        done, then the extraction reply as the LLM writes it ("answer_delta"),
+        and finally the extracted answers ("documents").
+        """
+        hits = await doc_processor.aretrieve(user_query, **self._retrieval_options()) if doc_processor else []
+        if not hits:
+            yield {"event": "documents", "data": []}
+            return
+
+        yield {
+            "event": "snippets",
+            "data": [
+                {"filename": hit["document"]["filename"], "page": hit["document"].get("page"),
+                 "snippet": snippet, "relevance_score": hit["score"]}
+                for hit, snippet in zip(hits, self._fit_snippets_to_budget(hits))
+            ],
+        }
+        if not self.llm:
+            answers = ["LLM not configured."] * len(hits)
+        else:
+            reply = []
+            try:
+                with metrics_registry.timer("extraction"):
+                    async for piece in self._astream_llm(self._build_extraction_prompt(user_query, hits)):
+                        reply.append(piece)
+                        yield {"event": "answer_delta", "text": piece}
+                answers = self._parse_extraction_response("".join(reply), len(hits))
+            except Exception as e:
+                print(f"Error extracting answer from document: {e}")
+                answers = [f"Error during answer extraction: {str(e)}"] * len(hits)
+        yield {"event": "documents", "data": self._document_results(hits, answers)}
+
+    @staticmethod
+    async def _aforward_events(events, queue: asyncio.Queue):
+        try:
+            async for event in events:
+                await queue.put(event)
+        finally:
+            await events.aclose()
+
+    async def _apump_branch(self, name: str, source: str, events, queue: asyncio.Queue, branch_timings: dict, timeout: float = None):
+        """
+        Forwards one branch's events to the shared queue, under the branch
+        timeout if there is one. A branch that times out or fails sends an
+        error event instead; None marks the end of the branch.
+        """
+        branch_start = time.time()
+        status = "ok"
+        try:
+            await asyncio.wait_for(self._aforward_events(events, queue), timeout=timeout)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            await queue.put({"event": "error", "source": source, "error": f"{source} lookup timed out after {timeout}s"})
+        except Exception as e:
+            print(f"Error in {name} branch: {e}")
+            status = "error"
+            await queue.put({"event": "error", "source": source, "error": f"{source} lookup failed: {str(e)}"})
+        branch_timings[name] = {"seconds": round(time.time() - branch_start, 3), "status": status}
+        await queue.put(None)
+
+    async def astream_query(self, user_query: str, connection_string: str, doc_processor: DocumentProcessor):
+        """
+        Streams a query's progress as a sequence of events instead of one
+        response, so the first useful output arrives long before the whole
+        query is done and SQL results of any size are sent with bounded
+        memory:
+
+        - "classification": the query type, with the routing confidence and method
+        - "sql_delta" / "sql": the SQL as it is generated, then in full
+        - "row" (one per result row) and "sql_end" with the row count and
+          the execution report (plan cost, row cap, execution time)
+        - "snippets": the retrieved document chunks, before extraction
+        - "answer_delta" / "documents": the extraction as it is generated,
+          then the extracted answers
+        - "error" for a failed branch, and finally "end" with the
+          performance metrics
+
+        The SQL and document branches run concurrently and their events are
+        interleaved through a bounded queue, which also applies backpressure
+        when the client reads slowly. Streamed results bypass the query
+        result cache.
+        """
+        start = time.perf_counter()
+        start_time = time.time()
+
+        with metrics_registry.timer("schema_load"):
+            schema = await asyncio.to_thread(self.schema_cache.get_schema, connection_string)
+        if "error" in schema:
+            self._record_query_metrics({"error": schema["error"]}, time.perf_counter() - start)
+            yield {"event": "error", "error": f"Schema discovery failed: {schema['error']}"}
+            return
+
+        with metrics_registry.timer("classification"):
+            routing = await self._aroute_query(user_query, schema, connection_string, doc_processor)
+        embedding = routing.pop("embedding", None)
+        query_type = routing["query_type"]
+        yield {"event": "classification", "user_query": user_query, "query_type": query_type, **self._routing_metrics(routing)}
+
+        branch_timings = {}
+        sql_metrics = {}
+        branches = []
+        if query_type in ["SQL", "HYBRID"]:
+            # No branch timeout here: once rows flow, the client sets the pace
+            branches.append(("sql", "Database", self._astream_sql_branch(user_query, schema, connection_string, doc_processor, sql_metrics, embedding), None))
+        if query_type in ["DOCUMENT", "HYBRID"]:
+            branches.append(("documents", "Documents", self._astream_document_branch(user_query, doc_processor), self.branch_timeouts["documents"]))
+
+        queue = asyncio.Queue(maxsize=self.stream_buffer_events)
+        tasks = [
+            asyncio.create_task(self._apump_branch(name, source, events, queue, branch_timings, timeout))
+            for name, source, events, timeout in branches
+        ]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event = await queue.get()
+                if event is None:
+                    remaining -= 1
+                else:
+                    yield event
+        finally:
+            # The client may disconnect mid-stream
+            for task in tasks:
+                task.cancel()
+
+        final_result = self._build_final_result(user_query, routing, [], start_time, branch_timings, sql_metrics)
+        final_result["performance_metrics"]["cache_status"] = "bypass"
+        self._record_query_metrics(final_result, time.perf_counter() - start)
+        yield {"event": "end", "performance_metrics": final_result["performance_metrics"]}
@@ -0,0 +1,185 @@
+import asyncio
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from sqlalchemy import text
+from ..config import config
+from .engine_registry import get_engine, get_async_engine
+from .sql_guard import SQLGuard
+
+def _rows(partition) -> list:
+    return [dict(row._mapping) for row in partition]
+
+class SQLResultPager:
+    """
+    Reads SQL results through server-side cursors instead of materializing
+    them. A query returns one page of at most `page_size` rows, plus a page
+    token when more rows follow; the token resumes the query at the next
+    row. Rows can also be iterated in batches for streaming responses.
+    Either way only one batch of rows is held in memory at a time.
+
+    Page tokens are opaque and kept server side (with a TTL), so clients
+    can never submit SQL of their own through them.
+
+    Every query runs under the SQLGuard guardrails (read-only transaction,
+    row cap, cost gate and statement timeout); a page carries the guard's
+    `execution` report.
+    """
+    def __init__(self, page_size: int = None, max_page_size: int = None, fetch_batch_rows: int = None,
+                 token_ttl_seconds: int = None, max_tokens: int = 1000, guard: SQLGuard = None):
+        pager_config = config.get("result_pager", {})
+        self.page_size = page_size or pager_config.get("page_size", 50)
+        self.max_page_size = max_page_size or pager_config.get("max_page_size", 1000)
+        self.fetch_batch_rows = fetch_batch_rows or pager_config.get("fetch_batch_rows", 500)
+        token_ttl_seconds = token_ttl_seconds or pager_config.get("page_token_ttl_seconds", 900)
+        self._tokens = TTLCache(maxsize=max_tokens, ttl=token_ttl_seconds)
+        self._lock = threading.Lock()
+        self.guard = guard or SQLGuard()
+
+    def resolve_page_size(self, page_size: int = None) -> int:
+        """Returns the requested page size clamped to [1, max_page_size], or the default."""
+        if not page_size:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def _issue_token(self, state: dict) -> str:
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._tokens[token] = state
+        return token
+
+    def resume(self, page_token: str) -> dict:
+        """
+        Returns the state stored for a page token: the `user_query`,
+        `connection_string`, `sql` and the row `offset` to resume at.
+        Raises KeyError for unknown or expired tokens.
+        """
+        with self._lock:
+            state = self._tokens.get(page_token)
+        if state is None:
+            raise KeyError(page_token)
+        return dict(state)
+
+    def _page(self, rows: list, state: dict, page_size: int, execution: dict) -> dict:
+        # One row beyond the page is read only to learn whether another page exists
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        page_token = None
+        if has_more:
+            page_token = self._issue_token({**state, "offset": state["offset"] + page_size})
+        return {
+            "rows": rows,
+            "pagination": {
+                "offset": state["offset"], "returned": len(rows),
+                "has_more": has_more, "page_token": page_token,
+            },
+            "execution": execution,
+        }
+
+    def _partition_size(self, page_size: int) -> int:
+        return min(self.fetch_batch_rows, page_size + 1)
+
+    def fetch_page(self, sql_query: str, connection_string: str, offset: int = 0, page_size: int = None, user_query: str = None) -> dict:
+        """
+        Runs a query on the pooled sync engine and returns the page starting
+        at `offset` as {"rows": [...], "pagination": {...}, "execution": {...}}.
+        Earlier rows are skipped on the cursor, so any SELECT can be paged
+        without rewriting it. Raises SQLGuardError for refused queries.
+        """
+        page_size = self.resolve_page_size(page_size)
+        wanted = offset + page_size + 1
+        rows = []
+        with get_engine(connection_string).connect() as conn:
+            with self.guard.session(conn, sql_query) as statement:
+                result = conn.execution_options(stream_results=True, max_row_buffer=self.fetch_batch_rows).execute(text(statement.sql))
+                seen = 0
+                for partition in result.partitions(self._partition_size(page_size)):
+                    rows.extend(_rows(partition[max(0, offset - seen):wanted - seen]))
+                    seen += len(partition)
+                    if seen >= wanted:
+                        break
+                result.close()
+        state = {"user_query": user_query, "connection_string": connection_string, "sql": sql_query, "offset": offset}
+        return self._page(rows, state, page_size, statement.report)
+
+    async def afetch_page(self, sql_query: str, connection_string: str, offset: int = 0, page_size: int = None, user_query: str = None) -> dict:
+        """
+        Async counterpart of `fetch_page` on the async driver, falling back
+        to the sync engine in a worker thread when there is none.
+        """
+        async_engine = get_async_engine(connection_string)
+        if async_engine is None:
+            return await asyncio.to_thread(self.fetch_page, sql_query, connection_string, offset, page_size, user_query)
+
+        page_size = self.resolve_page_size(page_size)
+        wanted = offset + page_size + 1
+        rows = []
+        async with async_engine.connect() as conn:
+            async with self.guard.asession(conn, sql_query) as statement:
+                result = await conn.stream(text(statement.sql))
+                seen = 0
+                async for partition in result.partitions(self._partition_size(page_size)):
+                    rows.extend(_rows(partition[max(0, offset - seen):wanted - seen]))
+                    seen += len(partition)
+                    if seen >= wanted:
+                        break
+                await result.close()
+        state = {"user_query": user_query, "connection_string": connection_string, "sql": sql_query, "offset": offset}
+        return self._page(rows, state, page_size, statement.report)
+
+    def iter_batches(self, sql_query: str, connection_string: str, execution: dict = None):
+        """
+        Yields every row of a query in batches of at most `fetch_batch_rows`
+        dictionaries. The guard's report is copied into `execution`, when
+        given, as soon as the query is admitted and again once it finishes.
+        """
+        with get_engine(connection_string).connect() as conn:
+            with self.guard.session(conn, sql_query) as statement:
+                if execution is not None:
+                    execution.update(statement.report)
+                result = conn.execution_options(stream_results=True, max_row_buffer=self.fetch_batch_rows).execute(text(statement.sql))
+                partitions = result.partitions(self.fetch_batch_rows)
+                while True:
+                    statement.renew()
+                    batch = next(partitions, None)
+                    if batch is None:
+                        break
+                    yield _rows(batch)
+            if execution is not None:
+                execution.update(statement.report)
+
+    async def aiter_batches(self, sql_query: str, connection_string: str, execution: dict = None):
+        """Async counterpart of `iter_batches`, used for streaming responses."""
+        async_engine = get_async_engine(connection_string)
+        if async_engine is not None:
+            async with async_engine.connect() as conn:
+                async with self.guard.asession(conn, sql_query) as statement:
+                    if execution is not None:
+                        execution.update(statement.report)
+                    result = await conn.stream(text(statement.sql))
+                    partitions = result.partitions(self.fetch_batch_rows).__aiter__()
+                    while True:
+                        statement.renew()
+                        batch = await anext(partitions, None)
+                        if batch is None:
+                            break
+                        yield _rows(batch)
+                if execution is not None:
+                    execution.update(statement.report)
+            return
+
+        # The sync cursor is driven from one dedicated thread, since DBAPI
+        # connections must not hop between threads mid-query
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-stream")
+        batches = self.iter_batches(sql_query, connection_string, execution)
+        try:
+            while True:
+                batch = await loop.run_in_executor(executor, next, batches, None)
+                if batch is None:
+                    break
+                yield batch
+        finally:
+            await loop.run_in_executor(executor, batches.close)
+            executor.shutdown(wait=False)
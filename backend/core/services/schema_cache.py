@@ -0,0 +1,181 @@
+import json
+import os
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional
+from ..config import config, resolve_path
+from .schema_discovery import SNAPSHOT_KEYS, SchemaDiscovery
+
+# Bump this whenever the shape of the discovered schema changes so that
+# stale entries persisted by an older build are discarded on load.
+SCHEMA_CACHE_FORMAT_VERSION = 2
+
+class SchemaCache:
+    """
+    Caches discovered database schemas per connection string, so the
+    inspector round trips in SchemaDiscovery only happen on a cold start,
+    when the schema has changed, or when a refresh is explicitly requested.
+    Entries are persisted to disk so a warm restart can skip discovery.
+
+    Once an entry's TTL expires, the schema fingerprint (one catalog
+    query) is compared with the one taken at discovery: an unchanged
+    schema is kept as is, and a changed one has only its new and changed
+    tables re-inspected. Databases without a fingerprint are rediscovered
+    in full. A forced refresh always rediscovers everything, including any
+    sample-row snapshots.
+    """
+    def __init__(self, ttl_seconds: int = None, cache_path: str = None, discovery: SchemaDiscovery = None):
+        query_engine_config = config.get("query_engine", {})
+        data_paths = config.get("data_paths", {})
+
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else query_engine_config.get("cache_ttl_seconds", 300)
+        path = cache_path or data_paths.get("schema_cache")
+        self.cache_path = resolve_path(path) if path else None
+        self.discovery = discovery or SchemaDiscovery()
+
+        self._entries = {}
+        # Guards the entries and schema.json; discovery runs under a lock per connection
+        # string instead, so a slow database never blocks lookups for the others
+        self._lock = threading.Lock()
+        self._connection_locks = {}
+        self._load()
+
+    @staticmethod
+    def _key(connection_string: str) -> str:
+        """Hashes the connection string so credentials never end up in schema.json."""
+        return hashlib.sha256(connection_string.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def compute_version(schema: dict) -> str:
+        """
+        Returns a short, stable fingerprint of a discovered schema's structure.
+        Data snapshots are excluded, so the version (and the query results
+        cached under it) only changes with the structure, never with the data.
+        """
+        structure = {
+            **schema,
+            "tables": [
+                {key: value for key, value in table.items() if key not in SNAPSHOT_KEYS}
+                for table in schema.get("tables", [])
+            ],
+        }
+        canonical = json.dumps(structure, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    def _is_fresh(self, entry: dict) -> bool:
+        return (time.time() - entry["discovered_at"]) < self.ttl_seconds
+
+    def _load(self):
+        """Loads persisted entries, ignoring files written in an older format."""
+        if not self.cache_path or not self.cache_path.exists():
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                payload = json.load(f)
+            if payload.get("format_version") != SCHEMA_CACHE_FORMAT_VERSION:
+                return
+            self._entries = payload.get("entries", {})
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load schema cache from {self.cache_path}: {e}")
+            self._entries = {}
+
+    def _persist(self):
+        """Writes all entries to disk atomically (write to a temp file, then rename)."""
+        if not self.cache_path:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = Path(f"{self.cache_path}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"format_version": SCHEMA_CACHE_FORMAT_VERSION, "entries": self._entries}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Warning: Could not persist schema cache to {self.cache_path}: {e}")
+
+    def _connection_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._connection_locks.setdefault(key, threading.Lock())
+
+    def _apply_changes(self, connection_string: str, schema: dict, fingerprint: dict, previous: dict) -> dict:
+        """
+        Brings a cached schema up to date with a new fingerprint: re-inspects
+        the tables that are new or whose hash changed and drops those that
+        no longer exist. Returns the updated schema or an error dictionary.
+        """
+        changed = [name for name, table_hash in fingerprint.items() if previous.get(name) != table_hash]
+        tables = {table["name"]: table for table in schema.get("tables", [])}
+        if changed:
+            inspected = self.discovery.analyze_database(connection_string, tables=changed)
+            if "error" in inspected:
+                return inspected
+            tables.update({table["name"]: table for table in inspected["tables"]})
+        return {**schema, "tables": [tables[name] for name in sorted(tables) if name in fingerprint]}
+
+    def get_schema(self, connection_string: str, force_refresh: bool = False) -> dict:
+        """
+        Returns the schema for a connection string. A fresh cached entry is
+        returned as is; otherwise the schema fingerprint decides whether
+        anything needs to be re-inspected.
+
+        Returns:
+            The discovered schema, or an error dictionary (errors are never cached).
+        """
+        if not connection_string:
+            return {"error": "Connection string cannot be empty."}
+
+        key = self._key(connection_string)
+        with self._connection_lock(key):
+            entry = self._entries.get(key)
+            if entry and not force_refresh and self._is_fresh(entry):
+                return entry["schema"]
+
+            # Taken before any inspection, so a change made meanwhile is seen by the next check
+            fingerprint = self.discovery.fingerprint(connection_string)
+            if entry and not force_refresh and fingerprint is not None and entry.get("fingerprint") is not None:
+                if fingerprint == entry["fingerprint"]:
+                    # Unchanged: trust the entry for another TTL (not persisted; a restart just checks again)
+                    entry["discovered_at"] = time.time()
+                    return entry["schema"]
+                schema = self._apply_changes(connection_string, entry["schema"], fingerprint, entry["fingerprint"])
+            else:
+                schema = self.discovery.analyze_database(connection_string)
+            if "error" in schema:
+                return schema
+
+            with self._lock:
+                self._entries[key] = {
+                    "schema": schema,
+                    "version": self.compute_version(schema),
+                    "fingerprint": fingerprint,
+                    "discovered_at": time.time(),
+                }
+                self._persist()
+            return schema
+
+    def get_version(self, connection_string: str) -> Optional[str]:
+        """Returns the fingerprint of the cached schema, or None if nothing is cached."""
+        entry = self._entries.get(self._key(connection_string))
+        return entry["version"] if entry else None
+
+    def get_latest(self) -> Optional[dict]:
+        """Returns the most recently discovered schema across all connections."""
+        with self._lock:
+            if not self._entries:
+                return None
+            latest = max(self._entries.values(), key=lambda entry: entry["discovered_at"])
+        return latest["schema"]
+
+    def invalidate(self, connection_string: str = None):
+        """Drops the entry for one connection string, or every entry if none is given."""
+        with self._lock:
+            if connection_string is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(connection_string), None)
+            self._persist()
+
+# Create a single, shared instance of the schema cache that is used by
+# both the ingestion routes and the query engine.
+schema_cache = SchemaCache()
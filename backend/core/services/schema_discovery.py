@@ -1,17 +1,130 @@
-from sqlalchemy import create_engine, inspect
+import hashlib
+import datetime
+from collections import Counter
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import inspect, text
 from sqlalchemy.exc import SQLAlchemyError
+from ..config import config
+from .engine_registry import get_engine
+
+# Per-table keys holding data snapshots rather than structure; they do not change the schema version
+SNAPSHOT_KEYS = ("sample_rows", "column_stats")
+# Column types summarized by their range rather than by their most common values
+_RANGE_TYPES = ("INT", "NUMERIC", "DECIMAL", "REAL", "FLOAT", "DOUBLE", "MONEY", "BIGINT", "SMALLINT", "DATE", "TIME")
+_MAX_VALUE_LENGTH = 100
+_TOP_VALUES = 5
+
+# One catalog query for the whole database: each table's columns with their types, and its
+# primary and foreign key definitions (which name the referred tables), in a stable order
+_POSTGRES_FINGERPRINT_QUERY = """
+    SELECT c.relname AS table_name, md5(
+        coalesce((SELECT string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod), ',' ORDER BY a.attnum)
+                  FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped), '')
+        || '|' ||
+        coalesce((SELECT string_agg(pg_get_constraintdef(k.oid), ',' ORDER BY k.conname)
+                  FROM pg_constraint k WHERE k.conrelid = c.oid AND k.contype IN ('p', 'f')), '')
+    ) AS table_hash
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+    ORDER BY c.relname
+"""
+# SQLite keeps each table's current CREATE statement, which ALTER TABLE rewrites
+_SQLITE_FINGERPRINT_QUERY = """
+    SELECT name, sql FROM sqlite_master
+    WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+    ORDER BY name
+"""
+
+def _snapshot_value(value):
+    """Converts a sampled value into something JSON can hold, truncating long text."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return None
+    value = str(value)
+    return value if len(value) <= _MAX_VALUE_LENGTH else value[:_MAX_VALUE_LENGTH] + "..."
+
+def _column_stats(column: dict, values: list) -> dict:
+    """Summarizes one column of the sampled rows: nulls, distinct values, and its range or most common values."""
+    present = [value for value in values if value is not None]
+    stats = {"sampled": len(values), "nulls": len(values) - len(present), "distinct": len(set(map(repr, present)))}
+    if not present:
+        return stats
+    if str(column["type"]).upper().startswith(_RANGE_TYPES):
+        try:
+            stats["min"], stats["max"] = min(present), max(present)
+            return stats
+        except TypeError:
+            pass
+    stats["top_values"] = [value for value, _ in Counter(present).most_common(_TOP_VALUES)]
+    return stats
 
 class SchemaDiscovery:
     """
     Connects to a database and automatically discovers its schema,
     including tables, columns, data types, and relationships.
+
+    Columns and keys are read in bulk for all requested tables, rather
+    than with one inspector call per table. Data snapshots are opt-in
+    (`database.schema_snapshots`): each inspected table then also gets at
+    most `database.sample_rows_limit` sample rows, with column
+    statistics computed over them, at the cost of one query per table.
+    `fingerprint` detects changes with a single catalog query, so callers
+    can re-inspect (and re-sample) only changed tables.
     """
-    def analyze_database(self, connection_string: str) -> dict:
+    def __init__(self, sample_rows_limit: int = None, snapshots: bool = None):
+        database_config = config.get("database", {})
+        self.sample_rows_limit = sample_rows_limit if sample_rows_limit is not None else database_config.get("sample_rows_limit", 5)
+        self.snapshots = snapshots if snapshots is not None else database_config.get("schema_snapshots", False)
+
+    def fingerprint(self, connection_string: str) -> Optional[dict]:
+        """
+        Returns a hash of each table's structure, keyed by table name, from
+        one catalog query (pg_catalog on PostgreSQL, sqlite_master on SQLite).
+        Returns None for other databases or when the catalog cannot be read,
+        in which case changes can only be found by a full discovery.
+        """
+        if not connection_string:
+            return None
+        try:
+            engine = get_engine(connection_string)
+            with engine.connect() as conn:
+                if engine.dialect.name == "postgresql":
+                    return {name: table_hash for name, table_hash in conn.execute(text(_POSTGRES_FINGERPRINT_QUERY))}
+                if engine.dialect.name == "sqlite":
+                    return {
+                        name: hashlib.sha256((sql or "").encode("utf-8")).hexdigest()[:16]
+                        for name, sql in conn.execute(text(_SQLITE_FINGERPRINT_QUERY))
+                    }
+        except SQLAlchemyError as e:
+            print(f"Warning: Could not read the schema fingerprint: {e}")
+        return None
+
+    def _snapshot(self, engine, table_info: dict):
+        """Adds sample rows and column statistics computed over them to a table."""
+        quoted = engine.dialect.identifier_preparer.quote(table_info["name"])
+        with engine.connect() as conn:
+            result = conn.execute(text(f"SELECT * FROM {quoted} LIMIT :limit"), {"limit": int(self.sample_rows_limit)})
+            rows = [{key: _snapshot_value(value) for key, value in row._mapping.items()} for row in result]
+        table_info["sample_rows"] = rows
+        table_info["column_stats"] = {
+            column["name"]: _column_stats(column, [row.get(column["name"]) for row in rows])
+            for column in table_info["columns"]
+        }
+
+    def analyze_database(self, connection_string: str, tables: list = None) -> dict:
         """
         Analyzes the database schema from a given connection string.
 
         Args:
             connection_string: The database connection string provided by the user.
+            tables: Only inspect these tables (those that still exist), e.g.
+                the ones whose fingerprint changed. All tables by default.
 
         Returns:
             A dictionary representing the discovered schema, or an error dictionary.
@@ -20,46 +133,51 @@ class SchemaDiscovery:
             return {"error": "Connection string cannot be empty."}
 
         try:
-            # Create a database engine from the connection string
-            engine = create_engine(connection_string)
+            # Reuse the pooled engine for this connection string
+            engine = get_engine(connection_string)
             # Create an inspector object to explore the database
             inspector = inspect(engine)
-            
-            schema_info = {"tables": []}
-            table_names = inspector.get_table_names()
 
-            for table_name in table_names:
+            # Columns, primary keys and foreign keys of every table in one bulk read each,
+            # keyed by (schema, table name)
+            filter_names = list(tables) if tables is not None else None
+            all_columns = inspector.get_multi_columns(filter_names=filter_names)
+            primary_keys = inspector.get_multi_pk_constraint(filter_names=filter_names)
+            foreign_keys = inspector.get_multi_foreign_keys(filter_names=filter_names)
+
+            schema_info = {"tables": []}
+            for key in sorted(all_columns, key=lambda key: key[1]):
+                table_name = key[1]
                 table_info = {
                     "name": table_name,
                     "columns": [],
                     "foreign_keys": []
                 }
-                
-                # Get the primary key constraint for the current table
-                pk_constraint = inspector.get_pk_constraint(table_name)
-                primary_key_columns = pk_constraint.get('constrained_columns', [])
-
-                # Get all columns for the current table
-                columns = inspector.get_columns(table_name)
-                for column in columns:
-                    is_primary = column['name'] in primary_key_columns
+
+                primary_key_columns = (primary_keys.get(key) or {}).get('constrained_columns', [])
+                for column in all_columns[key]:
                     table_info["columns"].append({
                         "name": column['name'],
                         "type": str(column['type']),
-                        "is_primary_key": is_primary
+                        "is_primary_key": column['name'] in primary_key_columns
                     })
 
-                # Get all foreign keys for the current table
-                foreign_keys = inspector.get_foreign_keys(table_name)
-                for fk in foreign_keys:
+                for fk in foreign_keys.get(key, []):
                     table_info["foreign_keys"].append({
                         "constrained_columns": fk['constrained_columns'],
                         "referred_table": fk['referred_table'],
                         "referred_columns": fk['referred_columns']
                     })
-                
+
+                if self.snapshots and self.sample_rows_limit:
+                    try:
+                        self._snapshot(engine, table_info)
+                    except SQLAlchemyError as e:
+                        # A table we cannot read is still part of the schema
+                        print(f"Warning: Could not sample table {table_name}: {e}")
+
                 schema_info["tables"].append(table_info)
-            
+
             return schema_info
 
         except SQLAlchemyError as e:
@@ -68,4 +186,3 @@ class SchemaDiscovery:
         except Exception as e:
             # Handle any other unexpected errors
             return {"error": f"An unexpected error occurred: {str(e)}"}
-
@@ -0,0 +1,186 @@
+import re
+import threading
+import numpy as np
+from ..config import config
+from .vector_index import normalize
+
+_IDENTIFIER_TOKEN_PATTERN = re.compile(r"[a-z]+|\d+")
+
+def _stem(token: str) -> str:
+    """A crude plural stripper, enough to match "salaries" to "salary" or "departments" to "department"."""
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("s") and not token.endswith("ss") and len(token) > 3:
+        return token[:-1]
+    return token
+
+def name_tokens(text: str) -> set:
+    """Splits free text or snake_case/camelCase identifiers into stemmed lowercase words."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text).lower()
+    return {_stem(token) for token in _IDENTIFIER_TOKEN_PATTERN.findall(text) if len(token) > 1}
+
+def _example_value(value) -> str:
+    if isinstance(value, str):
+        value = value if len(value) <= 40 else value[:40] + "..."
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+def _column_examples(table: dict, references: dict, examples: int) -> str:
+    """
+    Summarizes a table's sampled values as a comment line, e.g.
+    `-- office_location: 'New York', 'Chicago'; annual_salary: 45000.0 to 219000.0`,
+    so the model can match literals and ranges. Key columns are left out.
+    """
+    parts = []
+    column_stats = table.get("column_stats") or {}
+    for column in table.get("columns", []):
+        stats = column_stats.get(column["name"])
+        if not stats or column.get("is_primary_key") or column["name"] in references:
+            continue
+        if "min" in stats:
+            parts.append(f"{column['name']}: {_example_value(stats['min'])} to {_example_value(stats['max'])}")
+        elif stats.get("top_values"):
+            parts.append(f"{column['name']}: " + ", ".join(_example_value(value) for value in stats["top_values"][:examples]))
+    return "  -- " + "; ".join(parts) if parts else ""
+
+def schema_to_ddl(schema: dict, examples: int = None) -> str:
+    """
+    Serializes a discovered schema as compact, DDL-like lines, e.g.
+    `employees(emp_id INTEGER PK, dept_id INTEGER -> departments.dept_id)`,
+    which costs a fraction of the tokens of the indented JSON form. Tables
+    with column statistics get a comment line with up to `examples` sample
+    values per column (`schema_linking.column_examples`; 0 disables it).
+    """
+    if examples is None:
+        examples = config.get("schema_linking", {}).get("column_examples", 3)
+    lines = []
+    for table in schema.get("tables", []):
+        references = {}
+        for fk in table.get("foreign_keys", []):
+            for column, referred in zip(fk["constrained_columns"], fk["referred_columns"]):
+                references[column] = f"{fk['referred_table']}.{referred}"
+
+        columns = []
+        for column in table.get("columns", []):
+            definition = f"{column['name']} {column['type']}"
+            if column.get("is_primary_key"):
+                definition += " PK"
+            if column["name"] in references:
+                definition += f" -> {references[column['name']]}"
+            columns.append(definition)
+        lines.append(f"{table['name']}({', '.join(columns)})")
+        if examples:
+            example_line = _column_examples(table, references, examples)
+            if example_line:
+                lines.append(example_line)
+    return "\n".join(lines)
+
+class SchemaLinker:
+    """
+    Selects the part of a database schema that is relevant to a question, so
+    that SQL generation prompts stay small on large databases. Tables are
+    scored by name overlap with the question and, when an embedding model is
+    supplied, by cosine similarity between the question and each table's
+    name and column names. The best tables are kept together with their
+    foreign-key neighbours, which the generated joins usually need, up to
+    `max_tables` tables in all.
+    """
+    def __init__(self, max_tables: int = None, fk_hops: int = None, min_score: float = None, prune_above_tables: int = None):
+        linking_config = config.get("schema_linking", {})
+        self.max_tables = max_tables or linking_config.get("max_tables", 5)
+        self.fk_hops = fk_hops if fk_hops is not None else linking_config.get("fk_hops", 1)
+        self.min_score = min_score if min_score is not None else linking_config.get("min_score", 0.3)
+        # Schemas this small are always sent whole; pruning them saves little and risks dropping a table
+        self.prune_above_tables = prune_above_tables if prune_above_tables is not None else linking_config.get("prune_above_tables", 8)
+
+        # Table embeddings per schema version; recomputed only when the schema changes
+        self._table_embeddings = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _table_description(table: dict) -> str:
+        columns = " ".join(column["name"] for column in table.get("columns", []))
+        return f"{table['name']} {columns}".replace("_", " ")
+
+    def _lexical_scores(self, user_query: str, tables: list) -> np.ndarray:
+        """Scores 1.0 for a table named in the question and 0.5 for a mentioned column."""
+        query_tokens = name_tokens(user_query)
+        scores = np.zeros(len(tables), dtype=np.float32)
+        for position, table in enumerate(tables):
+            if name_tokens(table["name"]) & query_tokens:
+                scores[position] = 1.0
+            elif any(name_tokens(column["name"]) & query_tokens for column in table.get("columns", [])):
+                scores[position] = 0.5
+        return scores
+
+    def _semantic_scores(self, tables: list, schema_version: str, encode, query_embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity between the question and each table description."""
+        with self._lock:
+            table_embeddings = self._table_embeddings.get(schema_version) if schema_version else None
+        if table_embeddings is None:
+            table_embeddings = normalize(encode([self._table_description(table) for table in tables]))
+            if schema_version:
+                with self._lock:
+                    # Only the latest schema version is worth keeping
+                    self._table_embeddings = {schema_version: table_embeddings}
+        return table_embeddings @ query_embedding
+
+    def _expand_with_neighbours(self, selected: set, tables: list, scores: np.ndarray) -> set:
+        """
+        Adds the tables reachable over foreign keys, in both directions, within
+        `fk_hops` hops, until `max_tables` tables are selected. Nearer hops go
+        first, and within a hop the neighbours that score best for the question.
+        """
+        neighbours = {table["name"]: set() for table in tables}
+        for table in tables:
+            for fk in table.get("foreign_keys", []):
+                if fk["referred_table"] in neighbours:
+                    neighbours[table["name"]].add(fk["referred_table"])
+                    neighbours[fk["referred_table"]].add(table["name"])
+        position_of = {table["name"]: position for position, table in enumerate(tables)}
+
+        expanded = set(selected)
+        frontier = set(selected)
+        for _ in range(self.fk_hops):
+            candidates = {neighbour for name in frontier for neighbour in neighbours[name]} - expanded
+            ranked = sorted(candidates, key=lambda name: (-scores[position_of[name]], position_of[name]))
+            frontier = set(ranked[:max(0, self.max_tables - len(expanded))])
+            if not frontier:
+                break
+            expanded |= frontier
+        return expanded
+
+    def link(self, user_query: str, schema: dict, schema_version: str = None, encode=None, query_embedding: np.ndarray = None) -> dict:
+        """
+        Returns the subset of the schema relevant to the question.
+
+        Args:
+            schema_version: The schema cache version, used to reuse table embeddings.
+            encode: An optional `SentenceTransformer.encode`-like callable for semantic scoring.
+            query_embedding: The question's normalized embedding, if the caller already has it.
+
+        Returns:
+            A schema dictionary with only the selected tables (the full schema
+            if it is small or nothing in it matched the question).
+        """
+        tables = schema.get("tables", [])
+        if len(tables) <= self.prune_above_tables:
+            return schema
+
+        scores = self._lexical_scores(user_query, tables)
+        if encode is not None:
+            try:
+                if query_embedding is None:
+                    query_embedding = normalize(encode([user_query]))[0]
+                scores = np.maximum(scores, self._semantic_scores(tables, schema_version, encode, query_embedding))
+            except Exception as e:
+                print(f"Warning: Semantic schema linking failed, using name matching only: {e}")
+
+        ranked = [position for position in np.argsort(-scores, kind="stable") if scores[position] >= self.min_score]
+        if not ranked:
+            return schema
+
+        selected = {tables[position]["name"] for position in ranked[:self.max_tables]}
+        selected = self._expand_with_neighbours(selected, tables, scores)
+        # Keep the original table order so the prompt is stable for the same selection
+        return {**schema, "tables": [table for table in tables if table["name"] in selected]}
@@ -0,0 +1,329 @@
+import re
+import json
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from ..config import config
+
+# Statements that write, change the schema, or reach outside the database
+_FORBIDDEN_KEYWORDS = (
+    "INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "DROP", "CREATE", "ALTER", "TRUNCATE",
+    "GRANT", "REVOKE", "ATTACH", "DETACH", "PRAGMA", "VACUUM", "REINDEX", "ANALYZE", "COPY", "CALL",
+    "EXECUTE", "DO", "LOCK", "SET", "RESET", "LISTEN", "NOTIFY", "COMMIT", "ROLLBACK", "SAVEPOINT",
+)
+_FORBIDDEN_PATTERN = re.compile(r"\b(" + "|".join(_FORBIDDEN_KEYWORDS) + r")\b", re.IGNORECASE)
+# String literals and comments, and quoted identifiers, whose contents must not be mistaken for keywords
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_MASK_PATTERN = re.compile(_LITERAL_PATTERN.pattern + r"|\"(?:[^\"]|\"\")*\"", re.DOTALL)
+_TRAILING_LIMIT_PATTERN = re.compile(r"\bLIMIT\s+(\d+)(?:\s+OFFSET\s+\d+)?\s*$", re.IGNORECASE)
+# Clauses after which a LIMIT cannot simply be appended
+_ROW_CLAUSE_PATTERN = re.compile(r"\b(LIMIT|OFFSET|FETCH|FOR)\b", re.IGNORECASE)
+_PARENTHESIZED_PATTERN = re.compile(r"\([^()]*\)")
+# Table references and their aliases, to map SQLite plan lines ("SCAN e") back to tables
+# (commas catch "FROM a, b"; the select-list matches they also produce are never looked up)
+_TABLE_REFERENCE_PATTERN = re.compile(r"(?:\bFROM\b|\bJOIN\b|,)\s*(\"[^\"]+\"|[\w.]+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_NOT_ALIASES = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "limit", "offset", "union", "except", "intersect", "having", "window",
+}
+_SQLITE_PLAN_PATTERN = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\S+)")
+
+class SQLGuardError(SQLAlchemyError):
+    """A query was refused (or cancelled) by the execution guardrails."""
+
+def _blank(match) -> str:
+    return " " * len(match.group())
+
+def _top_level(statement: str) -> str:
+    """
+    Blanks out literals, comments, quoted identifiers and everything in
+    parentheses (subqueries, function arguments), keeping every position,
+    so only the clauses of the outermost query remain.
+    """
+    masked = _MASK_PATTERN.sub(_blank, statement)
+    while True:
+        unnested = _PARENTHESIZED_PATTERN.sub(_blank, masked)
+        if unnested == masked:
+            return masked
+        masked = unnested
+
+def _strip_statement(sql_query: str) -> str:
+    """Removes the trailing semicolon the LLM usually appends."""
+    return sql_query.strip().rstrip(";").strip()
+
+class GuardedStatement:
+    """
+    One statement running under the guardrails: the `sql` to execute (with
+    the row cap applied) and the `report` returned with its results.
+    """
+    def __init__(self, sql: str, report: dict, timeout_seconds: float):
+        self.sql = sql
+        self.report = report
+        self.timeout_seconds = timeout_seconds
+        self.started = time.perf_counter()
+        self.deadline = None
+
+    def renew(self):
+        """
+        Restarts the SQLite statement timeout. Called before each batch of a
+        streamed result, so the time a client spends reading does not count,
+        as with the per-fetch statement_timeout of PostgreSQL.
+        """
+        if self.timeout_seconds:
+            self.deadline = time.monotonic() + self.timeout_seconds
+
+    def _interrupt(self) -> int:
+        # SQLite progress handler: a non-zero return aborts the running statement
+        return int(self.deadline is not None and time.monotonic() > self.deadline)
+
+    def finish(self):
+        self.report["execution_seconds"] = round(time.perf_counter() - self.started, 4)
+
+class SQLGuard:
+    """
+    The guardrails every generated query runs under:
+
+    - Only a single, read-only SELECT (or WITH ... SELECT) is accepted, and
+      it runs in a read-only transaction (`SET TRANSACTION READ ONLY` on
+      PostgreSQL, `PRAGMA query_only` on SQLite).
+    - A query without a LIMIT at or below `max_result_rows` gets one, so
+      no query can return more rows than that.
+    - `EXPLAIN` estimates the query's cost first; queries over the
+      `max_plan_cost` budget are refused before they run. PostgreSQL
+      reports the planner's total cost; for SQLite the cost is the number
+      of rows its plan visits, estimated from table sizes.
+    - A statement timeout cancels whatever still runs too long
+      (`statement_timeout` on PostgreSQL, a progress handler on SQLite).
+
+    Other databases get the validation and the row cap only.
+    """
+    def __init__(self, statement_timeout_seconds: float = None, max_result_rows: int = None, max_plan_cost: float = None,
+                 read_only: bool = None, explain: bool = None):
+        guard_config = config.get("sql_guard", {})
+        self.statement_timeout_seconds = statement_timeout_seconds if statement_timeout_seconds is not None else guard_config.get("statement_timeout_seconds", 30)
+        self.max_result_rows = max_result_rows if max_result_rows is not None else guard_config.get("max_result_rows", 10000)
+        self.max_plan_cost = max_plan_cost if max_plan_cost is not None else guard_config.get("max_plan_cost", 5_000_000)
+        self.read_only = read_only if read_only is not None else guard_config.get("read_only", True)
+        self.explain = explain if explain is not None else guard_config.get("explain", True)
+
+    @staticmethod
+    def validate(sql_query: str) -> str:
+        """Returns the statement without its trailing semicolon, or raises SQLGuardError if it is not a single read-only query."""
+        statement = _strip_statement(sql_query)
+        masked = _MASK_PATTERN.sub(" ", statement)
+        if ";" in masked:
+            raise SQLGuardError("Only a single SQL statement can be executed.")
+        first_word = masked.split(None, 1)[0].upper() if masked.strip() else ""
+        if first_word not in ("SELECT", "WITH"):
+            raise SQLGuardError("Only read-only SELECT queries can be executed.")
+        forbidden = _FORBIDDEN_PATTERN.search(masked)
+        if forbidden:
+            raise SQLGuardError(f"Only read-only SELECT queries can be executed; found {forbidden.group(1).upper()}.")
+        return statement
+
+    def apply_row_limit(self, statement: str) -> tuple:
+        """
+        Returns the statement capped at `max_result_rows` rows and the cap, or
+        the statement and None if it already is. The cap goes on the outermost
+        query itself: a missing LIMIT is appended and a larger one lowered.
+        Only queries ending in other row clauses (FETCH, FOR ...) are wrapped
+        in a subquery, which loses the inner ORDER BY guarantee and fails on
+        duplicate column names in SQLite.
+        """
+        if not self.max_result_rows:
+            return statement, None
+        limit = int(self.max_result_rows)
+        top_level = _top_level(statement)
+        existing = _TRAILING_LIMIT_PATTERN.search(top_level)
+        if existing:
+            if int(existing.group(1)) <= limit:
+                return statement, None
+            start, end = existing.span(1)
+            return f"{statement[:start]}{limit}{statement[end:]}", limit
+        if not _ROW_CLAUSE_PATTERN.search(top_level):
+            if "--" in statement:
+                # A trailing line comment would swallow the appended clause
+                return f"{statement}\nLIMIT {limit}", limit
+            return f"{statement} LIMIT {limit}", limit
+        return f"SELECT * FROM ({statement}) AS guarded_query LIMIT {limit}", limit
+
+    def prepare(self, sql_query: str) -> GuardedStatement:
+        guarded_sql, row_limit = self.apply_row_limit(self.validate(sql_query))
+        report = {
+            "plan_cost": None,
+            "row_limit": row_limit,
+            "statement_timeout_seconds": self.statement_timeout_seconds or None,
+            "execution_seconds": None,
+        }
+        return GuardedStatement(guarded_sql, report, self.statement_timeout_seconds)
+
+    def _check_cost(self, statement: GuardedStatement, cost):
+        if cost is None:
+            return
+        statement.report["plan_cost"] = round(float(cost), 2)
+        if self.max_plan_cost and cost > self.max_plan_cost:
+            raise SQLGuardError(
+                f"Query refused: its estimated cost ({cost:,.0f}) exceeds the budget of {self.max_plan_cost:,.0f}. "
+                "Try a narrower question."
+            )
+
+    @staticmethod
+    def _postgres_cost(plan) -> float:
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]["Total Cost"]
+
+    @staticmethod
+    def _table_aliases(sql: str) -> dict:
+        """Maps every table name and alias in the query's FROM and JOIN clauses to its table."""
+        aliases = {}
+        for table, alias in _TABLE_REFERENCE_PATTERN.findall(_LITERAL_PATTERN.sub(" ", sql)):
+            table = table.strip('"')
+            aliases.setdefault(table, table)
+            if alias and alias.lower() not in _NOT_ALIASES:
+                aliases[alias] = table
+        return aliases
+
+    @staticmethod
+    def _sqlite_cost(plan_rows: list, aliases: dict, table_rows: dict) -> float:
+        """
+        Estimates the rows a SQLite plan visits. Sibling SCAN/SEARCH steps are
+        nested loops, so their factors multiply: a full scan visits every row
+        of its table, an index search about log2 of them. Materialized
+        subqueries and CTEs run once and add their own cost. LIMIT is
+        ignored, so this is an upper bound.
+        """
+        children = {}
+        for node_id, parent_id, _, detail in plan_rows:
+            children.setdefault(parent_id, []).append((node_id, detail))
+
+        def subtree_cost(parent_id) -> float:
+            loop, once = 1.0, 0.0
+            for node_id, detail in children.get(parent_id, []):
+                once += subtree_cost(node_id) if node_id in children else 0.0
+                step = _SQLITE_PLAN_PATTERN.match(detail)
+                if step is None:
+                    continue
+                rows = table_rows.get(aliases.get(step.group(2), step.group(2)), 1.0)
+                loop *= max(1.0, rows if step.group(1) == "SCAN" else math.log2(rows + 1))
+            return loop + once
+
+        return subtree_cost(0)
+
+    @staticmethod
+    def _plan_tables(plan_rows: list, aliases: dict) -> set:
+        """The tables a SQLite plan scans or searches."""
+        steps = (_SQLITE_PLAN_PATTERN.match(row[3]) for row in plan_rows)
+        return {aliases.get(step.group(2), step.group(2)) for step in steps if step}
+
+    @staticmethod
+    def _row_count_query(table: str):
+        """Approximates a table's row count by its largest rowid, which needs no scan."""
+        return text('SELECT MAX(rowid) FROM "' + table.replace('"', '""') + '"')
+
+    def _translate_error(self, statement: GuardedStatement, e: DBAPIError):
+        """Reports a statement cancelled by the timeout as such instead of as a driver error."""
+        message = str(e.orig) if e.orig is not None else str(e)
+        if "interrupted" in message or "statement timeout" in message:
+            return SQLGuardError(f"Query cancelled: it ran longer than the {self.statement_timeout_seconds}s statement timeout.")
+        return None
+
+    @contextmanager
+    def session(self, conn, sql_query: str):
+        """
+        Runs on a fresh pooled connection: validates and caps the query,
+        starts a read-only transaction with a statement timeout, gates the
+        query on its EXPLAIN cost and yields the GuardedStatement to execute.
+        The SQLite connection settings are reset before it returns to the pool.
+        """
+        statement = self.prepare(sql_query)
+        dialect = conn.dialect.name
+        raw = None
+        try:
+            if dialect == "postgresql":
+                if self.read_only:
+                    conn.execute(text("SET TRANSACTION READ ONLY"))
+                if self.statement_timeout_seconds:
+                    conn.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_seconds * 1000)}"))
+                if self.explain:
+                    self._check_cost(statement, self._postgres_cost(conn.execute(text(f"EXPLAIN (FORMAT JSON) {statement.sql}")).scalar()))
+            elif dialect == "sqlite":
+                raw = conn.connection.driver_connection
+                if self.read_only:
+                    conn.exec_driver_sql("PRAGMA query_only = ON")
+                if self.statement_timeout_seconds:
+                    statement.renew()
+                    raw.set_progress_handler(statement._interrupt, 1000)
+                if self.explain:
+                    plan_rows = conn.execute(text(f"EXPLAIN QUERY PLAN {statement.sql}")).fetchall()
+                    aliases = self._table_aliases(statement.sql)
+                    sizes = {}
+                    for table in self._plan_tables(plan_rows, aliases):
+                        try:
+                            sizes[table] = float(conn.execute(self._row_count_query(table)).scalar() or 0)
+                        except SQLAlchemyError:
+                            # Views, CTEs and WITHOUT ROWID tables have no rowid to go by
+                            pass
+                    self._check_cost(statement, self._sqlite_cost(plan_rows, aliases, sizes))
+            statement.started = time.perf_counter()
+            yield statement
+            statement.finish()
+        except DBAPIError as e:
+            translated = self._translate_error(statement, e)
+            if translated is None:
+                raise
+            raise translated from e
+        finally:
+            if raw is not None:
+                raw.set_progress_handler(None, 0)
+                if self.read_only:
+                    conn.exec_driver_sql("PRAGMA query_only = OFF")
+
+    @asynccontextmanager
+    async def asession(self, conn, sql_query: str):
+        """Async counterpart of `session` for an AsyncConnection."""
+        statement = self.prepare(sql_query)
+        dialect = conn.dialect.name
+        raw = None
+        try:
+            if dialect == "postgresql":
+                if self.read_only:
+                    await conn.execute(text("SET TRANSACTION READ ONLY"))
+                if self.statement_timeout_seconds:
+                    await conn.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_seconds * 1000)}"))
+                if self.explain:
+                    plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {statement.sql}"))).scalar()
+                    self._check_cost(statement, self._postgres_cost(plan))
+            elif dialect == "sqlite":
+                # aiosqlite runs the sqlite3 connection in its own thread; the handler is called there
+                raw = (await conn.get_raw_connection()).driver_connection
+                if self.read_only:
+                    await conn.exec_driver_sql("PRAGMA query_only = ON")
+                if self.statement_timeout_seconds:
+                    statement.renew()
+                    await raw.set_progress_handler(statement._interrupt, 1000)
+                if self.explain:
+                    plan_rows = (await conn.execute(text(f"EXPLAIN QUERY PLAN {statement.sql}"))).fetchall()
+                    aliases = self._table_aliases(statement.sql)
+                    sizes = {}
+                    for table in self._plan_tables(plan_rows, aliases):
+                        try:
+                            sizes[table] = float((await conn.execute(self._row_count_query(table))).scalar() or 0)
+                        except SQLAlchemyError:
+                            pass
+                    self._check_cost(statement, self._sqlite_cost(plan_rows, aliases, sizes))
+            statement.started = time.perf_counter()
+            yield statement
+            statement.finish()
+        except DBAPIError as e:
+            translated = self._translate_error(statement, e)
+            if translated is None:
+                raise
+            raise translated from e
+        finally:
+            if raw is not None:
+                await raw.set_progress_handler(None, 0)
+                if self.read_only:
+                    await conn.exec_driver_sql("PRAGMA query_only = OFF")
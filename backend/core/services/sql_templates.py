@@ -0,0 +1,187 @@
+import re
+from ..config import config
+from .schema_linker import name_tokens
+
+_NUMERIC_TYPES = ("INT", "NUMERIC", "DECIMAL", "REAL", "FLOAT", "DOUBLE", "MONEY", "BIGINT", "SMALLINT")
+_LABEL_WORDS = ("name", "title", "label")
+_AGGREGATES = {
+    "average": "AVG", "avg": "AVG", "mean": "AVG",
+    "total": "SUM", "sum": "SUM", "sum of": "SUM",
+    "maximum": "MAX", "max": "MAX", "highest": "MAX",
+    "minimum": "MIN", "min": "MIN", "lowest": "MIN",
+}
+# Words that may surround an entity or column name without changing its meaning
+_FILLER_WORDS = {"the", "all", "our", "each", "every", "current"}
+_GROUP = r"(?:\s+(?:by|per|in each|for each|grouped by|across)\s+(?P<group>[a-z_ ]+?))?"
+_ENTITY_FILLER = r"(?:\s+(?:are there|do we have|are employed|work here|exist|in total|overall))?"
+
+# "how many employees (are there) (per department)"
+_COUNT_PATTERN = re.compile(
+    r"^(?:how many|number of|count(?: of)?|total number of)\s+(?P<entity>[a-z_ ]+?)"
+    + _ENTITY_FILLER + _GROUP + r"\s*\??$"
+)
+# "(what is) (the) average salary (of employees) (by department)"
+_AGGREGATE_PATTERN = re.compile(
+    r"^(?:(?:what is|what's|what are|show|show me|give me|get|list)\s+)?(?:the\s+)?"
+    r"(?P<aggregate>" + "|".join(sorted(map(re.escape, _AGGREGATES), key=len, reverse=True)) + r")\s+"
+    r"(?:of\s+)?(?:the\s+)?(?P<measure>[a-z_ ]+?)(?:\s+(?:of|for)\s+(?:all\s+)?(?P<entity>[a-z_ ]+?))?"
+    + _GROUP + r"\s*\??$"
+)
+
+def _identifier(name: str) -> str:
+    """Quotes an identifier unless it is a plain lowercase name."""
+    if re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+def _column(table: str, column: str) -> str:
+    return f"{_identifier(table)}.{_identifier(column)}"
+
+class SQLTemplateEngine:
+    """
+    Answers the most common aggregate questions with SQL built directly
+    from the discovered schema, without calling the LLM: counts ("how many
+    employees", "number of employees per department") and
+    AVG/SUM/MAX/MIN of a numeric column ("average salary by department").
+    Grouping works on a column of the same table or on a table one
+    foreign key away, joined and labelled by its name column.
+
+    Only unambiguous questions are answered. A question with extra
+    conditions, or words that do not resolve to exactly one table or
+    column, is left to the LLM.
+    """
+    def __init__(self, enabled: bool = None):
+        router_config = config.get("intent_router", {})
+        self.enabled = enabled if enabled is not None else router_config.get("templates", True)
+
+    @staticmethod
+    def _normalize(user_query: str) -> str:
+        query = re.sub(r"[^\w\s?]", " ", user_query.lower())
+        return " ".join(query.split())
+
+    @staticmethod
+    def _words(text: str) -> set:
+        return name_tokens(text) - _FILLER_WORDS
+
+    @staticmethod
+    def _score(name: str, words: set) -> int:
+        """How many of `words` a table or column name covers; 0 unless it covers all of them."""
+        return len(words) if words and words <= name_tokens(name) else 0
+
+    @staticmethod
+    def _best(candidates: list):
+        """Returns the single best-scoring candidate, or None if there is none or a tie."""
+        candidates = sorted((c for c in candidates if c[0] > 0), key=lambda c: c[0], reverse=True)
+        if not candidates or (len(candidates) > 1 and candidates[0][0] == candidates[1][0]):
+            return None
+        return candidates[0][1]
+
+    def _find_table(self, schema: dict, words: str):
+        words = self._words(words)
+        return self._best([(self._score(table["name"], words), table) for table in schema.get("tables", [])])
+
+    def _find_measure(self, schema: dict, words: str, table: dict = None):
+        words = self._words(words)
+        candidates = []
+        for candidate_table in ([table] if table else schema.get("tables", [])):
+            for column in candidate_table.get("columns", []):
+                if column.get("is_primary_key") or not str(column["type"]).upper().startswith(_NUMERIC_TYPES):
+                    continue
+                candidates.append((self._score(column["name"], words), (candidate_table, column)))
+        return self._best(candidates)
+
+    @staticmethod
+    def _label_column(table: dict) -> str:
+        """The column that names a table's rows: a *name/title/label column, else the first non-key column."""
+        columns = table.get("columns", [])
+        for column in columns:
+            if any(word in column["name"].lower() for word in _LABEL_WORDS):
+                return column["name"]
+        for column in columns:
+            if not column.get("is_primary_key"):
+                return column["name"]
+        return columns[0]["name"]
+
+    def _find_group(self, schema: dict, table: dict, words: str):
+        """
+        Resolves the grouping words to (label expression, join clause): a
+        column of `table`, or a table joined over one foreign key.
+        """
+        words = self._words(words)
+        column = self._best([
+            (self._score(column["name"], words), column)
+            for column in table.get("columns", []) if not column.get("is_primary_key")
+        ])
+        tables = {t["name"]: t for t in schema.get("tables", [])}
+        joins = []
+        # Foreign keys in either direction between `table` and a table named by the grouping words
+        for fk in table.get("foreign_keys", []):
+            joins.append((fk["referred_table"], fk["constrained_columns"], fk["referred_columns"]))
+        for other in schema.get("tables", []):
+            for fk in other.get("foreign_keys", []):
+                if fk["referred_table"] == table["name"] and other["name"] != table["name"]:
+                    joins.append((other["name"], fk["referred_columns"], fk["constrained_columns"]))
+        join = self._best([
+            (self._score(other_name, words), (other_name, local, remote))
+            for other_name, local, remote in joins if other_name in tables
+        ])
+
+        # "by department" prefers the departments table's name over the employees.dept_id column
+        if join is not None:
+            other_name, local, remote = join
+            condition = " AND ".join(
+                f"{_column(table['name'], l)} = {_column(other_name, r)}" for l, r in zip(local, remote)
+            )
+            label = _column(other_name, self._label_column(tables[other_name]))
+            return label, f" JOIN {_identifier(other_name)} ON {condition}"
+        if column is not None:
+            return _column(table["name"], column["name"]), ""
+        return None
+
+    @staticmethod
+    def _grouped(select: str, table: dict, group) -> str:
+        if group is None:
+            return f"SELECT {select} FROM {_identifier(table['name'])};"
+        label, join = group
+        return (
+            f"SELECT {label}, {select} FROM {_identifier(table['name'])}{join} "
+            f"GROUP BY {label} ORDER BY {label};"
+        )
+
+    def match(self, user_query: str, schema: dict) -> dict:
+        """
+        Returns {"sql", "template"} when the question is answered by a
+        template, or None when it should go to the LLM.
+        """
+        if not self.enabled or not schema or not schema.get("tables"):
+            return None
+        query = self._normalize(user_query)
+
+        count = _COUNT_PATTERN.match(query)
+        if count:
+            table = self._find_table(schema, count.group("entity"))
+            if table is None:
+                return None
+            group = self._find_group(schema, table, count.group("group")) if count.group("group") else None
+            if count.group("group") and group is None:
+                return None
+            return {"sql": self._grouped("COUNT(*) AS count", table, group), "template": "count" if group is None else "count_by_group"}
+
+        aggregate = _AGGREGATE_PATTERN.match(query)
+        if aggregate:
+            table = None
+            if aggregate.group("entity"):
+                table = self._find_table(schema, aggregate.group("entity"))
+                if table is None:
+                    return None
+            measure = self._find_measure(schema, aggregate.group("measure"), table)
+            if measure is None:
+                return None
+            table, column = measure
+            group = self._find_group(schema, table, aggregate.group("group")) if aggregate.group("group") else None
+            if aggregate.group("group") and group is None:
+                return None
+            function = _AGGREGATES[aggregate.group("aggregate")]
+            select = f"{function}({_column(table['name'], column['name'])}) AS {function.lower()}_{column['name'].lower()}"
+            return {"sql": self._grouped(select, table, group), "template": "aggregate" if group is None else "aggregate_by_group"}
+        return None
@@ -0,0 +1,92 @@
+import re
+import bisect
+from ..config import config
+
+# Fallback tokenization when no model tokenizer is available: words and
+# individual punctuation marks, which tracks WordPiece counts reasonably well.
+_FALLBACK_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Paragraph and section boundaries: blank lines, or a line break before a short heading-like line.
+_BOUNDARY_PATTERN = re.compile(r"\n\s*\n|\n(?=[A-Z][A-Za-z /&-]{0,40}:?\n)")
+
+class TextChunker:
+    """
+    Splits document text into overlapping, token-bounded chunks that fit the
+    embedding model's input window. Chunk ends snap back to the nearest
+    paragraph or section boundary when one is close enough, and every chunk
+    records its character offsets and (for paginated formats) its page number.
+    """
+    def __init__(self, tokenizer=None, chunk_size: int = None, chunk_overlap: int = None, respect_boundaries: bool = None):
+        """
+        Args:
+            tokenizer: An optional Hugging Face fast tokenizer (e.g. `SentenceTransformer.tokenizer`).
+                Falls back to a word/punctuation approximation when omitted.
+        """
+        embedding_config = config.get("embedding", {})
+        self.tokenizer = tokenizer
+        self.chunk_size = chunk_size or embedding_config.get("chunk_size_tokens", 200)
+        overlap = chunk_overlap if chunk_overlap is not None else embedding_config.get("chunk_overlap_tokens", 40)
+        self.chunk_overlap = min(overlap, self.chunk_size // 2)
+        self.respect_boundaries = respect_boundaries if respect_boundaries is not None else embedding_config.get("respect_boundaries", True)
+
+    def _token_spans(self, text: str) -> list:
+        """Returns the (start, end) character offsets of every token in the text."""
+        if self.tokenizer is not None:
+            try:
+                encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+                return [tuple(span) for span in encoding["offset_mapping"] if span[1] > span[0]]
+            except Exception as e:
+                print(f"Warning: Tokenizer offsets unavailable, using approximate tokens: {e}")
+        return [match.span() for match in _FALLBACK_TOKEN_PATTERN.finditer(text)]
+
+    def _boundary_token_indices(self, text: str, spans: list) -> list:
+        """Returns the indices of tokens that start a new paragraph or section."""
+        token_starts = [start for start, _ in spans]
+        indices = set()
+        for match in _BOUNDARY_PATTERN.finditer(text):
+            index = bisect.bisect_left(token_starts, match.end())
+            if 0 < index < len(spans):
+                indices.add(index)
+        return sorted(indices)
+
+    def chunk(self, text: str, page_offsets: list = None) -> list:
+        """
+        Splits text into chunks.
+
+        Args:
+            text: The full document text.
+            page_offsets: Optional sorted list of character offsets at which each page starts.
+
+        Returns:
+            A list of chunk dictionaries with content, offsets, chunk index and page number.
+        """
+        spans = self._token_spans(text)
+        if not spans:
+            return []
+
+        boundaries = self._boundary_token_indices(text, spans) if self.respect_boundaries else []
+        # Only snap to a boundary if it keeps at least half of the chunk
+        min_chunk_tokens = max(1, self.chunk_size // 2)
+
+        chunks = []
+        start = 0
+        while start < len(spans):
+            end = min(start + self.chunk_size, len(spans))
+            if end < len(spans) and boundaries:
+                candidate = bisect.bisect_right(boundaries, end) - 1
+                if candidate >= 0 and boundaries[candidate] - start >= min_chunk_tokens:
+                    end = boundaries[candidate]
+
+            start_offset, end_offset = spans[start][0], spans[end - 1][1]
+            page = bisect.bisect_right(page_offsets, start_offset) if page_offsets else None
+            chunks.append({
+                "content": text[start_offset:end_offset],
+                "chunk_index": len(chunks),
+                "start_offset": start_offset,
+                "end_offset": end_offset,
+                "page": page,
+            })
+
+            if end >= len(spans):
+                break
+            start = max(end - self.chunk_overlap, start + 1)
+        return chunks
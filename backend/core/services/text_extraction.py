@@ -0,0 +1,54 @@
+import docx
+import pypdf
+from typing import List, IO
+
+# Text extraction lives in its own lightweight module (no torch or faiss
+# imports) so that it can run in ingestion worker processes.
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+def _extract_pages_from_pdf(file: IO) -> List[str]:
+    pdf_reader = pypdf.PdfReader(file)
+    return [page.extract_text() or "" for page in pdf_reader.pages]
+
+def _extract_text_from_docx(file: IO) -> str:
+    doc = docx.Document(file)
+    return "\n".join(para.text for para in doc.paragraphs)
+
+def _extract_text_from_txt(file: IO) -> str:
+    return file.read().decode('utf-8')
+
+def extract_text(file: IO, filename: str) -> dict:
+    """
+    Extracts the text of a PDF, DOCX or TXT file.
+
+    Returns:
+        A dictionary with the filename, the text and (for PDFs) the character
+        offset at which each page starts, or an error dictionary.
+    """
+    text = ""
+    page_offsets = None
+    if filename.endswith(".pdf"):
+        # Join pages with a blank line and remember where each page starts
+        page_offsets = []
+        for page_text in _extract_pages_from_pdf(file):
+            page_offsets.append(len(text))
+            text += page_text + "\n\n"
+    elif filename.endswith(".docx"):
+        text = _extract_text_from_docx(file)
+    elif filename.endswith(".txt"):
+        text = _extract_text_from_txt(file)
+    else:
+        return {"error": f"Unsupported file type: {filename}"}
+
+    if not text.strip():
+        return {"error": f"No text could be extracted from {filename}."}
+    return {"filename": filename, "text": text, "page_offsets": page_offsets}
+
+def extract_text_from_path(path: str, filename: str) -> dict:
+    """Process-pool entry point: extracts text from a file on disk."""
+    try:
+        with open(path, "rb") as f:
+            return extract_text(f, filename)
+    except Exception as e:
+        return {"error": f"Failed to process document {filename}: {str(e)}"}
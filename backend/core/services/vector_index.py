@@ -0,0 +1,140 @@
+import faiss
+import numpy as np
+from ..config import config
+
+# Supported index types. All of them score by inner product over
+# L2-normalized vectors, i.e. cosine similarity, and are wrapped in an
+# IndexIDMap2 so vectors are addressed by their chunk id rather than position.
+INDEX_TYPES = ("flat", "ivfpq", "hnsw")
+
+def get_index_settings() -> dict:
+    """Returns the `vector_index` section of config.yml with defaults filled in."""
+    settings = {
+        "type": "flat",
+        "nlist": 256,
+        "pq_m": 48,
+        "pq_nbits": 8,
+        "nprobe": 16,
+        "hnsw_m": 32,
+        "ef_construction": 200,
+        "ef_search": 64,
+    }
+    settings.update(config.get("vector_index", {}) or {})
+    return settings
+
+def normalize(vectors) -> np.ndarray:
+    """Returns an L2-normalized float32 copy of the vectors."""
+    vectors = np.array(vectors, dtype=np.float32, copy=True).reshape(len(vectors), -1)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def build_index(dim: int, index_type: str = None, settings: dict = None):
+    """
+    Creates an empty, ID-mapped index of the requested type.
+
+    Args:
+        dim: The embedding dimension.
+        index_type: One of INDEX_TYPES; defaults to `vector_index.type` in config.yml.
+        settings: Overrides for the index parameters.
+    """
+    settings = settings or get_index_settings()
+    index_type = index_type or settings["type"]
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "ivfpq":
+        if dim % settings["pq_m"] != 0:
+            raise ValueError(f"pq_m ({settings['pq_m']}) must divide the embedding dimension ({dim}).")
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, settings["nlist"], settings["pq_m"], settings["pq_nbits"], faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, settings["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = settings["ef_construction"]
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+    set_search_params(index, nprobe=settings["nprobe"], ef_search=settings["ef_search"])
+    return faiss.IndexIDMap2(index)
+
+def _unwrap(index):
+    """Returns the innermost index of an ID-mapping wrapper."""
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+def is_ivf(index) -> bool:
+    """Whether an index keeps its vectors in IVF inverted lists (which are read-only when memory-mapped)."""
+    return isinstance(_unwrap(index), faiss.IndexIVF)
+
+def index_type_of(index) -> str:
+    """
+    Returns which of INDEX_TYPES an index is, or "legacy" for anything else
+    (e.g. the original IndexFlatL2, or a positional index without an ID map).
+    """
+    if not isinstance(faiss.downcast_index(index), faiss.IndexIDMap2):
+        return "legacy"
+    inner = _unwrap(index)
+    if inner.metric_type != faiss.METRIC_INNER_PRODUCT:
+        return "legacy"
+    if isinstance(inner, faiss.IndexFlat):
+        return "flat"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "legacy"
+
+def min_training_vectors(index_type: str, settings: dict = None) -> int:
+    """The number of vectors needed to train an index type well (FAISS recommends ~39 per centroid)."""
+    settings = settings or get_index_settings()
+    if index_type == "ivfpq":
+        return max(settings["nlist"], 2 ** settings["pq_nbits"]) * 39
+    return 0
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None):
+    """Tunes the recall/latency trade-off of an existing index at runtime."""
+    inner = _unwrap(index)
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = nprobe
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+def get_ids(index) -> np.ndarray:
+    """Returns the ids of every vector in an ID-mapped index."""
+    return faiss.vector_to_array(faiss.downcast_index(index).id_map)
+
+def remove_ids(index, ids) -> bool:
+    """
+    Removes vectors by id. Returns False if the index type does not
+    support removal (HNSW), in which case the caller must rebuild it.
+    """
+    if len(ids) == 0:
+        return True
+    try:
+        index.remove_ids(np.asarray(ids, dtype=np.int64))
+        return True
+    except RuntimeError:
+        return False
+
+def build_trained_index(dim: int, vectors: np.ndarray, ids: np.ndarray = None, index_type: str = None, settings: dict = None):
+    """
+    Builds an index of the requested type and fills it with the given
+    vectors (ids default to their positions), training it first when
+    needed. Falls back to a flat index when there are too few vectors to
+    train a quantizer.
+    """
+    settings = settings or get_index_settings()
+    index_type = index_type or settings["type"]
+    vectors = normalize(vectors) if len(vectors) else np.empty((0, dim), dtype=np.float32)
+
+    if len(vectors) < min_training_vectors(index_type, settings):
+        print(f"Warning: {len(vectors)} vectors are too few to train a '{index_type}' index; using 'flat' instead.")
+        index_type = "flat"
+
+    index = build_index(dim, index_type, settings)
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        ids = np.arange(len(vectors)) if ids is None else ids
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    return index
@@ -0,0 +1,431 @@
+import os
+import time
+import sqlite3
+import threading
+import faiss
+import numpy as np
+from ..config import config, resolve_path
+from .vector_index import build_trained_index, get_ids, get_index_settings, index_type_of, is_ivf, normalize, remove_ids, set_search_params
+
+# Optional columns added on top of the original chunks(id, doc_name, chunk_text) table.
+# `vector_id` is the index position used by checkpoints written before vectors
+# were addressed by chunk id; it is only read to migrate those checkpoints.
+_CHUNK_COLUMNS = {
+    "vector_id": "INTEGER",
+    "chunk_index": "INTEGER",
+    "start_offset": "INTEGER",
+    "end_offset": "INTEGER",
+    "page": "INTEGER",
+    "embedding": "BLOB",
+    "chunk_hash": "TEXT",
+}
+
+# Keeps IN (...) lists well below SQLite's limit on bound parameters
+_SQL_BATCH_SIZE = 500
+
+class VectorStore:
+    """
+    Durable storage for the document index. Chunk text, metadata and
+    embeddings are written to SQLite as soon as a document is processed,
+    which makes SQLite the source of truth. The FAISS index is periodically
+    checkpointed to disk with an atomic rename and memory-mapped on startup;
+    on load it is reconciled with SQLite (chunks committed after the
+    checkpoint are re-added from their stored embeddings, deleted ones are
+    removed), so a crash never loses a document and a restart never
+    re-encodes the corpus.
+
+    Vectors are addressed by their chunk's row id. Embeddings are also
+    cached by chunk content hash and model name, so re-uploading an edited
+    document only embeds the chunks that actually changed.
+
+    The store also acts as the `documents` mapping of DocumentProcessor:
+    `store[chunk_id]` returns the stored chunk.
+
+    Several worker processes can share one store. Every committed change
+    bumps a generation counter in SQLite; a worker that sees a generation
+    other than its own reloads the memory-mapped checkpoint and reconciles
+    it with the chunks, instead of keeping a diverging copy.
+    """
+    def __init__(self, index_path: str = None, metadata_path: str = None, checkpoint_every: int = None):
+        data_paths = config.get("data_paths", {})
+        store_config = config.get("vector_store", {})
+
+        self.index_path = resolve_path(index_path or data_paths.get("faiss_index", "./backend/data/vector.index"))
+        self.metadata_path = resolve_path(metadata_path or data_paths.get("metadata_db", "./backend/data/text_db.sqlite"))
+        self.checkpoint_every = checkpoint_every or store_config.get("checkpoint_every", 256)
+        self._pending_changes = 0
+        self._lock = threading.Lock()
+
+        self.metadata_path.parent.mkdir(parents=True, exist_ok=True)
+        # The connection is shared with the embedding executor threads, guarded by the lock
+        self._conn = sqlite3.connect(str(self.metadata_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+
+    def _migrate(self):
+        """Creates the tables, or upgrades the original chunk table in place."""
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doc_name TEXT NOT NULL,
+                    chunk_text TEXT NOT NULL
+                )
+            """)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+            for column, column_type in _CHUNK_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {column} {column_type}")
+
+            if "vector_id" not in existing:
+                # Rows of the original table map to index positions in insertion order
+                self._conn.execute("""
+                    UPDATE chunks SET vector_id = (SELECT COUNT(*) FROM chunks AS earlier WHERE earlier.id < chunks.id)
+                """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_name ON chunks(doc_name)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    filename TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Shared between worker processes: bumped on every change to the stored chunks or the index
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS store_state (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("INSERT OR IGNORE INTO store_state (key, value) VALUES ('generation', 0)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    chunk_hash TEXT NOT NULL,
+                    model_name TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (chunk_hash, model_name)
+                )
+            """)
+
+    def _read_checkpoint(self, dim: int):
+        """
+        Memory-maps the last index checkpoint, or returns None if it is
+        missing or unusable. IVF checkpoints are read into memory instead:
+        memory-mapped inverted lists are read-only, so vectors could not be
+        added to or removed from them.
+        """
+        if not self.index_path.exists():
+            return None
+        try:
+            index = faiss.read_index(str(self.index_path), faiss.IO_FLAG_MMAP)
+            if is_ivf(index):
+                index = faiss.read_index(str(self.index_path))
+        except RuntimeError:
+            # Some index types cannot be memory-mapped; fall back to a regular read
+            index = faiss.read_index(str(self.index_path))
+        if index.d != dim:
+            print(f"Warning: Index checkpoint has dimension {index.d}, expected {dim}; rebuilding from the chunk store.")
+            return None
+        return index
+
+    def load_index(self, dim: int, index_type: str = None, settings: dict = None):
+        """
+        Loads the FAISS index for the stored chunks and reconciles it with
+        SQLite. The index is rebuilt from the stored embeddings when the
+        checkpoint is missing, positional, or of a different type than the
+        one configured.
+        """
+        settings = settings or get_index_settings()
+        index_type = index_type or settings["type"]
+        index = self._read_checkpoint(dim)
+        with self._lock:
+            if index is not None and index_type_of(index) == "legacy":
+                self._backfill_embeddings(index)
+
+            rebuilt = index is None or index_type_of(index) != index_type
+            if not rebuilt:
+                set_search_params(index, nprobe=settings["nprobe"], ef_search=settings["ef_search"])
+                rebuilt = not self._reconcile(index)
+            if rebuilt:
+                index = self._rebuild(dim, index_type, settings)
+        if (rebuilt and index.ntotal) or self._pending_changes:
+            self.checkpoint(index)
+        return index
+
+    def rebuild_index(self, dim: int, index_type: str = None, settings: dict = None):
+        """Rebuilds (and retrains) the index from every stored embedding, then checkpoints it."""
+        settings = settings or get_index_settings()
+        with self._lock:
+            index = self._rebuild(dim, index_type or settings["type"], settings)
+        self.checkpoint(index)
+        return index
+
+    def refresh_index(self, dim: int, settings: dict = None):
+        """
+        Reloads the index after another worker changed the store: the last
+        checkpoint, of whatever type it was written with, reconciled with
+        the stored chunks.
+        """
+        settings = settings or get_index_settings()
+        index = self._read_checkpoint(dim)
+        with self._lock:
+            if index is not None:
+                set_search_params(index, nprobe=settings["nprobe"], ef_search=settings["ef_search"])
+                if self._reconcile(index):
+                    return index
+            return self._rebuild(dim, index_type_of(index) if index is not None else settings["type"], settings)
+
+    def _bump_generation(self) -> int:
+        """Marks a change visible to other workers; call inside a transaction."""
+        self._conn.execute("UPDATE store_state SET value = value + 1 WHERE key = 'generation'")
+        return self._conn.execute("SELECT value FROM store_state WHERE key = 'generation'").fetchone()[0]
+
+    def publish_change(self) -> int:
+        """
+        Bumps the generation for a change outside the chunk store, such as a
+        rebuilt index that was just checkpointed, so other workers reload it.
+        """
+        with self._lock, self._conn:
+            return self._bump_generation()
+
+    def get_generation(self) -> int:
+        """Returns the generation of the stored chunks, shared by every process using this store."""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM store_state WHERE key = 'generation'").fetchone()[0]
+
+    def _backfill_embeddings(self, index):
+        """
+        Copies vectors out of a positional checkpoint for rows that were
+        stored without an embedding, so they survive the rebuild.
+        """
+        rows = self._conn.execute(
+            "SELECT id, vector_id FROM chunks WHERE embedding IS NULL AND vector_id < ?", (index.ntotal,)
+        ).fetchall()
+        if not rows:
+            return
+        try:
+            with self._conn:
+                for row in rows:
+                    vector = index.reconstruct(int(row["vector_id"])).astype(np.float32)
+                    self._conn.execute("UPDATE chunks SET embedding = ? WHERE id = ?", (vector.tobytes(), row["id"]))
+        except RuntimeError as e:
+            print(f"Warning: Could not recover embeddings from the index checkpoint: {e}")
+
+    def _load_vectors(self, dim: int, chunk_ids: list = None) -> tuple:
+        """Reads the stored embeddings of every chunk (or the given ones), dropping unusable rows."""
+        if chunk_ids is None:
+            rows = self._conn.execute("SELECT id, embedding FROM chunks ORDER BY id").fetchall()
+        else:
+            rows = []
+            for start in range(0, len(chunk_ids), _SQL_BATCH_SIZE):
+                batch = chunk_ids[start:start + _SQL_BATCH_SIZE]
+                rows.extend(self._conn.execute(
+                    f"SELECT id, embedding FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ))
+
+        ids, vectors = [], []
+        with self._conn:
+            for row in rows:
+                if row["embedding"] is None or len(row["embedding"]) != dim * 4:
+                    # Without a usable embedding the chunk cannot be searched; drop it
+                    self._conn.execute("DELETE FROM chunks WHERE id = ?", (row["id"],))
+                    continue
+                ids.append(row["id"])
+                vectors.append(np.frombuffer(row["embedding"], dtype=np.float32))
+        return np.array(ids, dtype=np.int64), np.array(vectors, dtype=np.float32).reshape(-1, dim)
+
+    def _rebuild(self, dim: int, index_type: str, settings: dict):
+        """Builds a fresh index from the stored embeddings."""
+        ids, vectors = self._load_vectors(dim)
+        index = build_trained_index(dim, vectors, ids=ids, index_type=index_type, settings=settings)
+        print(f"Rebuilt '{index_type}' index with {index.ntotal} vectors from the chunk store.")
+        return index
+
+    def _reconcile(self, index) -> bool:
+        """
+        Re-adds chunks committed after the checkpoint was written and removes
+        chunks deleted since. Returns False if stale vectors cannot be removed
+        from this index type, in which case it must be rebuilt.
+        """
+        indexed = set(get_ids(index).tolist())
+        stored = {row[0] for row in self._conn.execute("SELECT id FROM chunks")}
+
+        stale = sorted(indexed - stored)
+        if not remove_ids(index, stale):
+            return False
+        missing = sorted(stored - indexed)
+        if missing:
+            ids, vectors = self._load_vectors(index.d, missing)
+            if len(ids):
+                index.add_with_ids(normalize(vectors), ids)
+
+        if stale or missing:
+            self._pending_changes += len(stale) + len(missing)
+            print(f"Reconciled the index with the chunk store: {len(missing)} vectors added, {len(stale)} removed.")
+        return True
+
+    def get_document_hash(self, filename: str):
+        """Returns the content hash of the stored version of a document, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM documents WHERE filename = ?", (filename,)).fetchone()
+        return row["content_hash"] if row else None
+
+    def get_cached_embeddings(self, chunk_hashes: list, model_name: str) -> dict:
+        """Returns the cached embeddings of the given chunk hashes for a model, keyed by hash."""
+        unique_hashes = list(set(chunk_hashes))
+        cached = {}
+        with self._lock:
+            for start in range(0, len(unique_hashes), _SQL_BATCH_SIZE):
+                batch = unique_hashes[start:start + _SQL_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"""
+                    SELECT chunk_hash, embedding FROM embedding_cache
+                    WHERE model_name = ? AND chunk_hash IN ({','.join('?' * len(batch))})
+                    """,
+                    [model_name, *batch]
+                )
+                for row in rows:
+                    cached[row["chunk_hash"]] = np.frombuffer(row["embedding"], dtype=np.float32)
+        return cached
+
+    def replace_document(self, filename: str, content_hash: str, chunks: list, embeddings: np.ndarray, model_name: str) -> dict:
+        """
+        Stores a new version of a document in one transaction. Stored chunks
+        of the same document with a matching content hash are kept (only their
+        position metadata is updated), new chunks are inserted, and chunks that
+        no longer appear are deleted.
+
+        Args:
+            chunks: Chunk dictionaries from TextChunker, each with a `chunk_hash`.
+            embeddings: One embedding per chunk (rows for kept chunks are ignored).
+
+        Returns:
+            A dictionary with the `added_ids` and `added_vectors` to add to the
+            index, the `removed_ids` to remove from it, the `kept` count, and
+            the store `generation` after the change.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock, self._conn:
+            reusable = {}
+            for row in self._conn.execute("SELECT id, chunk_hash FROM chunks WHERE doc_name = ?", (filename,)):
+                reusable.setdefault(row["chunk_hash"], []).append(row["id"])
+
+            added_ids, added_positions, kept = [], [], 0
+            for position, chunk in enumerate(chunks):
+                metadata = (chunk.get("chunk_index"), chunk.get("start_offset"), chunk.get("end_offset"), chunk.get("page"))
+                if reusable.get(chunk["chunk_hash"]):
+                    self._conn.execute(
+                        "UPDATE chunks SET chunk_index = ?, start_offset = ?, end_offset = ?, page = ? WHERE id = ?",
+                        (*metadata, reusable[chunk["chunk_hash"]].pop())
+                    )
+                    kept += 1
+                    continue
+
+                embedding = embeddings[position].tobytes()
+                cursor = self._conn.execute(
+                    """
+                    INSERT INTO chunks (doc_name, chunk_text, chunk_index, start_offset, end_offset, page, embedding, chunk_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (filename, chunk["content"], *metadata, embedding, chunk["chunk_hash"])
+                )
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO embedding_cache (chunk_hash, model_name, embedding) VALUES (?, ?, ?)",
+                    (chunk["chunk_hash"], model_name, embedding)
+                )
+                added_ids.append(cursor.lastrowid)
+                added_positions.append(position)
+
+            removed_ids = [chunk_id for ids in reusable.values() for chunk_id in ids]
+            self._delete_chunks(removed_ids)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (filename, content_hash, updated_at) VALUES (?, ?, ?)",
+                (filename, content_hash, time.time())
+            )
+            self._pending_changes += len(added_ids) + len(removed_ids)
+            generation = self._bump_generation()
+
+        return {
+            "added_ids": np.array(added_ids, dtype=np.int64),
+            "added_vectors": embeddings[added_positions].reshape(len(added_positions), -1),
+            "removed_ids": removed_ids,
+            "kept": kept,
+            "generation": generation,
+        }
+
+    def delete_document(self, filename: str):
+        """
+        Deletes a document and its chunks. Returns the removed chunk ids and
+        the store generation after the change, or None if it is unknown.
+        """
+        with self._lock, self._conn:
+            removed_ids = [row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE doc_name = ?", (filename,))]
+            deleted = self._conn.execute("DELETE FROM documents WHERE filename = ?", (filename,)).rowcount
+            if not (removed_ids or deleted):
+                return None
+            self._delete_chunks(removed_ids)
+            self._pending_changes += len(removed_ids)
+            generation = self._bump_generation()
+        return removed_ids, generation
+
+    def _delete_chunks(self, chunk_ids: list):
+        for start in range(0, len(chunk_ids), _SQL_BATCH_SIZE):
+            batch = chunk_ids[start:start + _SQL_BATCH_SIZE]
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def maybe_checkpoint(self, index):
+        """Checkpoints the index once enough vectors have changed since the last one."""
+        if self._pending_changes >= self.checkpoint_every:
+            self.checkpoint(index)
+
+    def checkpoint(self, index):
+        """Writes the index to a temp file and atomically renames it over the previous checkpoint."""
+        with self._lock:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            # Per-process temp file, so workers checkpointing at the same time never share one
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            self._pending_changes = 0
+
+    def get_chunk(self, chunk_id: int) -> dict:
+        """Returns a stored chunk by id."""
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT doc_name, chunk_text, chunk_index, start_offset, end_offset, page
+                FROM chunks WHERE id = ?
+                """,
+                (int(chunk_id),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(f"No chunk stored with id {chunk_id}")
+        return {
+            "filename": row["doc_name"],
+            "content": row["chunk_text"],
+            "chunk_index": row["chunk_index"],
+            "start_offset": row["start_offset"],
+            "end_offset": row["end_offset"],
+            "page": row["page"],
+        }
+
+    def __getitem__(self, chunk_id: int) -> dict:
+        return self.get_chunk(chunk_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def count_documents(self) -> int:
+        """Returns the number of stored documents (files), as opposed to `len()`, which counts chunks."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT doc_name) FROM chunks").fetchone()[0]
+
+    def close(self, index=None):
+        """Checkpoints any outstanding changes and closes the database."""
+        if index is not None and self._pending_changes:
+            self.checkpoint(index)
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.routes import ingestion, query, metrics
+from api.routes import ingestion, query, metrics, schema, health
+from core.services.engine_registry import engine_registry
+from api.routes.ingestion import document_processor_service, ingestion_pipeline
+from api.routes.health import start_warmup, warmup_on_startup
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Runs startup and shutdown hooks for the shared services."""
+    # The heavy services load on first use. Warming them up in the background
+    # lets the server accept traffic (and report readiness) right away.
+    if warmup_on_startup():
+        start_warmup()
+    yield
+    # Only services that were actually loaded need to be shut down
+    if ingestion_pipeline.peek() is not None:
+        # Stop background ingestion
+        ingestion_pipeline.peek().shutdown()
+    if document_processor_service.peek() is not None:
+        # Flush vectors added since the last index checkpoint
+        document_processor_service.peek().checkpoint()
+    # Close every pooled database connection on shutdown
+    await engine_registry.adispose_all()
 
 app = FastAPI(
     title="NLP Query Engine API",
     description="API for database schema discovery, document ingestion, and natural language querying.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # A list of origins that are allowed to make cross-origin requests.
@@ -27,6 +50,8 @@ app.add_middleware(
 app.include_router(ingestion.router, prefix="/api")
 app.include_router(query.router, prefix="/api")
 app.include_router(metrics.router, prefix="/api")
+app.include_router(schema.router, prefix="/api")
+app.include_router(health.router, prefix="/api")
 
 @app.get("/", tags=["Root"])
 async def read_root():
@@ -0,0 +1,45 @@
+import json
+import sqlite3
+from benchmarks.e2e_benchmark import compare, load_workload, make_database, make_documents, summarize
+from core.services.schema_discovery import SchemaDiscovery
+
+def test_synthetic_database_has_the_init_sql_shape(tmp_path):
+    database = tmp_path / "employees.db"
+    make_database(database, employees=500, departments=8, seed=1)
+
+    schema = SchemaDiscovery().analyze_database(f"sqlite:///{database}")
+    tables = {table["name"]: table for table in schema["tables"]}
+    assert set(tables) == {"departments", "employees"}
+    assert [fk["referred_table"] for fk in tables["employees"]["foreign_keys"]] == ["departments"]
+
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT COUNT(*) FROM employees").fetchone()[0] == 500
+    # Numbered divisions once the base department names run out, each with a manager from its own staff
+    assert conn.execute("SELECT dept_name FROM departments WHERE dept_id = 8").fetchone()[0] == "Sales 2"
+    assert conn.execute("""
+        SELECT COUNT(*) FROM departments d JOIN employees e ON e.emp_id = d.manager_id AND e.dept_id = d.dept_id
+    """).fetchone()[0] == 8
+    conn.close()
+
+def test_synthetic_documents_are_reproducible():
+    documents = make_documents(3, paragraphs=2, seed=7)
+    assert documents == make_documents(3, paragraphs=2, seed=7)
+    assert [filename for filename, _ in documents] == ["resume_00001.txt", "resume_00002.txt", "resume_00003.txt"]
+    assert b"Skills:" in documents[0][1]
+
+def test_workload_file_is_read_by_query(tmp_path):
+    path = tmp_path / "workload.jsonl"
+    path.write_text(json.dumps({"request_id": "q1", "query": "How many employees?"}) + "\n\n" + json.dumps({"query": "Who knows Go?"}) + "\n")
+    assert load_workload(str(path)) == ["How many employees?", "Who knows Go?"]
+    assert load_workload(None)
+
+def test_summary_and_comparison():
+    summary = summarize([0.010, 0.020, 0.030, 0.040])
+    assert summary["count"] == 4 and summary["p50_ms"] == 25.0 and summary["max_ms"] == 40.0
+
+    baseline = {"settings": {"employees": 10}, "queries": {"latency": {"p50_ms": 20.0}, "errors": 0}}
+    current = {"settings": {"employees": 99}, "queries": {"latency": {"p50_ms": 25.0}, "errors": 1}}
+    changes = compare(baseline, current)
+    assert changes["queries.latency.p50_ms"]["change_pct"] == 25.0
+    assert changes["queries.errors"]["change_pct"] is None
+    assert not any(metric.startswith("settings") for metric in changes)
@@ -0,0 +1,25 @@
+from core.services.engine_registry import EngineRegistry
+
+def test_engines_are_shared_per_connection_string(tmp_path):
+    """The registry should hand out one pooled engine per connection string."""
+    registry = EngineRegistry(pool_settings={"pool_size": 2, "max_overflow": 0})
+    connection_string = f"sqlite:///{tmp_path / 'test.db'}"
+
+    first = registry.get_engine(connection_string)
+    second = registry.get_engine(connection_string)
+    other = registry.get_engine("sqlite://")
+
+    assert first is second
+    assert first is not other
+    assert len(registry.get_pool_status()) == 2
+
+def test_dispose_all_clears_the_registry(tmp_path):
+    """Disposing should close the pools and force new engines on the next lookup."""
+    registry = EngineRegistry(pool_settings={})
+    connection_string = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = registry.get_engine(connection_string)
+
+    registry.dispose_all()
+
+    assert registry.get_pool_status() == []
+    assert registry.get_engine(connection_string) is not engine
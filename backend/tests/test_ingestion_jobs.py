@@ -0,0 +1,83 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.services.ingestion_jobs import IngestionPipeline
+
+class FakeProcessor:
+    """Stands in for DocumentProcessor; chunking fails for files named in `broken`."""
+    model = object()
+    index = object()
+
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+
+    def is_unchanged(self, filename, file_hash):
+        return False
+
+    def chunk_document(self, extracted):
+        if extracted["filename"] in self.broken:
+            raise ValueError("tokenizer exploded")
+        return [{"content": extracted["text"]}]
+
+    def encode_chunks(self, chunks):
+        return [[0.0] for _ in chunks]
+
+    def add_document_chunks(self, filename, chunks, embeddings, file_hash=None):
+        return {"filename": filename, "status": "processed and indexed", "chunks_added": len(chunks)}
+
+def run_job(pipeline, staged_files):
+    # Threads instead of spawned processes keep the test fast; extraction is unchanged
+    pipeline._executor = ThreadPoolExecutor(max_workers=2)
+    job = pipeline.submit(staged_files)
+    deadline = time.monotonic() + 10
+    while pipeline.get_job(job["job_id"])["finished_at"] is None:
+        assert time.monotonic() < deadline, "job never finished"
+        time.sleep(0.01)
+    pipeline.shutdown()
+    return pipeline.get_job(job["job_id"])
+
+def stage(tmp_path, *filenames):
+    staged = []
+    for filename in filenames:
+        path = tmp_path / filename
+        path.write_text(f"contents of {filename}")
+        staged.append((str(path), filename, filename))
+    return staged
+
+def test_chunking_error_fails_only_that_file(tmp_path):
+    staged = stage(tmp_path, "good.txt", "bad.txt")
+    job = run_job(IngestionPipeline(FakeProcessor(broken={"bad.txt"})), staged)
+
+    assert job["status"] == "completed"
+    assert job["processed_files"] == 2 and job["failed_files"] == 1
+    assert any("tokenizer exploded" in result.get("error", "") for result in job["results"])
+    assert not any((tmp_path / filename).exists() for filename in ("good.txt", "bad.txt"))
+
+def test_every_file_failing_marks_the_job_failed(tmp_path):
+    class UnreachableStore(FakeProcessor):
+        def is_unchanged(self, filename, file_hash):
+            raise OSError("store unavailable")
+
+    staged = stage(tmp_path, "a.txt", "b.txt")
+    job = run_job(IngestionPipeline(UnreachableStore()), staged)
+
+    assert job["status"] == "failed"
+    assert job["failed_files"] == 2
+    assert not any((tmp_path / filename).exists() for filename in ("a.txt", "b.txt"))
+
+def test_chunks_are_encoded_on_the_shared_embedding_executor(tmp_path):
+    class RecordingProcessor(FakeProcessor):
+        def __init__(self):
+            super().__init__()
+            self.encoding_threads = []
+
+        def encode_chunks(self, chunks):
+            self.encoding_threads.append(threading.current_thread().name)
+            return super().encode_chunks(chunks)
+
+    processor = RecordingProcessor()
+    job = run_job(IngestionPipeline(processor, embed_batch_chunks=1), stage(tmp_path, "a.txt", "b.txt"))
+
+    assert job["status"] == "completed"
+    assert len(processor.encoding_threads) == 2
+    assert all(name.startswith("embedding") for name in processor.encoding_threads)
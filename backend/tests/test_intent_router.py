@@ -0,0 +1,50 @@
+import numpy as np
+from core.services.intent_router import IntentRouter
+
+SCHEMA = {"tables": [
+    {"name": "employees", "columns": [{"name": "emp_id"}, {"name": "full_name"}, {"name": "annual_salary"}], "foreign_keys": []},
+]}
+
+def test_keywords_match_whole_words_only():
+    router = IntentRouter(use_embeddings=False)
+
+    routing = router.route("Who is our data specialist?")
+
+    # "list" inside "specialist" used to send this question to SQL
+    assert routing["query_type"] == "HYBRID"
+    assert routing["method"] == "default"
+    assert routing["confidence"] == 0.0
+
+def test_confidence_grows_with_evidence_and_mixed_evidence_is_hybrid():
+    router = IntentRouter(use_embeddings=False)
+
+    one = router.route("Show the payroll")
+    two = router.route("How many employees are there?")
+    mixed = router.route("Employees with Python skills")
+
+    assert one["query_type"] == two["query_type"] == "SQL"
+    assert 0 < one["confidence"] < two["confidence"] < 1
+    assert router.route("What is John's email?")["query_type"] == "DOCUMENT"
+    assert mixed["query_type"] == "HYBRID" and mixed["confidence"] == 1.0
+
+def test_schema_names_count_as_sql_evidence():
+    router = IntentRouter(use_embeddings=False)
+
+    assert router.route("full names and annual figures", SCHEMA, schema_version=1)["query_type"] == "SQL"
+    assert router.route("full names and annual figures")["query_type"] == "HYBRID"
+
+def test_weak_lexical_decisions_fall_back_to_embedding_centroids():
+    router = IntentRouter(
+        examples={"SQL": ["count rows"], "DOCUMENT": ["read the resume"]}, use_embeddings=True, min_confidence=0.6
+    )
+    # A fake encoder that puts anything about "rows" on one axis and everything else on the other
+    encode = lambda texts: np.array([[1.0, 0.0] if "rows" in text else [0.0, 1.0] for text in texts])
+
+    routing = router.route("tally the rows", encode=encode)
+    strong = router.route("What is John's email and GitHub link?", encode=encode)
+
+    assert routing["query_type"] == "SQL"
+    assert routing["method"] == "embedding"
+    assert routing["confidence"] > 0.99
+    # Confident lexical decisions never consult the model
+    assert strong["method"] == "lexical"
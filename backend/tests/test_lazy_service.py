@@ -0,0 +1,44 @@
+import time
+import threading
+import pytest
+from core.services.lazy_service import LazyService
+
+def test_service_is_created_once_across_threads():
+    created = []
+
+    def factory():
+        time.sleep(0.05)
+        created.append(object())
+        return created[-1]
+
+    service = LazyService("slow", factory)
+    assert service.peek() is None and not service.is_ready
+
+    instances = []
+    threads = [threading.Thread(target=lambda: instances.append(service.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(instance is created[0] for instance in instances)
+    assert service.get_status()["status"] == "ready"
+    assert service.get_status()["load_seconds"] >= 0.05
+
+def test_failed_creation_is_reported_and_retried():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("model download failed")
+        return "service"
+
+    service = LazyService("flaky", factory)
+    with pytest.raises(RuntimeError):
+        service.get()
+    assert service.get_status() == {"status": "failed", "load_seconds": None, "error": "model download failed"}
+
+    assert service.get() == "service"
+    assert service.get_status()["status"] == "ready" and service.get_status()["error"] is None
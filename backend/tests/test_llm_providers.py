@@ -0,0 +1,60 @@
+import json
+import asyncio
+import pytest
+from core.services.llm_providers import StubLLMProvider, create_llm_provider
+from core.services.schema_linker import schema_to_ddl
+
+SCHEMA = {"tables": [
+    {"name": "departments", "columns": [{"name": "dept_id", "type": "INTEGER", "is_primary_key": True},
+                                        {"name": "dept_name", "type": "VARCHAR(255)"}], "foreign_keys": []},
+    {"name": "employees", "columns": [{"name": "emp_id", "type": "INTEGER", "is_primary_key": True},
+                                      {"name": "annual_salary", "type": "NUMERIC(10, 2)"}], "foreign_keys": []},
+]}
+
+def sql_prompt(question):
+    return f'**Database Schema:**\n```\n{schema_to_ddl(SCHEMA)}\n```\n\n**User\'s Question:**\n"{question}"\n\n**Instructions:**\n'
+
+@pytest.mark.parametrize("question, expected", [
+    ("How many employees are there?", "SELECT COUNT(*) AS count FROM employees;"),
+    ("What is the average salary?", "SELECT AVG(annual_salary) AS avg_annual_salary FROM employees;"),
+    ("Show all departments", "SELECT * FROM departments LIMIT 10;"),
+])
+def test_stub_generates_template_sql(question, expected):
+    assert StubLLMProvider().generate(sql_prompt(question)) == expected
+
+def test_stub_extracts_the_best_matching_sentence():
+    prompt = (
+        '**Document Snippets:**\n---\n'
+        '[1] (from a.txt)\nJohn is a developer. His email is john@example.com.\n---\n'
+        '[2] (from b.txt)\nNothing relevant here.\n---\n\n'
+        '**User\'s Question:**\n"What is John\'s email?"\n\n'
+        '3. If the answer cannot be found in a snippet, its answer should be ONLY the phrase: "Not found."\n'
+    )
+
+    answers = json.loads(asyncio.run(StubLLMProvider().agenerate(prompt)))
+
+    assert answers == [{"snippet": 1, "answer": "His email is john@example.com."}, {"snippet": 2, "answer": "Not found."}]
+
+def test_stub_streams_the_same_reply_in_pieces():
+    prompt = sql_prompt("What is the average salary?")
+
+    async def collect():
+        return [piece async for piece in StubLLMProvider().astream(prompt)]
+
+    pieces = asyncio.run(collect())
+    assert len(pieces) > 1
+    assert "".join(pieces) == StubLLMProvider().generate(prompt)
+
+def test_stub_latency_is_reproducible_for_a_seed():
+    first = StubLLMProvider(latency_seconds=0.1, jitter_seconds=0.05, seed=7)
+    second = StubLLMProvider(latency_seconds=0.1, jitter_seconds=0.05, seed=7)
+
+    assert [first._next_latency() for _ in range(5)] == [second._next_latency() for _ in range(5)]
+
+def test_provider_is_selected_from_settings(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = {"provider": "stub", "model_name": "unused", "stub_latency_ms": 0, "stub_jitter_ms": 0, "stub_seed": 0}
+
+    assert isinstance(create_llm_provider(settings), StubLLMProvider)
+    assert create_llm_provider({**settings, "provider": "gemini"}) is None
+    assert create_llm_provider({**settings, "provider": "none"}) is None
@@ -0,0 +1,190 @@
+import time
+import asyncio
+import threading
+import pytest
+from core.services.llm_providers import LLMProvider, RateLimitError
+from core.services.llm_scheduler import LLMQueueFullError, LLMScheduler
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+
+    def __init__(self, delay=0.05, rate_limited_calls=0):
+        self.delay = delay
+        self.rate_limited_calls = rate_limited_calls
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def _begin(self):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            throttled = self.calls <= self.rate_limited_calls
+        return throttled
+
+    def _end(self, prompt):
+        with self._lock:
+            self.running -= 1
+        return self._reply(prompt)
+
+    def generate(self, prompt):
+        throttled = self._begin()
+        time.sleep(self.delay)
+        if throttled:
+            self._end(prompt)
+            raise RateLimitError("429 Resource has been exhausted")
+        return self._end(prompt)
+
+    async def agenerate(self, prompt):
+        throttled = self._begin()
+        await asyncio.sleep(self.delay)
+        if throttled:
+            self._end(prompt)
+            raise RateLimitError("429 Resource has been exhausted")
+        return self._end(prompt)
+
+    async def astream(self, prompt):
+        throttled = self._begin()
+        try:
+            await asyncio.sleep(self.delay)
+            if throttled:
+                raise RateLimitError("429 Resource has been exhausted")
+            for word in self._reply(prompt).split(" "):
+                yield word + " "
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    @staticmethod
+    def _reply(prompt):
+        return f"reply to {prompt}"
+
+def make_scheduler(provider, **overrides):
+    settings = {"max_concurrency": 2, "max_queue": 64, "max_retries": 3, "retry_base_seconds": 0, "retry_max_seconds": 0}
+    settings.update(overrides)
+    return LLMScheduler(provider, **settings)
+
+def test_identical_in_flight_prompts_are_coalesced():
+    provider = FakeProvider()
+    scheduler = make_scheduler(provider)
+
+    async def burst():
+        return await asyncio.gather(*(scheduler.agenerate("same prompt") for _ in range(5)))
+
+    assert asyncio.run(burst()) == ["reply to same prompt"] * 5
+    assert provider.calls == 1
+    assert scheduler.get_stats()["coalesced"] == 4
+
+def test_sync_callers_share_one_call_for_the_same_prompt():
+    provider = FakeProvider(delay=0.2)
+    scheduler = make_scheduler(provider)
+    replies = []
+    threads = [threading.Thread(target=lambda: replies.append(scheduler.generate("same prompt"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert replies == ["reply to same prompt"] * 4
+    assert provider.calls == 1
+
+def test_concurrency_is_capped_and_wait_time_is_recorded():
+    provider = FakeProvider()
+    scheduler = make_scheduler(provider, max_concurrency=2)
+
+    async def burst():
+        return await asyncio.gather(*(scheduler.agenerate(f"prompt {i}") for i in range(6)))
+
+    asyncio.run(burst())
+
+    stats = scheduler.get_stats()
+    assert provider.max_running == 2
+    assert stats["calls"] == 6
+    assert stats["max_queue_depth"] >= 4
+    assert stats["wait_seconds_max"] > 0
+
+def test_rate_limited_calls_are_retried():
+    provider = FakeProvider(delay=0, rate_limited_calls=2)
+    scheduler = make_scheduler(provider)
+
+    assert asyncio.run(scheduler.agenerate("prompt")) == "reply to prompt"
+    stats = scheduler.get_stats()
+    assert stats["retries"] == 2 and stats["rate_limited"] == 2 and stats["failures"] == 0
+
+    # Once the retries are exhausted the rate limit error reaches the caller
+    provider.calls, provider.rate_limited_calls = 0, 10
+    with pytest.raises(RateLimitError):
+        scheduler.generate("another prompt")
+    assert scheduler.get_stats()["failures"] == 1
+
+def test_calls_beyond_the_queue_limit_are_rejected():
+    scheduler = make_scheduler(FakeProvider(), max_concurrency=1, max_queue=1)
+
+    async def burst():
+        return await asyncio.gather(*(scheduler.agenerate(f"prompt {i}") for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+
+    assert isinstance(results[2], LLMQueueFullError)
+    assert results[:2] == ["reply to prompt 0", "reply to prompt 1"]
+
+def test_streams_are_capped_and_retried_before_the_first_piece():
+    provider = FakeProvider(rate_limited_calls=1)
+    scheduler = make_scheduler(provider, max_concurrency=2)
+
+    async def collect(prompt):
+        return "".join([piece async for piece in scheduler.astream(prompt)])
+
+    async def burst():
+        return await asyncio.gather(*(collect(f"prompt {i}") for i in range(4)))
+
+    assert asyncio.run(burst()) == [f"reply to prompt {i} " for i in range(4)]
+    stats = scheduler.get_stats()
+    assert provider.max_running == 2
+    assert stats["retries"] == 1 and stats["calls"] == 4 and stats["running"] == 0
+
+def test_cap_and_coalescing_hold_across_threads_and_event_loops():
+    """Sync callers and batches on separate loops (asyncio.run in threads) share the slots and the calls in flight."""
+    provider = FakeProvider(delay=0.1)
+    scheduler = make_scheduler(provider, max_concurrency=2)
+    replies = []
+
+    def sync_caller(i):
+        replies.append(scheduler.generate(f"prompt {i}"))
+
+    def batch(offset):
+        async def burst():
+            return await asyncio.gather(*(scheduler.agenerate(f"prompt {offset + i}") for i in range(3)))
+        replies.extend(asyncio.run(burst()))
+
+    threads = [threading.Thread(target=sync_caller, args=(i,)) for i in range(3)]
+    threads += [threading.Thread(target=batch, args=(offset,)) for offset in (3, 6)]
+    # Same prompts as the sync callers, on yet another loop
+    threads.append(threading.Thread(target=batch, args=(0,)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(replies) == sorted([f"reply to prompt {i}" for i in range(9)] + [f"reply to prompt {i}" for i in range(3)])
+    assert provider.max_running == 2
+    stats = scheduler.get_stats()
+    assert stats["running"] == 0 and stats["queue_depth"] == 0
+    assert provider.calls + stats["coalesced"] == 12
+
+def test_cancelled_waiter_gives_back_its_slot():
+    provider = FakeProvider(delay=0.1)
+    scheduler = make_scheduler(provider, max_concurrency=1)
+
+    async def run():
+        first = asyncio.ensure_future(scheduler.agenerate("first"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.agenerate("second"), 0.02)
+        return await first
+
+    assert asyncio.run(run()) == "reply to first"
+    # The abandoned call still completed in the background or freed its slot; either way one is free now
+    assert scheduler.generate("third") == "reply to third"
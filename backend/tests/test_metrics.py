@@ -0,0 +1,109 @@
+from unittest import mock
+from core.services.metrics import MetricsRegistry, RollingHistogram
+
+def test_histogram_percentiles_over_window():
+    histogram = RollingHistogram(window_seconds=60, max_samples=1000)
+    for value in range(1, 101):
+        histogram.observe(value / 100, now=1000.0)
+
+    summary = histogram.snapshot(now=1000.0)
+    assert summary["count"] == 100
+    assert summary["p50"] == 0.51
+    assert summary["p95"] == 0.96
+    assert summary["p99"] == 1.0
+    assert abs(summary["avg"] - 0.505) < 1e-9
+    assert summary["previous_avg"] is None
+
+def test_histogram_moves_old_samples_to_previous_window():
+    histogram = RollingHistogram(window_seconds=60, max_samples=1000)
+    histogram.observe(2.0, now=1000.0)
+    histogram.observe(1.0, now=1070.0)
+
+    summary = histogram.snapshot(now=1070.0)
+    assert summary["count"] == 1
+    assert summary["avg"] == 1.0
+    assert summary["previous_avg"] == 2.0
+    assert summary["lifetime_count"] == 2
+
+    # Beyond two windows the sample is dropped, but lifetime totals remain
+    summary = histogram.snapshot(now=1200.0)
+    assert summary["count"] == 0 and summary["previous_count"] == 0
+    assert summary["lifetime_sum"] == 3.0
+
+def test_registry_counts_queries_and_qps():
+    registry = MetricsRegistry(window_seconds=10, max_samples=100)
+    with mock.patch("core.services.metrics.time.time", return_value=registry._started_at + 10):
+        for _ in range(5):
+            registry.record_query("SQL", "ok")
+        registry.record_query("DOCUMENT", "error")
+        snapshot = registry.get_snapshot()
+
+    assert snapshot["queries_total"] == 6
+    assert {"query_type": "SQL", "status": "ok", "count": 5} in snapshot["queries_by_status"]
+    assert snapshot["qps"] == 0.6
+    assert snapshot["previous_qps"] == 0.0
+
+def test_timer_records_a_sample_even_on_error():
+    registry = MetricsRegistry(window_seconds=10, max_samples=100)
+    try:
+        with registry.timer("sql_execution"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert registry.get_snapshot()["stages"]["sql_execution"]["count"] == 1
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry(window_seconds=10, max_samples=100)
+    registry.observe("query_total", 0.25)
+    registry.record_query("SQL", "cache_hit")
+
+    text = registry.render_prometheus({"index_vectors": ("Vectors in the document index.", 42)})
+    lines = text.splitlines()
+    assert "# TYPE nlpqe_stage_duration_seconds summary" in lines
+    assert 'nlpqe_stage_duration_seconds{stage="query_total",quantile="0.95"} 0.250000' in lines
+    assert 'nlpqe_stage_duration_seconds_count{stage="query_total"} 1' in lines
+    assert 'nlpqe_queries_total{query_type="SQL",status="cache_hit"} 1' in lines
+    assert "nlpqe_index_vectors 42" in lines
+    assert text.endswith("\n")
+
+def test_reset_drops_samples_and_counters():
+    registry = MetricsRegistry(window_seconds=10, max_samples=100)
+    registry.observe("embedding", 0.1)
+    registry.observe("custom_stage", 0.2)
+    registry.record_query("SQL", "ok")
+    registry.reset()
+
+    snapshot = registry.get_snapshot()
+    assert snapshot["queries_total"] == 0
+    assert snapshot["stages"]["embedding"]["lifetime_count"] == 0
+    assert "custom_stage" not in snapshot["stages"]
+
+def test_metrics_endpoints_do_not_load_the_document_processor(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from api.routes.ingestion import document_processor_service
+    from api.routes.query import get_query_engine
+    from core.services.llm_providers import StubLLMProvider
+    from core.services.query_engine import QueryEngine
+    from core.services.schema_cache import SchemaCache
+    from main import app
+
+    def load_model():
+        raise AssertionError("the metrics endpoints loaded the embedding model")
+
+    monkeypatch.setattr(document_processor_service, "_instance", None)
+    monkeypatch.setattr(document_processor_service, "_factory", load_model)
+    engine = QueryEngine(schema_cache=SchemaCache(cache_path=str(tmp_path / "schema.json")), llm=StubLLMProvider())
+    app.dependency_overrides[get_query_engine] = lambda: engine
+    try:
+        client = TestClient(app)
+        dashboard = client.get("/api/metrics")
+        prometheus = client.get("/api/metrics/prometheus")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert dashboard.status_code == 200 and prometheus.status_code == 200
+    summary = {card["title"]: card["value"] for card in dashboard.json()["summary_metrics"]}
+    assert summary["Documents Processed"] == "0"
+    assert dashboard.json()["performance"]["index"] == {"type": None, "vectors": 0}
+    assert "nlpqe_index_vectors 0" in prometheus.text.splitlines()
+    assert document_processor_service.peek() is None
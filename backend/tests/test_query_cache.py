@@ -0,0 +1,200 @@
+import numpy as np
+from core.services.query_cache import QueryResultCache, SemanticSQLCache, SharedQueryResultCache, normalize_query
+
+def make_result(rows=1):
+    return {"results": [{"source": "Database", "data": [{"id": i} for i in range(rows)]}],
+            "performance_metrics": {"cache_status": "miss"}}
+
+def test_normalize_query_ignores_case_whitespace_and_punctuation():
+    assert normalize_query("  How many   Employees? ") == normalize_query("how many employees")
+
+def test_normalize_query_keeps_operators_and_numbers():
+    assert normalize_query("Employees with salary > 100000?") != normalize_query("employees with salary < 100000")
+    assert normalize_query("salary >= 100000") != normalize_query("salary = 100000")
+    assert normalize_query("bonus of -1.5") != normalize_query("bonus of 15")
+    assert normalize_query("Employees with salary > 100000?") == normalize_query("employees with  salary > 100000")
+
+def test_hits_return_copies_of_the_stored_result():
+    """Mutating a cache hit must not change the stored entry."""
+    cache = QueryResultCache(ttl_seconds=300, max_entries=10, max_bytes=10_000)
+    cache.set("How many employees?", make_result())
+
+    hit = cache.get("how many employees")
+    hit["performance_metrics"]["cache_status"] = "hit"
+
+    assert cache.get("How many employees?")["performance_metrics"]["cache_status"] == "miss"
+    assert cache.get("unknown query") is None
+    stats = cache.get_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+def test_entry_and_byte_limits_evict_least_recently_used():
+    cache = QueryResultCache(ttl_seconds=300, max_entries=2, max_bytes=10_000)
+    cache.set("first", make_result())
+    cache.set("second", make_result())
+    cache.get("first")
+    cache.set("third", make_result())
+
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get_stats()["evictions"] == 1
+
+    # A result larger than the whole budget is never stored
+    cache.set("huge", make_result(rows=5000))
+    assert cache.get("huge") is None
+    assert cache.get_stats()["bytes"] <= 10_000
+
+def test_version_change_invalidates_cache():
+    """Results are dropped when the schema or document index version changes."""
+    cache = QueryResultCache(ttl_seconds=300, max_entries=10, max_bytes=10_000)
+    cache.set("how many employees", make_result(), versions=("schema-v1", 0))
+
+    assert cache.get("how many employees", versions=("schema-v1", 0)) is not None
+    assert cache.get("how many employees", versions=("schema-v1", 1)) is None
+    assert len(cache) == 0
+
+def test_shared_cache_is_shared_between_workers(tmp_path):
+    """Two caches on one file stand in for two worker processes."""
+    path = str(tmp_path / "query_cache.sqlite")
+    first = SharedQueryResultCache(path=path, ttl_seconds=300, max_entries=2, max_bytes=100_000)
+    second = SharedQueryResultCache(path=path, ttl_seconds=300, max_entries=2, max_bytes=100_000)
+    first.set("How many employees?", make_result(), versions=("schema-v1", 3))
+
+    hit = second.get("how many employees", versions=("schema-v1", 3))
+    hit["performance_metrics"]["cache_status"] = "hit"
+
+    assert first.get("How many employees?", versions=("schema-v1", 3))["performance_metrics"]["cache_status"] == "miss"
+    assert second.get("how many employees", versions=("schema-v1", 4)) is None
+
+    # Storing a result for a newer index version drops the older results everywhere
+    second.set("list departments", make_result(), versions=("schema-v1", 4))
+    second.set("list offices", make_result(), versions=("schema-v1", 4))
+    second.get("list departments", versions=("schema-v1", 4))
+    first.set("list positions", make_result(), versions=("schema-v1", 4))
+    assert len(first) == 2
+    assert first.get("list offices", versions=("schema-v1", 4)) is None
+    assert first.get_stats()["evictions"] == 1
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_sql_cache_reuses_sql_for_paraphrases_above_the_threshold():
+    cache = SemanticSQLCache(similarity_threshold=0.9, max_entries=10)
+    cache.set("How many employees?", "SELECT COUNT(*) FROM employees", unit(1, 0.1), schema_version="v1")
+
+    hit = cache.get("headcount", unit(1, 0.2), schema_version="v1")
+    assert hit["sql"] == "SELECT COUNT(*) FROM employees"
+    assert hit["matched_query"] == "how many employees"
+    assert cache.get("average salary", unit(0.1, 1), schema_version="v1") is None
+    # Without an embedding only the normalized exact match can hit
+    assert cache.get("how many EMPLOYEES", schema_version="v1") is not None
+
+def test_sql_cache_requires_matching_literals_and_schema_version():
+    cache = SemanticSQLCache(similarity_threshold=0.9, max_entries=10)
+    cache.set("Average salary in Sales", "SELECT ... 'Sales'", unit(1, 0), schema_version="v1")
+
+    assert cache.get("Average salary in Marketing", unit(1, 0), schema_version="v1") is None
+    assert cache.get("Mean salary in Sales", unit(1, 0), schema_version="v1") is not None
+    assert cache.get("Mean salary in Sales", unit(1, 0), schema_version="v2") is None
+
+def test_sql_cache_keeps_entries_of_other_schemas():
+    """Alternating between databases never drops the other database's SQL."""
+    cache = SemanticSQLCache(similarity_threshold=0.9, max_entries=10)
+    cache.set("How many employees?", "SELECT COUNT(*) FROM employees", unit(1, 0), schema_version="a")
+    cache.set("How many employees?", "SELECT COUNT(*) FROM staff", unit(1, 0), schema_version="b")
+
+    assert cache.get("headcount", unit(1, 0.1), schema_version="a")["sql"] == "SELECT COUNT(*) FROM employees"
+    assert cache.get("headcount", unit(1, 0.1), schema_version="b")["sql"] == "SELECT COUNT(*) FROM staff"
+    cache.discard("how many employees", schema_version="b")
+    assert cache.get("How many employees?", schema_version="b") is None
+    assert cache.get("How many employees?", schema_version="a") is not None
+    assert len(cache) == 1
+
+
+def test_results_are_scoped_to_their_database(tmp_path):
+    """Databases with identical schemas (same versions) never share cached results."""
+    shared = SharedQueryResultCache(path=str(tmp_path / "query_cache.sqlite"), ttl_seconds=300, max_entries=10, max_bytes=100_000)
+    for cache in (QueryResultCache(ttl_seconds=300, max_entries=10, max_bytes=10_000), shared):
+        cache.set("how many employees", make_result(), versions=("schema-v1", 0), scope="a")
+
+        assert cache.get("how many employees", versions=("schema-v1", 0), scope="a") is not None
+        assert cache.get("how many employees", versions=("schema-v1", 0), scope="b") is None
+
+def test_version_changes_only_invalidate_their_own_database(tmp_path):
+    """Databases on different schema versions keep their results while queries alternate between them."""
+    shared = SharedQueryResultCache(path=str(tmp_path / "query_cache.sqlite"), ttl_seconds=300, max_entries=10, max_bytes=100_000)
+    for cache in (QueryResultCache(ttl_seconds=300, max_entries=10, max_bytes=10_000), shared):
+        cache.set("how many employees", make_result(1), versions=("schema-a", 0), scope="a")
+        cache.set("how many employees", make_result(2), versions=("schema-b", 0), scope="b")
+
+        assert cache.get("how many employees", versions=("schema-a", 0), scope="a") is not None
+        assert cache.get("how many employees", versions=("schema-b", 0), scope="b") is not None
+        assert cache.get_stats()["invalidations"] == 0
+
+        # A schema change in b drops b's results only
+        cache.set("average salary", make_result(), versions=("schema-b2", 0), scope="b")
+        assert cache.get("how many employees", versions=("schema-b2", 0), scope="b") is None
+        assert cache.get("how many employees", versions=("schema-a", 0), scope="a") is not None
+
+def test_engine_does_not_serve_another_databases_result(tmp_path):
+    import sqlite3
+    from core.services.llm_providers import StubLLMProvider
+    from core.services.query_engine import QueryEngine
+    from core.services.schema_cache import SchemaCache
+
+    connection_strings = []
+    for name, rows in (("a.db", 3), ("b.db", 7)):
+        conn = sqlite3.connect(tmp_path / name)
+        conn.execute("CREATE TABLE employees (emp_id INTEGER PRIMARY KEY, full_name TEXT)")
+        conn.executemany("INSERT INTO employees (full_name) VALUES (?)", [(f"e{i}",) for i in range(rows)])
+        conn.commit()
+        conn.close()
+        connection_strings.append(f"sqlite:///{tmp_path / name}")
+
+    engine = QueryEngine(schema_cache=SchemaCache(cache_path=str(tmp_path / "schema.json")), llm=StubLLMProvider())
+    engine.cache = QueryResultCache(ttl_seconds=300, max_entries=10, max_bytes=100_000)
+    # Once both schemas are cached, both databases have the same versions
+    counts = [engine.process_query("How many employees?", cs, None)["results"][0]["data"][0]["count"] for cs in connection_strings * 2]
+
+    assert counts == [3, 7, 3, 7]
+
+def test_engine_keeps_results_of_databases_with_different_schemas(tmp_path):
+    import sqlite3
+    from core.services.llm_providers import StubLLMProvider
+    from core.services.query_engine import QueryEngine
+    from core.services.schema_cache import SchemaCache
+
+    connection_strings = []
+    for name, extra_column in (("a.db", ""), ("b.db", ", email TEXT")):
+        conn = sqlite3.connect(tmp_path / name)
+        conn.execute(f"CREATE TABLE employees (emp_id INTEGER PRIMARY KEY, full_name TEXT{extra_column})")
+        conn.commit()
+        conn.close()
+        connection_strings.append(f"sqlite:///{tmp_path / name}")
+
+    engine = QueryEngine(schema_cache=SchemaCache(cache_path=str(tmp_path / "schema.json")), llm=StubLLMProvider())
+    engine.cache = QueryResultCache(ttl_seconds=300, max_entries=10, max_bytes=100_000)
+    for cs in connection_strings * 3:
+        engine.process_query("How many employees?", cs, None)
+
+    stats = engine.cache.get_stats()
+    # The first round misses (its lookups precede schema discovery), then every lookup hits
+    assert stats["hits"] == 4 and stats["invalidations"] == 0
+
+def test_cache_versions_follow_the_shared_store_generation(tmp_path):
+    """A worker whose index is behind the store syncs before it reads or stores cached results."""
+    from core.services.llm_providers import StubLLMProvider
+    from core.services.query_engine import QueryEngine
+    from core.services.schema_cache import SchemaCache
+
+    class BehindProcessor:
+        index_version = 1
+        store_generation = 3
+
+        def sync_with_store(self, force=False):
+            # Stands in for DocumentProcessor reloading the index another worker changed
+            if force:
+                self.index_version = self.store_generation
+
+    engine = QueryEngine(schema_cache=SchemaCache(cache_path=str(tmp_path / "schema.json")), llm=StubLLMProvider())
+    assert engine._cache_versions("sqlite:///a.db", BehindProcessor()) == (None, 3)
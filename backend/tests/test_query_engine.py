@@ -0,0 +1,276 @@
+import asyncio
+import json
+import sqlite3
+import faiss
+import numpy as np
+import pytest
+from core.services.document_processor import DocumentProcessor
+from core.services.llm_providers import StubLLMProvider
+from core.services.query_cache import QueryResultCache
+from core.services.query_engine import NOT_FOUND_ANSWER, QueryEngine
+from core.services.schema_cache import SchemaCache
+
+HYBRID_QUERY = "employees salary and resume skills"
+RESUME_HIT = {"document": {"filename": "resume.txt", "page": None, "content": "Jane lists SQL and Python as her skills."}, "score": 0.9}
+
+class FakeDocuments:
+    """Stands in for DocumentProcessor: every query retrieves the same resume chunk after `delay` seconds."""
+    model = None
+    index_version = 0
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def sync_with_store(self, force=False):
+        pass
+
+    async def aretrieve(self, user_query, k=1, score_threshold=None, max_per_file=1):
+        await asyncio.sleep(self.delay)
+        return [RESUME_HIT]
+
+@pytest.fixture
+def connection_string(tmp_path):
+    conn = sqlite3.connect(tmp_path / "hr.db")
+    conn.execute("CREATE TABLE employees (emp_id INTEGER PRIMARY KEY, full_name TEXT, salary REAL)")
+    conn.executemany("INSERT INTO employees (full_name, salary) VALUES (?, ?)", [("Jane", 120000), ("Omar", 95000)])
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{tmp_path / 'hr.db'}"
+
+def make_engine(tmp_path, latency_seconds=0.0, sql_timeout=5.0, documents_timeout=5.0) -> QueryEngine:
+    engine = QueryEngine(schema_cache=SchemaCache(cache_path=str(tmp_path / "schema.json")), llm=StubLLMProvider(latency_seconds=latency_seconds))
+    engine.cache = QueryResultCache(ttl_seconds=300, max_entries=10, max_bytes=100_000)
+    engine.branch_timeouts = {"sql": sql_timeout, "documents": documents_timeout}
+    return engine
+
+def test_extraction_answers_map_to_their_snippets():
+    response = """```json
+    [{"snippet": 3, "answer": "Berlin"}, {"snippet": 1, "answer": " jane@example.com "}, {"snippet": 9, "answer": "ignored"}]
+    ```"""
+
+    answers = QueryEngine._parse_extraction_response(response, 3)
+
+    assert answers == ["jane@example.com", NOT_FOUND_ANSWER, "Berlin"]
+
+def test_unparseable_extraction_reply_answers_the_best_snippet():
+    answers = QueryEngine._parse_extraction_response("Jane can be reached at jane@example.com.", 3)
+
+    assert answers == ["Jane can be reached at jane@example.com.", NOT_FOUND_ANSWER, NOT_FOUND_ANSWER]
+
+def test_partially_parsed_extraction_reply_discards_earlier_answers():
+    """A reply that breaks part way through must not mix parsed answers with the raw-text fallback."""
+    response = '[{"snippet": 2, "answer": "Berlin"}, {"snippet": "three", "answer": "Paris"}]'
+
+    answers = QueryEngine._parse_extraction_response(response, 3)
+
+    assert answers == [response, NOT_FOUND_ANSWER, NOT_FOUND_ANSWER]
+    assert QueryEngine._parse_extraction_response('[{"snippet": 1}]', 2) == ['[{"snippet": 1}]', NOT_FOUND_ANSWER]
+    assert QueryEngine._parse_extraction_response("not json", 0) == []
+
+def test_search_keeps_the_best_chunks_per_file():
+    vectors = np.eye(4, dtype=np.float32)
+    vectors[1] = [0.9, 0.1, 0, 0]
+    vectors[2] = [0.8, 0.2, 0, 0]
+    vectors[3] = [0.7, 0.3, 0, 0]
+    faiss.normalize_L2(vectors)
+    processor = DocumentProcessor.__new__(DocumentProcessor)
+    processor.index = faiss.IndexIDMap2(faiss.IndexFlatIP(4))
+    processor.index.add_with_ids(vectors, np.arange(4, dtype=np.int64))
+    processor.documents = {
+        0: {"filename": "a.txt", "content": "a1"},
+        1: {"filename": "a.txt", "content": "a2"},
+        2: {"filename": "b.txt", "content": "b1"},
+        3: {"filename": "a.txt", "content": "a3"},
+    }
+    query = np.array([[1, 0, 0, 0]], dtype=np.float32)
+
+    [one_per_file] = processor._search(query, k=3, score_threshold=None, max_per_file=1)
+    [two_per_file] = processor._search(query, k=3, score_threshold=None, max_per_file=2)
+
+    assert [hit["document"]["content"] for hit in one_per_file] == ["a1", "b1"]
+    assert [hit["document"]["content"] for hit in two_per_file] == ["a1", "a2", "b1"]
+    assert one_per_file[0]["score"] >= one_per_file[1]["score"]
+
+@pytest.mark.parametrize("slow_branch", ["sql", "documents"])
+def test_slow_branch_times_out_without_failing_the_other(tmp_path, connection_string, slow_branch):
+    """Each branch has its own limit: the slow one becomes an error entry, the other still answers."""
+    if slow_branch == "sql":
+        # Only the SQL branch's generation call outlives its limit
+        engine = make_engine(tmp_path, latency_seconds=0.3, sql_timeout=0.05, documents_timeout=5.0)
+        documents = FakeDocuments()
+    else:
+        engine = make_engine(tmp_path, sql_timeout=5.0, documents_timeout=0.05)
+        documents = FakeDocuments(delay=0.5)
+
+    result = asyncio.run(engine.aprocess_query(HYBRID_QUERY, connection_string, documents))
+
+    timings = result["performance_metrics"]["branch_timings"]
+    fast_branch = "documents" if slow_branch == "sql" else "sql"
+    assert result["query_type"] == "HYBRID"
+    assert timings[slow_branch]["status"] == "timeout" and timings[fast_branch]["status"] == "ok"
+    assert timings[slow_branch]["seconds"] < 0.3
+    results = {entry["source"]: entry["data"] for entry in result["results"]}
+    slow_source, fast_source = ("Database", "Documents") if slow_branch == "sql" else ("Documents", "Database")
+    assert "timed out after 0.05s" in results[slow_source]["error"]
+    assert "error" not in results[fast_source] and results[fast_source]
+
+def test_timed_out_results_are_not_cached(tmp_path, connection_string):
+    engine = make_engine(tmp_path, sql_timeout=5.0, documents_timeout=0.05)
+    documents = FakeDocuments(delay=0.5)
+
+    first = asyncio.run(engine.aprocess_query(HYBRID_QUERY, connection_string, documents))
+    second = asyncio.run(engine.aprocess_query(HYBRID_QUERY, connection_string, documents))
+
+    assert first["performance_metrics"]["branch_timings"]["documents"]["status"] == "timeout"
+    assert second["performance_metrics"]["cache_status"] == "miss"
+    assert len(engine.cache) == 0
+
+    # Once both branches finish in time the result is cached and served
+    documents.delay = 0.0
+    asyncio.run(engine.aprocess_query(HYBRID_QUERY, connection_string, documents))
+    third = asyncio.run(engine.aprocess_query(HYBRID_QUERY, connection_string, documents))
+    assert third["performance_metrics"]["cache_status"] == "hit"
+
+class BatchDocuments(FakeDocuments):
+    """A FakeDocuments with an embedding model that counts the batched encode and search calls."""
+    class Model:
+        def encode(self, texts, **kwargs):
+            return np.ones((len(texts), 4), dtype=np.float32)
+
+    model = Model()
+
+    def __init__(self):
+        super().__init__()
+        self.encoded = []
+        self.searched_rows = []
+        self.retrieve_calls = 0
+
+    def encode_queries(self, user_queries):
+        self.encoded.append(list(user_queries))
+        return np.ones((len(user_queries), 4), dtype=np.float32)
+
+    def search(self, query_embeddings, k=1, score_threshold=None, max_per_file=1):
+        self.searched_rows.append(len(query_embeddings))
+        return [[RESUME_HIT] for _ in range(len(query_embeddings))]
+
+    async def aretrieve(self, user_query, k=1, score_threshold=None, max_per_file=1):
+        self.retrieve_calls += 1
+        return await super().aretrieve(user_query, k, score_threshold, max_per_file)
+
+class FailingCache(QueryResultCache):
+    """Fails to store the result of one query, as a broken cache write would."""
+    def set(self, user_query, result, versions=None, scope=None):
+        if user_query == "List the full names of employees":
+            raise RuntimeError("cache write failed")
+        super().set(user_query, result, versions, scope)
+
+BATCH = ["What is Jane's email in her resume?", "How many employees?", "List the full names of employees", HYBRID_QUERY]
+
+def test_batch_results_keep_the_order_of_the_queries(tmp_path, connection_string):
+    engine = make_engine(tmp_path)
+    # Later queries finish first: the batch must still answer in request order
+    engine.llm = StubLLMProvider(latency_seconds=0.05, jitter_seconds=0.04, seed=3)
+
+    results = engine.process_batch(BATCH, connection_string, BatchDocuments())
+
+    assert [result["user_query"] for result in results] == BATCH
+    assert [result["query_type"] for result in results] == ["DOCUMENT", "SQL", "SQL", "HYBRID"]
+    assert results[1]["results"][0]["data"][0]["count"] == 2
+
+def test_batch_isolates_a_failing_query(tmp_path, connection_string):
+    engine = make_engine(tmp_path)
+    engine.cache = FailingCache(ttl_seconds=300, max_entries=10, max_bytes=100_000)
+
+    results = engine.process_batch(BATCH, connection_string, BatchDocuments())
+
+    assert results[2] == {"user_query": BATCH[2], "error": "cache write failed"}
+    assert all("error" not in result for position, result in enumerate(results) if position != 2)
+    assert len(engine.cache) == 3
+
+def test_batch_encodes_and_searches_once(tmp_path, connection_string):
+    engine = make_engine(tmp_path)
+    documents = BatchDocuments()
+
+    engine.process_batch(BATCH, connection_string, documents)
+
+    assert documents.encoded == [BATCH]
+    # One search for the DOCUMENT and HYBRID queries together, no per-query retrieval
+    assert documents.searched_rows == [2]
+    assert documents.retrieve_calls == 0
+
+    # Cached queries skip all shared work
+    engine.process_batch(BATCH, connection_string, documents)
+    assert len(documents.encoded) == 1 and len(documents.searched_rows) == 1
+
+def read_sse_events(body: str) -> list:
+    """Parses a server-sent event stream into (name, data) pairs."""
+    events = []
+    for message in body.strip().split("\n\n"):
+        name_line, data_line = message.split("\n")
+        events.append((name_line.removeprefix("event: "), json.loads(data_line.removeprefix("data: "))))
+    return events
+
+def test_stream_endpoint_sends_events_in_order(tmp_path, connection_string, monkeypatch):
+    from fastapi.testclient import TestClient
+    from api.routes.ingestion import get_doc_processor
+    from api.routes.query import get_query_engine
+    from main import app
+
+    monkeypatch.setenv("DATABASE_URL", connection_string)
+    engine = make_engine(tmp_path, latency_seconds=0.02)
+    app.dependency_overrides[get_query_engine] = lambda: engine
+    app.dependency_overrides[get_doc_processor] = lambda: FakeDocuments()
+    try:
+        response = TestClient(app).get("/api/query/stream", params={"query": HYBRID_QUERY})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    events = read_sse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "classification" and events[0][1]["query_type"] == "HYBRID"
+    assert names[-1] == "end" and names.count("end") == 1
+    assert "error" not in names
+    # Each branch keeps its own order, whatever the interleaving between them
+    sql_events = [name for name in names if name in ("sql_delta", "sql", "row", "sql_end")]
+    assert sql_events == ["sql_delta"] * names.count("sql_delta") + ["sql"] + ["row"] * names.count("row") + ["sql_end"]
+    assert names.count("sql_delta") > 0 and names.count("row") == dict(events)["sql_end"]["row_count"] > 0
+    document_events = [name for name in names if name in ("snippets", "answer_delta", "documents")]
+    assert document_events == ["snippets"] + ["answer_delta"] * names.count("answer_delta") + ["documents"]
+    assert events[-1][1]["performance_metrics"]["branch_timings"].keys() == {"sql", "documents"}
+
+def test_closing_the_stream_cancels_running_branches(tmp_path, connection_string):
+    """A client that disconnects mid-stream closes the event generator, which must cancel both branches."""
+    class StalledDocuments(FakeDocuments):
+        cancelled = False
+
+        async def aretrieve(self, user_query, k=1, score_threshold=None, max_per_file=1):
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+
+    engine = make_engine(tmp_path)
+    documents = StalledDocuments()
+
+    async def disconnect_after_first_row():
+        events = engine.astream_query(HYBRID_QUERY, connection_string, documents)
+        received = [event["event"] async for event in _until_row(events)]
+        await events.aclose()
+        # Give the cancelled tasks a turn to unwind
+        await asyncio.sleep(0.05)
+        running = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return received, running
+
+    received, running = asyncio.run(disconnect_after_first_row())
+
+    assert received[0] == "classification" and received[-1] == "row"
+    assert documents.cancelled
+    assert running == []
+
+async def _until_row(events):
+    async for event in events:
+        yield event
+        if event["event"] == "row":
+            return
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from core.services.result_pager import SQLResultPager
+
+@pytest.fixture
+def connection_string(tmp_path):
+    url = f"sqlite:///{tmp_path / 'rows.db'}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO items (id, name) VALUES (:id, :name)"), [{"id": i, "name": f"item {i}"} for i in range(1, 26)])
+    engine.dispose()
+    return url
+
+def _pager():
+    return SQLResultPager(page_size=10, max_page_size=20, fetch_batch_rows=4)
+
+def test_first_page_and_token(connection_string):
+    pager = _pager()
+    page = pager.fetch_page("SELECT * FROM items ORDER BY id;", connection_string, user_query="list items")
+
+    assert [row["id"] for row in page["rows"]] == list(range(1, 11))
+    assert page["pagination"]["has_more"] is True
+    state = pager.resume(page["pagination"]["page_token"])
+    assert state["offset"] == 10
+    assert state["user_query"] == "list items"
+
+def test_pages_cover_every_row_once(connection_string):
+    pager = _pager()
+    ids, offset = [], 0
+    while True:
+        page = pager.fetch_page("SELECT id FROM items ORDER BY id", connection_string, offset)
+        ids += [row["id"] for row in page["rows"]]
+        if not page["pagination"]["has_more"]:
+            break
+        offset = pager.resume(page["pagination"]["page_token"])["offset"]
+
+    assert ids == list(range(1, 26))
+    assert page["pagination"]["page_token"] is None
+
+def test_page_size_is_clamped(connection_string):
+    pager = _pager()
+    assert pager.resolve_page_size(None) == 10
+    assert pager.resolve_page_size(500) == 20
+    page = pager.fetch_page("SELECT id FROM items", connection_string, page_size=500)
+    assert len(page["rows"]) == 20
+
+def test_unknown_token_raises():
+    with pytest.raises(KeyError):
+        _pager().resume("not-a-token")
+
+def test_iter_batches_respects_batch_size(connection_string):
+    batches = list(_pager().iter_batches("SELECT id FROM items", connection_string))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 25
+
+def test_async_page_and_stream(connection_string):
+    pager = _pager()
+
+    async def run():
+        page = await pager.afetch_page("SELECT id FROM items ORDER BY id", connection_string, offset=20)
+        streamed = [row async for batch in pager.aiter_batches("SELECT id FROM items", connection_string) for row in batch]
+        return page, streamed
+
+    page, streamed = asyncio.run(run())
+    assert [row["id"] for row in page["rows"]] == list(range(21, 26))
+    assert page["pagination"]["has_more"] is False
+    assert len(streamed) == 25
@@ -0,0 +1,59 @@
+import time
+import threading
+from core.services.rw_lock import ReadWriteLock
+
+def test_readers_share_the_lock_and_writers_wait_for_them():
+    lock = ReadWriteLock()
+    events = []
+    readers_in = threading.Barrier(2)
+
+    def reader(name):
+        with lock.read():
+            # Both readers must be inside at the same time to pass the barrier
+            readers_in.wait(timeout=2)
+            time.sleep(0.05)
+            events.append(f"{name} done")
+
+    def writer():
+        with lock.write():
+            events.append("writer")
+
+    readers = [threading.Thread(target=reader, args=(name,)) for name in ("a", "b")]
+    for thread in readers:
+        thread.start()
+    time.sleep(0.01)
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    for thread in readers + [writer_thread]:
+        thread.join(timeout=2)
+
+    assert sorted(events[:2]) == ["a done", "b done"]
+    assert events[2] == "writer"
+
+def test_waiting_writers_block_new_readers():
+    lock = ReadWriteLock()
+    events = []
+    release_reader = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            release_reader.wait(timeout=2)
+            events.append("first reader")
+
+    def writer():
+        with lock.write():
+            events.append("writer")
+
+    def late_reader():
+        with lock.read():
+            events.append("late reader")
+
+    threads = [threading.Thread(target=first_reader), threading.Thread(target=writer), threading.Thread(target=late_reader)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    release_reader.set()
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert events == ["first reader", "writer", "late reader"]
@@ -0,0 +1,150 @@
+from core.services.schema_cache import SchemaCache
+
+SAMPLE_SCHEMA = {"tables": [{"name": "employees", "columns": [], "foreign_keys": []}]}
+
+def test_schema_is_discovered_once_and_reused(mocker, tmp_path):
+    """Repeated lookups for the same connection string should only inspect the database once."""
+    # 1. ARRANGE: A mocked discovery service and a cache persisted to a temp file.
+    mock_discovery = mocker.Mock()
+    mock_discovery.analyze_database.return_value = SAMPLE_SCHEMA
+    mock_discovery.fingerprint.return_value = None
+    cache = SchemaCache(ttl_seconds=300, cache_path=str(tmp_path / "schema.json"), discovery=mock_discovery)
+
+    # 2. ACT
+    first = cache.get_schema("sqlite:///test.db")
+    second = cache.get_schema("sqlite:///test.db")
+
+    # 3. ASSERT
+    assert first == second == SAMPLE_SCHEMA
+    assert mock_discovery.analyze_database.call_count == 1
+    assert cache.get_version("sqlite:///test.db") == SchemaCache.compute_version(SAMPLE_SCHEMA)
+
+def test_force_refresh_and_ttl_expiry_rediscover(mocker, tmp_path):
+    """A forced refresh or an expired entry should trigger a new discovery."""
+    mock_discovery = mocker.Mock()
+    mock_discovery.analyze_database.return_value = SAMPLE_SCHEMA
+    mock_discovery.fingerprint.return_value = None
+    cache = SchemaCache(ttl_seconds=0, cache_path=str(tmp_path / "schema.json"), discovery=mock_discovery)
+
+    cache.get_schema("sqlite:///test.db")
+    cache.get_schema("sqlite:///test.db")
+    cache.ttl_seconds = 300
+    cache.get_schema("sqlite:///test.db", force_refresh=True)
+
+    assert mock_discovery.analyze_database.call_count == 3
+
+def test_warm_restart_loads_persisted_schema(mocker, tmp_path):
+    """A new cache instance should serve the persisted schema without running discovery."""
+    cache_file = tmp_path / "schema.json"
+    mock_discovery = mocker.Mock()
+    mock_discovery.analyze_database.return_value = SAMPLE_SCHEMA
+    mock_discovery.fingerprint.return_value = None
+    SchemaCache(ttl_seconds=300, cache_path=str(cache_file), discovery=mock_discovery).get_schema("sqlite:///test.db")
+
+    restarted_discovery = mocker.Mock()
+    restarted_discovery.fingerprint.return_value = None
+    restarted = SchemaCache(ttl_seconds=300, cache_path=str(cache_file), discovery=restarted_discovery)
+
+    assert restarted.get_schema("sqlite:///test.db") == SAMPLE_SCHEMA
+    restarted_discovery.analyze_database.assert_not_called()
+    # The raw connection string must never be written to disk
+    assert "sqlite:///test.db" not in cache_file.read_text()
+
+def test_errors_are_not_cached(mocker, tmp_path):
+    """Discovery errors should be returned to the caller but not stored."""
+    mock_discovery = mocker.Mock()
+    mock_discovery.analyze_database.return_value = {"error": "connection refused"}
+    mock_discovery.fingerprint.return_value = None
+    cache = SchemaCache(ttl_seconds=300, cache_path=str(tmp_path / "schema.json"), discovery=mock_discovery)
+
+    assert "error" in cache.get_schema("sqlite:///test.db")
+    assert cache.get_version("sqlite:///test.db") is None
+
+def test_expired_entry_reinspects_only_changed_tables(mocker, tmp_path):
+    """After the TTL, an unchanged fingerprint keeps the schema and a changed one re-inspects only what changed."""
+    departments = {"name": "departments", "columns": [], "foreign_keys": []}
+    employees = {"name": "employees", "columns": [], "foreign_keys": []}
+    employees_v2 = {"name": "employees", "columns": [{"name": "email", "type": "TEXT", "is_primary_key": False}], "foreign_keys": []}
+    mock_discovery = mocker.Mock()
+    mock_discovery.fingerprint.return_value = {"departments": "a", "employees": "b"}
+    mock_discovery.analyze_database.return_value = {"tables": [departments, employees]}
+    cache = SchemaCache(ttl_seconds=0, cache_path=str(tmp_path / "schema.json"), discovery=mock_discovery)
+
+    cache.get_schema("sqlite:///test.db")
+    version = cache.get_version("sqlite:///test.db")
+    cache.get_schema("sqlite:///test.db")
+    assert mock_discovery.analyze_database.call_count == 1
+    assert cache.get_version("sqlite:///test.db") == version
+
+    # employees changed, departments was dropped and offices was added
+    mock_discovery.fingerprint.return_value = {"employees": "c", "offices": "d"}
+    offices = {"name": "offices", "columns": [], "foreign_keys": []}
+    mock_discovery.analyze_database.return_value = {"tables": [employees_v2, offices]}
+    schema = cache.get_schema("sqlite:///test.db")
+
+    mock_discovery.analyze_database.assert_called_with("sqlite:///test.db", tables=["employees", "offices"])
+    assert schema["tables"] == [employees_v2, offices]
+    assert cache.get_version("sqlite:///test.db") != version
+
+def test_version_ignores_data_snapshots():
+    with_snapshot = {"tables": [{**SAMPLE_SCHEMA["tables"][0], "sample_rows": [{"id": 1}], "column_stats": {"id": {"sampled": 1}}}]}
+    assert SchemaCache.compute_version(with_snapshot) == SchemaCache.compute_version(SAMPLE_SCHEMA)
+
+def test_snapshots_are_only_taken_for_changed_tables(mocker, tmp_path):
+    """With snapshots on, an unchanged schema costs only the fingerprint query after the TTL."""
+    import sqlite3
+    from core.services.schema_discovery import SchemaDiscovery
+    database = tmp_path / "company.db"
+    conn = sqlite3.connect(database)
+    conn.executescript("""
+        CREATE TABLE departments (dept_id INTEGER PRIMARY KEY, dept_name TEXT);
+        CREATE TABLE employees (emp_id INTEGER PRIMARY KEY, full_name TEXT);
+        INSERT INTO departments VALUES (1, 'Engineering');
+    """)
+    conn.commit()
+    discovery = SchemaDiscovery(sample_rows_limit=5, snapshots=True)
+    snapshot = mocker.spy(discovery, "_snapshot")
+    cache = SchemaCache(ttl_seconds=0, cache_path=str(tmp_path / "schema.json"), discovery=discovery)
+    connection_string = f"sqlite:///{database}"
+
+    cache.get_schema(connection_string)
+    assert snapshot.call_count == 2
+    cache.get_schema(connection_string)
+    assert snapshot.call_count == 2
+
+    conn.execute("ALTER TABLE employees ADD COLUMN email TEXT")
+    conn.commit()
+    conn.close()
+    schema = cache.get_schema(connection_string)
+
+    assert snapshot.call_count == 3
+    assert [call.args[1]["name"] for call in snapshot.call_args_list[2:]] == ["employees"]
+    assert schema["tables"][0]["sample_rows"] == [{"dept_id": 1, "dept_name": "Engineering"}]
+
+def test_slow_discovery_does_not_block_other_connections(mocker, tmp_path):
+    import threading
+    release = threading.Event()
+    started = threading.Event()
+
+    def analyze_database(connection_string, tables=None):
+        if connection_string == "sqlite:///slow.db":
+            started.set()
+            assert release.wait(5)
+        return SAMPLE_SCHEMA
+
+    mock_discovery = mocker.Mock()
+    mock_discovery.fingerprint.return_value = None
+    mock_discovery.analyze_database.side_effect = analyze_database
+    cache = SchemaCache(ttl_seconds=300, cache_path=str(tmp_path / "schema.json"), discovery=mock_discovery)
+
+    slow = threading.Thread(target=cache.get_schema, args=("sqlite:///slow.db",))
+    slow.start()
+    assert started.wait(5)
+    try:
+        # Answered while the slow database is still being inspected
+        assert cache.get_schema("sqlite:///fast.db") == SAMPLE_SCHEMA
+        assert cache.get_version("sqlite:///slow.db") is None
+    finally:
+        release.set()
+        slow.join(5)
+    assert cache.get_version("sqlite:///slow.db") == SchemaCache.compute_version(SAMPLE_SCHEMA)
@@ -9,21 +9,21 @@ def test_analyze_database_with_mocked_schema(mocker):
     
     """
     # 1. ARRANGE: Create mock objects to simulate the database inspector's behavior.
+    # Columns and keys are read in bulk, keyed by (schema, table name)
     mock_inspector = mocker.Mock()
-    mock_inspector.get_table_names.return_value = ['employees']
-    mock_inspector.get_columns.return_value = [
+    mock_inspector.get_multi_columns.return_value = {(None, 'employees'): [
         {'name': 'emp_id', 'type': 'INTEGER'},
         {'name': 'full_name', 'type': 'VARCHAR'},
-    ]
-    mock_inspector.get_pk_constraint.return_value = {'constrained_columns': ['emp_id']}
-    mock_inspector.get_foreign_keys.return_value = []
+    ]}
+    mock_inspector.get_multi_pk_constraint.return_value = {(None, 'employees'): {'constrained_columns': ['emp_id']}}
+    mock_inspector.get_multi_foreign_keys.return_value = {(None, 'employees'): []}
 
-    # Patch the SQLAlchemy functions to return our mock inspector
-    mocker.patch('core.services.schema_discovery.create_engine')
+    # Patch the shared engine lookup and the inspector to return our mock inspector
+    mocker.patch('core.services.schema_discovery.get_engine')
     mocker.patch('core.services.schema_discovery.inspect', return_value=mock_inspector)
 
     # 2. ACT: Call the function we want to test.
-    discovery_service = SchemaDiscovery()
+    discovery_service = SchemaDiscovery(snapshots=False)
     result = discovery_service.analyze_database("mock_connection_string")
 
     # 3. ASSERT: Check if the output matches our expectations.
@@ -44,3 +44,58 @@ def test_handles_empty_connection_string():
     result = discovery_service.analyze_database("")
     assert "error" in result
     assert result["error"] == "Connection string cannot be empty."
+
+@pytest.fixture
+def sqlite_database(tmp_path):
+    import sqlite3
+    path = tmp_path / "company.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE departments (dept_id INTEGER PRIMARY KEY, dept_name VARCHAR(255));
+        CREATE TABLE employees (
+            emp_id INTEGER PRIMARY KEY, full_name VARCHAR(255), annual_salary NUMERIC(10, 2), office_location VARCHAR(255),
+            dept_id INTEGER REFERENCES departments(dept_id)
+        );
+        INSERT INTO departments VALUES (1, 'Engineering'), (2, 'Sales');
+    """)
+    conn.executemany("INSERT INTO employees VALUES (?, ?, ?, ?, ?)",
+                     [(i, f"Employee {i}", 50000 + i * 1000, "Chicago" if i % 3 else "New York", 1 + i % 2) for i in range(1, 31)])
+    conn.commit()
+    conn.close()
+    return path
+
+def test_fingerprint_changes_only_for_altered_tables(sqlite_database):
+    import sqlite3
+    discovery = SchemaDiscovery()
+    connection_string = f"sqlite:///{sqlite_database}"
+    before = discovery.fingerprint(connection_string)
+
+    conn = sqlite3.connect(sqlite_database)
+    conn.execute("ALTER TABLE employees ADD COLUMN email VARCHAR(255)")
+    conn.execute("INSERT INTO departments VALUES (3, 'Marketing')")
+    conn.commit()
+    conn.close()
+    after = discovery.fingerprint(connection_string)
+
+    assert set(before) == set(after) == {"departments", "employees"}
+    assert before["departments"] == after["departments"]
+    assert before["employees"] != after["employees"]
+
+def test_snapshots_are_bounded_by_the_sample_limit(sqlite_database):
+    discovery = SchemaDiscovery(sample_rows_limit=10, snapshots=True)
+    schema = discovery.analyze_database(f"sqlite:///{sqlite_database}", tables=["employees", "missing"])
+
+    assert [table["name"] for table in schema["tables"]] == ["employees"]
+    employees = schema["tables"][0]
+    assert employees["foreign_keys"][0]["referred_table"] == "departments"
+    assert len(employees["sample_rows"]) == 10
+    stats = employees["column_stats"]
+    assert stats["annual_salary"]["min"] == 51000 and stats["annual_salary"]["max"] == 60000
+    assert stats["office_location"]["top_values"] == ["Chicago", "New York"]
+    assert stats["office_location"]["sampled"] == 10 and stats["office_location"]["nulls"] == 0
+
+def test_snapshots_are_opt_in(sqlite_database):
+    schema = SchemaDiscovery(snapshots=False).analyze_database(f"sqlite:///{sqlite_database}")
+
+    assert [table["name"] for table in schema["tables"]] == ["departments", "employees"]
+    assert not any("sample_rows" in table or "column_stats" in table for table in schema["tables"])
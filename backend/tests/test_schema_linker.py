@@ -0,0 +1,71 @@
+import numpy as np
+from core.services.schema_linker import SchemaLinker, schema_to_ddl
+
+def make_table(name, columns, foreign_keys=()):
+    return {
+        "name": name,
+        "columns": [{"name": column, "type": "INTEGER", "is_primary_key": column == "id"} for column in columns],
+        "foreign_keys": [
+            {"constrained_columns": [column], "referred_table": table, "referred_columns": ["id"]}
+            for column, table in foreign_keys
+        ],
+    }
+
+SCHEMA = {"tables": [
+    make_table("departments", ["id", "dept_name"]),
+    make_table("employees", ["id", "full_name", "annual_salary", "dept_id"], [("dept_id", "departments")]),
+    make_table("invoices", ["id", "amount"]),
+    make_table("warehouses", ["id", "city"]),
+    make_table("shipments", ["id", "warehouse_id"], [("warehouse_id", "warehouses")]),
+]}
+
+def test_schema_to_ddl_is_compact_and_keeps_keys():
+    ddl = schema_to_ddl({"tables": SCHEMA["tables"][:2]})
+
+    assert ddl.splitlines() == [
+        "departments(id INTEGER PK, dept_name INTEGER)",
+        "employees(id INTEGER PK, full_name INTEGER, annual_salary INTEGER, dept_id INTEGER -> departments.id)",
+    ]
+
+def test_link_keeps_matching_tables_and_their_foreign_key_neighbours():
+    linker = SchemaLinker(max_tables=2, fk_hops=1, min_score=0.3, prune_above_tables=2)
+
+    linked = linker.link("What is the average salary of employees?", SCHEMA)
+
+    assert [table["name"] for table in linked["tables"]] == ["departments", "employees"]
+
+def test_link_uses_embeddings_and_falls_back_to_the_full_schema():
+    linker = SchemaLinker(max_tables=1, fk_hops=0, min_score=0.5, prune_above_tables=2)
+    # A fake encoder that maps anything mentioning "city" or "warehouse" onto the same axis
+    encode = lambda texts: np.array([[1.0, 0.0] if "city" in text or "warehouse" in text else [0.0, 1.0] for text in texts])
+
+    linked = linker.link("Which city ships the most?", SCHEMA, schema_version="v1", encode=encode)
+    assert [table["name"] for table in linked["tables"]] == ["warehouses"]
+
+    # Nothing scores above the threshold without embeddings, so nothing is pruned
+    assert linker.link("Which site ships the most?", SCHEMA) is SCHEMA
+
+def test_schema_to_ddl_lists_sampled_values():
+    employees = make_table("employees", ["id", "office", "annual_salary", "dept_id"], [("dept_id", "departments")])
+    employees["column_stats"] = {
+        "id": {"min": 1, "max": 30},
+        "office": {"top_values": ["New York", "O'Hare", "Chicago", "London"]},
+        "annual_salary": {"min": 51000, "max": 60000},
+        "dept_id": {"min": 1, "max": 2},
+    }
+
+    lines = schema_to_ddl({"tables": [employees]}, examples=3).splitlines()
+    assert lines[1] == "  -- office: 'New York', 'O''Hare', 'Chicago'; annual_salary: 51000 to 60000"
+    assert len(schema_to_ddl({"tables": [employees]}, examples=0).splitlines()) == 1
+
+def test_foreign_key_neighbours_do_not_exceed_max_tables():
+    hub = make_table("orders", ["id", "customer_id", "product_id", "store_id"],
+                     [("customer_id", "customers"), ("product_id", "products"), ("store_id", "stores")])
+    schema = {"tables": [make_table("customers", ["id"]), make_table("products", ["id", "price"]), make_table("stores", ["id"]), hub]}
+    linker = SchemaLinker(max_tables=2, fk_hops=2, min_score=0.6, prune_above_tables=2)
+
+    linked = linker.link("Total price of all orders", schema)
+
+    # Only "orders" clears min_score; of its three neighbours, the one whose column the question mentions is kept
+    assert [table["name"] for table in linked["tables"]] == ["products", "orders"]
+    assert len(SchemaLinker(max_tables=3, fk_hops=1, min_score=0.3, prune_above_tables=2).link("List the orders", schema)["tables"]) == 3
@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from core.services.result_pager import SQLResultPager
+from core.services.sql_guard import SQLGuard, SQLGuardError
+
+@pytest.fixture
+def connection_string(tmp_path):
+    url = f"sqlite:///{tmp_path / 'guarded.db'}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO items (id, name) VALUES (:id, :name)"), [{"id": i, "name": f"item {i}"} for i in range(1, 301)])
+    engine.dispose()
+    return url
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM items",
+    "SELECT 1; DROP TABLE items",
+    "PRAGMA table_info(items)",
+    "WITH gone AS (DELETE FROM items RETURNING id) SELECT * FROM gone",
+])
+def test_validate_rejects_anything_but_one_select(sql):
+    with pytest.raises(SQLGuardError):
+        SQLGuard().validate(sql)
+
+def test_validate_ignores_keywords_in_literals():
+    assert SQLGuard().validate("SELECT 'drop; delete' AS note, replace(name, 'a', 'b') FROM items;") == \
+        "SELECT 'drop; delete' AS note, replace(name, 'a', 'b') FROM items"
+
+def test_row_limit_caps_the_outermost_query():
+    guard = SQLGuard(max_result_rows=100)
+    assert guard.apply_row_limit("SELECT id FROM items LIMIT 10") == ("SELECT id FROM items LIMIT 10", None)
+    assert guard.apply_row_limit("SELECT id FROM items ORDER BY id") == ("SELECT id FROM items ORDER BY id LIMIT 100", 100)
+    assert guard.apply_row_limit("SELECT id FROM items LIMIT 5000 OFFSET 20") == ("SELECT id FROM items LIMIT 100 OFFSET 20", 100)
+    # A LIMIT inside a subquery or a literal does not cap the outer query
+    assert guard.apply_row_limit("SELECT id FROM (SELECT id FROM items LIMIT 5) AS t WHERE id > 0") == \
+        ("SELECT id FROM (SELECT id FROM items LIMIT 5) AS t WHERE id > 0 LIMIT 100", 100)
+    assert guard.apply_row_limit("SELECT 'LIMIT 1' AS note FROM items") == ("SELECT 'LIMIT 1' AS note FROM items LIMIT 100", 100)
+    assert guard.apply_row_limit("SELECT id FROM items -- every item") == ("SELECT id FROM items -- every item\nLIMIT 100", 100)
+    # Only queries ending in another row clause are wrapped
+    assert guard.apply_row_limit("SELECT id FROM items FETCH FIRST 5000 ROWS ONLY") == \
+        ("SELECT * FROM (SELECT id FROM items FETCH FIRST 5000 ROWS ONLY) AS guarded_query LIMIT 100", 100)
+
+def test_capped_join_keeps_duplicate_column_names_and_order(connection_string):
+    sql, row_limit = SQLGuard(max_result_rows=100).apply_row_limit(
+        "SELECT a.id, b.id FROM items a JOIN items b ON b.id = a.id ORDER BY a.id DESC"
+    )
+    engine = create_engine(connection_string)
+    with engine.connect() as conn:
+        result = conn.execute(text(sql))
+        # SQLite renames duplicate columns of a subquery ("id:1"); a capped query keeps them as written
+        assert list(result.keys()) == ["id", "id"]
+        rows = result.fetchall()
+    engine.dispose()
+
+    assert row_limit == 100 and len(rows) == 100
+    assert [row[0] for row in rows[:3]] == [300, 299, 298]
+
+def test_page_carries_execution_report(connection_string):
+    pager = SQLResultPager(page_size=10, guard=SQLGuard(max_result_rows=100))
+    page = pager.fetch_page("SELECT id FROM items ORDER BY id", connection_string)
+
+    assert page["execution"]["row_limit"] == 100
+    assert page["execution"]["plan_cost"] >= 300
+    assert page["execution"]["execution_seconds"] is not None
+
+def test_row_cap_bounds_streamed_rows(connection_string):
+    pager = SQLResultPager(fetch_batch_rows=64, guard=SQLGuard(max_result_rows=100))
+    execution = {}
+    rows = [row for batch in pager.iter_batches("SELECT id FROM items", connection_string, execution) for row in batch]
+
+    assert len(rows) == 100
+    assert execution["row_limit"] == 100
+
+def test_cartesian_join_over_budget_is_refused(connection_string):
+    pager = SQLResultPager(guard=SQLGuard(max_plan_cost=10_000))
+    with pytest.raises(SQLGuardError, match="estimated cost"):
+        pager.fetch_page("SELECT a.id FROM items a, items b, items c", connection_string)
+    # An indexed lookup stays well within the same budget
+    assert pager.fetch_page("SELECT name FROM items WHERE id = 7", connection_string)["rows"] == [{"name": "item 7"}]
+
+def test_statement_timeout_cancels_slow_query(connection_string):
+    pager = SQLResultPager(guard=SQLGuard(statement_timeout_seconds=0.2, explain=False, max_result_rows=0))
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) AS c FROM n"
+    with pytest.raises(SQLGuardError, match="cancelled"):
+        pager.fetch_page(slow, connection_string)
+
+def test_read_only_transaction_is_reset_afterwards(connection_string):
+    guard = SQLGuard()
+    engine = create_engine(connection_string, pool_size=1, max_overflow=0)
+    with engine.connect() as conn:
+        with guard.session(conn, "SELECT id FROM items") as statement:
+            assert conn.exec_driver_sql("PRAGMA query_only").scalar() == 1
+            with pytest.raises(Exception):
+                conn.exec_driver_sql("DELETE FROM items")
+            conn.execute(text(statement.sql)).fetchall()
+        assert conn.exec_driver_sql("PRAGMA query_only").scalar() == 0
+    engine.dispose()
+
+def test_async_page_runs_under_guard(connection_string):
+    pager = SQLResultPager(page_size=5, guard=SQLGuard(max_plan_cost=10_000))
+
+    async def run():
+        page = await pager.afetch_page("SELECT id FROM items ORDER BY id", connection_string)
+        with pytest.raises(SQLGuardError):
+            await pager.afetch_page("SELECT a.id FROM items a CROSS JOIN items b", connection_string)
+        return page
+
+    page = asyncio.run(run())
+    assert [row["id"] for row in page["rows"]] == [1, 2, 3, 4, 5]
+    assert page["execution"]["plan_cost"] is not None
@@ -0,0 +1,51 @@
+import sqlite3
+from core.services.sql_templates import SQLTemplateEngine
+
+def column(name, type_="INTEGER", primary_key=False):
+    return {"name": name, "type": type_, "is_primary_key": primary_key}
+
+SCHEMA = {"tables": [
+    {"name": "departments", "columns": [column("dept_id", primary_key=True), column("dept_name", "VARCHAR(100)")], "foreign_keys": []},
+    {
+        "name": "employees",
+        "columns": [
+            column("emp_id", primary_key=True), column("full_name", "VARCHAR(100)"), column("dept_id"),
+            column("position", "VARCHAR(100)"), column("annual_salary", "NUMERIC(10, 2)"),
+        ],
+        "foreign_keys": [{"constrained_columns": ["dept_id"], "referred_table": "departments", "referred_columns": ["dept_id"]}],
+    },
+]}
+
+def make_database():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE departments (dept_id INTEGER PRIMARY KEY, dept_name VARCHAR(100));
+        CREATE TABLE employees (emp_id INTEGER PRIMARY KEY, full_name VARCHAR(100), dept_id INTEGER,
+                                position VARCHAR(100), annual_salary NUMERIC(10, 2));
+        INSERT INTO departments VALUES (1, 'Engineering'), (2, 'Sales');
+        INSERT INTO employees VALUES (1, 'Ann', 1, 'Engineer', 100), (2, 'Bob', 1, 'Engineer', 200), (3, 'Cy', 2, 'Rep', 60);
+    """)
+    return conn
+
+def test_counts_and_aggregates_run_without_the_llm():
+    templates = SQLTemplateEngine(enabled=True)
+    conn = make_database()
+
+    count = templates.match("How many employees are there?", SCHEMA)
+    by_department = templates.match("What is the average salary by department?", SCHEMA)
+    by_position = templates.match("highest salary per position", SCHEMA)
+
+    assert count["template"] == "count"
+    assert conn.execute(count["sql"]).fetchall() == [(3,)]
+    assert by_department["template"] == "aggregate_by_group"
+    assert "JOIN departments" in by_department["sql"]
+    assert conn.execute(by_department["sql"]).fetchall() == [("Engineering", 150), ("Sales", 60)]
+    assert conn.execute(by_position["sql"]).fetchall() == [("Engineer", 200), ("Rep", 60)]
+
+def test_questions_with_unresolved_words_are_left_to_the_llm():
+    templates = SQLTemplateEngine(enabled=True)
+
+    assert templates.match("How many employees know Python?", SCHEMA) is None
+    assert templates.match("average bonus by department", SCHEMA) is None
+    assert templates.match("List employees hired after 2020", SCHEMA) is None
+    assert SQLTemplateEngine(enabled=False).match("How many employees are there?", SCHEMA) is None
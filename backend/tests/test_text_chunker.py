@@ -0,0 +1,38 @@
+from core.services.text_chunker import TextChunker
+
+def test_chunks_respect_size_and_overlap():
+    """Chunks should never exceed the token budget and consecutive chunks should overlap."""
+    text = " ".join(f"word{i}" for i in range(100))
+    chunker = TextChunker(chunk_size=30, chunk_overlap=10, respect_boundaries=False)
+
+    chunks = chunker.chunk(text)
+
+    assert all(len(chunk["content"].split()) <= 30 for chunk in chunks)
+    assert chunks[0]["content"].split()[-10:] == chunks[1]["content"].split()[:10]
+    assert chunks[-1]["content"].endswith("word99")
+    # Offsets point back into the original text
+    for chunk in chunks:
+        assert text[chunk["start_offset"]:chunk["end_offset"]] == chunk["content"]
+
+def test_chunks_snap_to_paragraph_boundaries():
+    """A chunk should end at a paragraph break rather than mid-paragraph when one is close."""
+    first = " ".join(["alpha"] * 20)
+    second = " ".join(["beta"] * 20)
+    chunker = TextChunker(chunk_size=30, chunk_overlap=0, respect_boundaries=True)
+
+    chunks = chunker.chunk(f"{first}\n\n{second}")
+
+    assert chunks[0]["content"] == first
+    assert chunks[1]["content"] == second
+
+def test_chunks_record_page_numbers():
+    pages = ["page one text " * 5, "page two text " * 5]
+    text = "\n\n".join(pages)
+    page_offsets = [0, len(pages[0]) + 2]
+    chunker = TextChunker(chunk_size=10, chunk_overlap=0, respect_boundaries=False)
+
+    chunks = chunker.chunk(text, page_offsets)
+
+    assert chunks[0]["page"] == 1
+    assert chunks[-1]["page"] == 2
+    assert TextChunker().chunk("   ") == []
@@ -0,0 +1,32 @@
+import pytest
+import faiss
+import numpy as np
+from core.services.vector_index import build_index, build_trained_index, index_type_of, normalize, set_search_params
+
+DIM = 16
+SETTINGS = {"type": "flat", "nlist": 4, "pq_m": 4, "pq_nbits": 4, "nprobe": 2, "hnsw_m": 8, "ef_construction": 40, "ef_search": 16}
+
+@pytest.mark.parametrize("index_type", ["flat", "ivfpq", "hnsw"])
+def test_index_types_score_by_cosine_similarity(index_type):
+    """Every index type should find a stored vector as its own nearest neighbour."""
+    vectors = np.random.RandomState(0).rand(700, DIM).astype(np.float32)
+
+    index = build_trained_index(DIM, vectors, index_type=index_type, settings=SETTINGS)
+    set_search_params(index, nprobe=4, ef_search=32)
+    scores, indices = index.search(normalize(vectors[:5]), 1)
+
+    assert index_type_of(index) == index_type
+    assert index.ntotal == 700
+    if index_type != "ivfpq":  # Product quantization is lossy
+        assert list(indices[:, 0]) == [0, 1, 2, 3, 4]
+        assert np.allclose(scores[:, 0], 1.0, atol=1e-4)
+
+def test_too_few_vectors_fall_back_to_flat():
+    vectors = np.random.rand(10, DIM).astype(np.float32)
+    index = build_trained_index(DIM, vectors, index_type="ivfpq", settings=SETTINGS)
+    assert index_type_of(index) == "flat"
+
+def test_unknown_index_type_and_legacy_detection():
+    with pytest.raises(ValueError):
+        build_index(DIM, "annoy", SETTINGS)
+    assert index_type_of(faiss.IndexFlatL2(DIM)) == "legacy"
@@ -0,0 +1,173 @@
+import sqlite3
+import faiss
+import numpy as np
+from core.services.vector_index import index_type_of, normalize
+from core.services.vector_store import VectorStore
+
+DIM = 8
+
+def make_store(tmp_path, checkpoint_every=100):
+    return VectorStore(
+        index_path=str(tmp_path / "vector.index"),
+        metadata_path=str(tmp_path / "text_db.sqlite"),
+        checkpoint_every=checkpoint_every
+    )
+
+def add_document(store, index, filename, count, prefix="chunk"):
+    chunks = [{"content": f"{filename} {prefix} {i}", "chunk_hash": f"{filename}-{prefix}-{i}", "chunk_index": i,
+               "start_offset": 0, "end_offset": 1, "page": None}
+              for i in range(count)]
+    embeddings = normalize(np.random.rand(count, DIM))
+    change = store.replace_document(filename, f"{filename}-{prefix}", chunks, embeddings, "test-model")
+    index.remove_ids(np.array(change["removed_ids"], dtype=np.int64))
+    index.add_with_ids(change["added_vectors"], change["added_ids"])
+    return embeddings, change
+
+def test_restart_replays_vectors_added_after_the_last_checkpoint(tmp_path):
+    """Chunks committed to SQLite but missing from the checkpoint must be recovered on load."""
+    # 1. ARRANGE: One checkpointed document, then a second one that never gets checkpointed (a "crash").
+    store = make_store(tmp_path)
+    index = store.load_index(DIM)
+    add_document(store, index, "a.txt", 3)
+    store.checkpoint(index)
+    second, change = add_document(store, index, "b.txt", 2)
+
+    # 2. ACT: Reopen the store as a restarted process would.
+    restarted = make_store(tmp_path)
+    recovered = restarted.load_index(DIM)
+
+    # 3. ASSERT
+    assert recovered.ntotal == 5
+    assert len(restarted) == 5
+    _, ids = recovered.search(second[:1], 1)
+    assert ids[0][0] == change["added_ids"][0]
+    assert restarted[ids[0][0]]["filename"] == "b.txt"
+
+def test_restart_removes_vectors_deleted_after_the_last_checkpoint(tmp_path):
+    store = make_store(tmp_path)
+    index = store.load_index(DIM)
+    add_document(store, index, "a.txt", 3)
+    add_document(store, index, "b.txt", 2)
+    store.checkpoint(index)
+    store.delete_document("a.txt")
+
+    recovered = make_store(tmp_path).load_index(DIM)
+
+    assert recovered.ntotal == 2
+
+def test_replacing_a_document_keeps_unchanged_chunks(tmp_path):
+    store = make_store(tmp_path)
+    index = store.load_index(DIM)
+    _, first = add_document(store, index, "a.txt", 3)
+
+    # The new version shares chunks 0 and 1 and replaces chunk 2
+    chunks = [{"content": "a.txt chunk 0", "chunk_hash": "a.txt-chunk-0", "chunk_index": 0},
+              {"content": "new chunk", "chunk_hash": "a.txt-new", "chunk_index": 1},
+              {"content": "a.txt chunk 1", "chunk_hash": "a.txt-chunk-1", "chunk_index": 2}]
+    change = store.replace_document("a.txt", "a.txt-v2", chunks, normalize(np.random.rand(3, DIM)), "test-model")
+
+    assert change["kept"] == 2
+    assert change["removed_ids"] == [first["added_ids"][2]]
+    assert len(change["added_ids"]) == 1
+    assert store[first["added_ids"][1]]["chunk_index"] == 2
+    assert store.get_document_hash("a.txt") == "a.txt-v2"
+    assert len(store) == 3
+
+def test_embedding_cache_is_scoped_to_the_model(tmp_path):
+    store = make_store(tmp_path)
+    index = store.load_index(DIM)
+    embeddings, _ = add_document(store, index, "a.txt", 2)
+
+    cached = store.get_cached_embeddings(["a.txt-chunk-0", "a.txt-chunk-1", "unknown"], "test-model")
+
+    assert set(cached) == {"a.txt-chunk-0", "a.txt-chunk-1"}
+    np.testing.assert_allclose(cached["a.txt-chunk-1"], embeddings[1])
+    assert store.get_cached_embeddings(["a.txt-chunk-0"], "other-model") == {}
+
+def test_checkpoint_is_written_after_enough_appends(tmp_path):
+    store = make_store(tmp_path, checkpoint_every=4)
+    index = store.load_index(DIM)
+
+    add_document(store, index, "a.txt", 2)
+    store.maybe_checkpoint(index)
+    assert not (tmp_path / "vector.index").exists()
+
+    add_document(store, index, "b.txt", 2)
+    store.maybe_checkpoint(index)
+    assert (tmp_path / "vector.index").exists()
+    assert make_store(tmp_path).load_index(DIM).ntotal == 4
+
+def test_dimension_mismatch_rebuilds_from_stored_embeddings(tmp_path):
+    store = make_store(tmp_path)
+    index = store.load_index(DIM)
+    add_document(store, index, "a.txt", 2)
+    store.checkpoint(index)
+
+    # Overwrite the checkpoint with an index of the wrong dimension
+    faiss.write_index(faiss.IndexFlatL2(DIM * 2), str(tmp_path / "vector.index"))
+
+    assert make_store(tmp_path).load_index(DIM).ntotal == 2
+
+def test_legacy_l2_checkpoint_is_migrated_without_losing_vectors(tmp_path):
+    """Rows from the original IndexFlatL2 store have no stored embedding; they are recovered from the index."""
+    legacy = faiss.IndexFlatL2(DIM)
+    legacy.add(np.random.rand(1, DIM).astype(np.float32))
+    faiss.write_index(legacy, str(tmp_path / "vector.index"))
+    conn = sqlite3.connect(str(tmp_path / "text_db.sqlite"))
+    with conn:
+        conn.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY AUTOINCREMENT, doc_name TEXT NOT NULL, chunk_text TEXT NOT NULL)")
+        conn.execute("INSERT INTO chunks (doc_name, chunk_text) VALUES ('resume.pdf', 'legacy chunk')")
+    conn.close()
+
+    index = make_store(tmp_path).load_index(DIM, index_type="flat")
+
+    assert index.ntotal == 1
+    assert index_type_of(index) == "flat"
+    assert make_store(tmp_path)[1]["filename"] == "resume.pdf"
+
+def test_other_workers_reload_changes_through_the_generation(tmp_path):
+    """A second store on the same files stands in for another worker process."""
+    store = make_store(tmp_path)
+    index = store.load_index(DIM)
+    worker = make_store(tmp_path)
+    worker_index = worker.load_index(DIM)
+    generation = worker.get_generation()
+
+    embeddings, change = add_document(store, index, "a.txt", 3)
+
+    assert change["generation"] == generation + 1
+    assert worker.get_generation() == change["generation"]
+    # The checkpoint on disk predates the change; reloading replays it from the chunk store
+    refreshed = worker.refresh_index(DIM)
+    assert worker_index.ntotal == 0 and refreshed.ntotal == 3
+    _, ids = refreshed.search(embeddings[:1], 1)
+    assert ids[0][0] == change["added_ids"][0]
+
+def test_documents_are_counted_per_file(tmp_path):
+    store = make_store(tmp_path)
+    index = store.load_index(DIM)
+    add_document(store, index, "a.txt", 3)
+    add_document(store, index, "b.txt", 2)
+
+    assert len(store) == 5
+    assert store.count_documents() == 2
+
+def test_reloaded_ivfpq_checkpoint_accepts_adds_and_removals(tmp_path):
+    """Memory-mapped IVF inverted lists are read-only, so the checkpoint must be loaded into memory."""
+    settings = {"type": "ivfpq", "nlist": 4, "pq_m": 4, "pq_nbits": 4, "nprobe": 2, "hnsw_m": 8, "ef_construction": 40, "ef_search": 16}
+    store = make_store(tmp_path)
+    index = store.load_index(DIM, settings=settings)
+    add_document(store, index, "bulk.txt", 700)
+    store.rebuild_index(DIM, "ivfpq", settings)
+    # Committed after the checkpoint, so the restart has to add it to the reloaded index
+    add_document(store, index, "late.txt", 3)
+
+    restarted = make_store(tmp_path)
+    recovered = restarted.load_index(DIM, settings=settings)
+    assert index_type_of(recovered) == "ivfpq"
+    assert recovered.ntotal == 703
+
+    _, change = add_document(restarted, recovered, "new.txt", 2)
+    assert recovered.ntotal == 705
+    recovered.remove_ids(np.array(change["added_ids"], dtype=np.int64))
+    assert recovered.ntotal == 703
@@ -46,7 +46,18 @@ export const DocumentUploader = () => {
             throw new Error(data.detail || "File processing failed.");
         }
 
-        const result = data.results[0]; // We are uploading one file, so we get one result
+        // The backend processes uploads in the background; poll the job until it finishes
+        let job = data;
+        while (job.status === "queued" || job.status === "running") {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const jobResponse = await fetch(`http://localhost:8000/api/upload-documents/${data.job_id}`);
+            job = await jobResponse.json();
+            if (!jobResponse.ok) {
+                throw new Error(job.detail || "Could not fetch upload progress.");
+            }
+        }
+
+        const result = job.results[0]; // We are uploading one file, so we get one result
         if (result.error) {
             throw new Error(result.error);
         }